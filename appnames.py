@@ -0,0 +1,105 @@
+"""
+Canonical application and service names for raw process names and window titles.
+
+Reports and the dashboard group time by application. A process name maps to one
+display name ("chrome.exe" -> "Chrome", "Code.exe" -> "Code"). For browsers the
+window title also counts: the site is taken from a domain in the title if there
+is one, otherwise from the last part of the page title, giving names like
+"Chrome - github.com" or "Firefox - YouTube".
+
+Results are memoized in bounded caches, and ActivityLogger.get_app_names keeps
+them in the app_names table so each distinct raw name is normalized once per
+database. Bump NORMALIZATION_VERSION whenever the rules below change, so the
+stored names are recomputed.
+"""
+import re
+from functools import lru_cache
+from typing import Optional, Tuple
+
+NORMALIZATION_VERSION = 1
+
+# Checked in order against the lowercased process name without its extension; a name
+# matches as a whole word, so 'knowledge.exe' is not Edge
+KNOWN_APPS = tuple((re.compile(r'(?<![a-z])' + re.escape(needle) + r'(?![a-z])'), app) for needle, app in (
+    ('chrome', 'Chrome'),
+    ('firefox', 'Firefox'),
+    ('msedge', 'Edge'),
+    ('edge', 'Edge'),
+    ('brave', 'Brave'),
+    ('opera', 'Opera'),
+    ('safari', 'Safari'),
+    ('spotify', 'Spotify'),
+    ('discord', 'Discord'),
+    ('vscode', 'VS Code'),
+    ('visual studio code', 'VS Code'),
+    ('explorer', 'File Explorer'),
+    ('powershell', 'PowerShell'),
+    ('cmd', 'Command Prompt'),
+))
+BROWSERS = frozenset(('Chrome', 'Firefox', 'Edge', 'Brave', 'Opera', 'Safari'))
+
+_EXTENSION = re.compile(r'\.(exe|app|dmg)$')
+_VENDOR_PREFIX = re.compile(r'^(microsoft|google|mozilla)\s+')
+_EDITION_SUFFIX = re.compile(r'\s+(premium|pro|web|app|dashboard)$')
+_PARENTHESES = re.compile(r'\s*\([^)]*\)')
+
+# "<page> - Google Chrome", "<page> — Mozilla Firefox", "<page> - Microsoft​ Edge"
+_BROWSER_SUFFIX = re.compile(
+    r'\s+[-–—]\s+(google chrome|mozilla firefox|microsoft\W*edge|chrome|firefox|edge|brave|opera|safari)\s*$',
+    re.IGNORECASE)
+_DOMAIN = re.compile(
+    r'(?<![\w.@-])(?:www\.)?((?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+'
+    r'(?:com|org|net|io|dev|app|edu|gov|co|ai|tv|me|uk|de|fr|ca|au|jp|in|us|info|xyz|gg|so|ly|to|fm))'
+    r'(?![\w-])')
+_SEGMENT_SEPARATOR = re.compile(r'\s+[-|–—·]\s+')
+_NOTIFICATION_COUNT = re.compile(r'^\(\d+\+?\)\s*')
+
+# Longest page title used as the service name when the title has a single part
+MAX_SERVICE_LENGTH = 30
+
+@lru_cache(maxsize=4096)
+def normalize_process(process_name: Optional[str]) -> str:
+    """Display name for a process, e.g. 'msedge.exe' -> 'Edge', 'notepad++.exe' -> 'Notepad++'"""
+    if not process_name:
+        return 'Unknown'
+    name = _EXTENSION.sub('', process_name.strip().lower())
+    for pattern, app in KNOWN_APPS:
+        if pattern.search(name):
+            return app
+    name = _EDITION_SUFFIX.sub('', _VENDOR_PREFIX.sub('', name))
+    name = _PARENTHESES.sub('', name).strip()
+    return ' '.join(word.capitalize() for word in name.split()) or process_name
+
+def is_browser(process_name: Optional[str]) -> bool:
+    """Whether the window title matters for this process's app name"""
+    return normalize_process(process_name) in BROWSERS
+
+@lru_cache(maxsize=65536)
+def browser_service(window_title: Optional[str]) -> Optional[str]:
+    """Site shown in a browser window title: a domain if the title has one, else its last part"""
+    if not window_title:
+        return None
+    title = _BROWSER_SUFFIX.sub('', window_title.strip())
+    domain = _DOMAIN.search(title.lower())
+    if domain:
+        return domain.group(1)
+    segments = [_NOTIFICATION_COUNT.sub('', segment).strip() for segment in _SEGMENT_SEPARATOR.split(title)]
+    segments = [segment for segment in segments if segment]
+    if not segments:
+        return None
+    if len(segments) > 1 or len(segments[0]) <= MAX_SERVICE_LENGTH:
+        return segments[-1]
+    return None
+
+def app_name(process_name: Optional[str], window_title: Optional[str] = None) -> str:
+    """Canonical app or service name for a raw process name and window title"""
+    app = normalize_process(process_name)
+    if app in BROWSERS:
+        service = browser_service(window_title)
+        if service:
+            return f"{app} - {service}"
+    return app
+
+def memo_key(process_name: Optional[str], window_title: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Raw names that determine the app name; the title only matters for browsers"""
+    return (process_name, window_title if is_browser(process_name) else None)
@@ -0,0 +1,100 @@
+import threading
+import time
+from typing import Optional
+from backup_store import BackupStore
+from utils import setup_logging
+
+logger = setup_logging()
+
+class BackupScheduler:
+    """
+    Snapshots the activity database into the backup store on a background thread,
+    at most once per interval.
+    A backup is skipped when the data watermark hasn't moved since the last one.
+    The time and watermark of the last backup live in the meta table, so restarts
+    don't trigger extra backups.
+    """
+    def __init__(self, activity_logger, interval: float = 6 * 3600, keep_days: int = 30,
+                 keep_last: int = 5, pages: int = 256, step_pause: float = 0.005, first_delay: float = 60.0):
+        """
+        interval: seconds between backup attempts
+        keep_days, keep_last: snapshots younger than keep_days or among the keep_last newest are kept
+        first_delay: seconds before the first attempt when no backup was ever made
+        pages, step_pause: online backup step size and the pause between steps
+        """
+        self.logger = activity_logger
+        self.interval = interval
+        self.keep_days = keep_days
+        self.keep_last = keep_last
+        self.store = BackupStore.for_database(activity_logger.db_path)
+        self.pages = pages
+        self.step_pause = step_pause
+        self.first_delay = first_delay
+        self.backups_written = 0
+        self.backups_skipped = 0
+        self._next_check = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="database-backup", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the scheduler; a backup in progress finishes first"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def seconds_until_due(self) -> float:
+        if self._next_check is None:
+            last_backup = self.logger.get_meta('last_backup_at')
+            if last_backup is None:
+                self._next_check = time.time() + self.first_delay
+            else:
+                self._next_check = float(last_backup) + self.interval
+        return max(0.0, self._next_check - time.time())
+
+    def run_once(self, force: bool = False) -> bool:
+        """
+        Back up now unless nothing changed since the last backup
+        Returns True if a backup was written
+        """
+        self._next_check = time.time() + self.interval
+        watermark = self.logger.get_data_watermark()
+        if not force and watermark == self.logger.get_meta('backup_watermark'):
+            self.backups_skipped += 1
+            logger.debug("Skipping backup, no new data since the last one")
+            return False
+        # Sealed months are stored as they are and skipped once already in the store
+        self.logger.seal_old_partitions()
+        if self.store.create_snapshot(self.logger.db_path, watermark=watermark, pages=self.pages,
+                                      step_pause=self.step_pause,
+                                      partition_files=self.logger.partition_files()) is None:
+            return False
+        self.store.prune(keep_last=self.keep_last, keep_days=self.keep_days)
+        self.logger.set_meta('backup_watermark', watermark)
+        self.logger.set_meta('last_backup_at', time.time())
+        self.backups_written += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "written": self.backups_written,
+            "skipped": self.backups_skipped,
+            "last_backup_at": self.logger.get_meta('last_backup_at'),
+        }
+
+    def _run(self):
+        while not self._stop_event.wait(self.seconds_until_due()):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Scheduled backup failed: {e}")
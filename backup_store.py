@@ -0,0 +1,326 @@
+"""
+Content-addressed store for database backups.
+
+A snapshot copies the live database with the online backup API, splits the copy
+into fixed-size chunks and stores each chunk zlib-compressed under the SHA-256 of
+its contents. SQLite rewrites pages in place, so consecutive snapshots share almost
+all of their chunks and a new snapshot only adds the chunks that changed. A snapshot
+itself is a small JSON manifest listing the chunks of each file: the catalog database
+first, then one entry per monthly partition (see partitions.py). Sealed partitions
+never change, so they are read directly and skipped entirely when the previous
+snapshot already holds them.
+
+Layout under the store directory:
+    chunks/ab/abcdef...   compressed chunk, named by the hash of the raw data
+    snapshots/<id>.json   manifest
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from utils import setup_logging, copy_database_online
+import partitions
+
+logger = setup_logging()
+
+# A multiple of every SQLite page size up to 64 KiB, so chunks stay page-aligned
+CHUNK_SIZE = 64 * 1024
+COMPRESSION_LEVEL = 6
+# Chunks touched this recently are never garbage-collected; a snapshot being written
+# concurrently may reference them before its manifest exists
+CHUNK_GRACE_SECONDS = 3600
+
+class BackupStore:
+    def __init__(self, store_dir: str, chunk_size: int = CHUNK_SIZE):
+        self.store_dir = store_dir
+        self.chunk_size = chunk_size
+        self.chunks_dir = os.path.join(store_dir, 'chunks')
+        self.snapshots_dir = os.path.join(store_dir, 'snapshots')
+    
+    @classmethod
+    def for_database(cls, db_path: str) -> 'BackupStore':
+        """The store next to a database, in backups/store"""
+        return cls(os.path.join(os.path.dirname(os.path.abspath(db_path)), 'backups', 'store'))
+    
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+    
+    def _manifest_path(self, snapshot_id: str) -> str:
+        return os.path.join(self.snapshots_dir, snapshot_id + '.json')
+    
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    
+    def _store_file(self, path: str, stats: dict) -> dict:
+        """Chunk, compress and store one file; returns its manifest entry"""
+        file_hash = hashlib.sha256()
+        chunks = []
+        size = 0
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(self.chunk_size)
+                if not data:
+                    break
+                file_hash.update(data)
+                size += len(data)
+                digest = hashlib.sha256(data).hexdigest()
+                chunks.append(digest)
+                chunk_path = self._chunk_path(digest)
+                if os.path.exists(chunk_path):
+                    # Refresh the mtime so a concurrent prune leaves it alone
+                    os.utime(chunk_path)
+                    continue
+                compressed = zlib.compress(data, COMPRESSION_LEVEL)
+                os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+                self._write_atomic(chunk_path, compressed)
+                stats['new_chunks'] += 1
+                stats['new_bytes'] += len(compressed)
+        return {'size': size, 'sha256': file_hash.hexdigest(), 'chunks': chunks}
+    
+    def _reuse_entry(self, entry: Optional[dict], path: str) -> Optional[dict]:
+        """A previous manifest entry for a sealed file, if the file is unchanged and its chunks exist"""
+        if entry is None:
+            return None
+        stat_result = os.stat(path)
+        if entry.get('size') != stat_result.st_size or entry.get('mtime') != stat_result.st_mtime:
+            return None
+        for digest in entry['chunks']:
+            chunk_path = self._chunk_path(digest)
+            if not os.path.exists(chunk_path):
+                return None
+            # Refresh the mtime so a concurrent prune leaves it alone
+            os.utime(chunk_path)
+        return entry
+    
+    def create_snapshot(self, db_path: str, watermark: Optional[str] = None, pages: int = 256,
+                        step_pause: float = 0.0, partition_files: Optional[Dict[str, str]] = None) -> Optional[dict]:
+        """
+        Snapshot a live database and its partitions ({month key: path}) into the store
+        Returns the manifest, or None if the backup failed
+        """
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        created_at = datetime.now()
+        snapshot_id = created_at.strftime('%Y%m%d_%H%M%S_%f')
+        stats = {'new_chunks': 0, 'new_bytes': 0}
+        previous = self.get_snapshot()
+        previous_entries = {
+            entry['partition']: entry for entry in (previous['files'].values() if previous else [])
+            if 'partition' in entry
+        }
+        tmp_dir = tempfile.mkdtemp(prefix='snapshot_', dir=self.store_dir)
+        try:
+            copy_path = os.path.join(tmp_dir, os.path.basename(db_path))
+            copy_database_online(db_path, copy_path, pages=pages, step_pause=step_pause)
+            files = {os.path.basename(db_path): self._store_file(copy_path, stats)}
+            os.remove(copy_path)
+            
+            for key, path in (partition_files or {}).items():
+                name = os.path.relpath(path, os.path.dirname(os.path.abspath(db_path)))
+                if partitions.is_sealed(path):
+                    entry = self._reuse_entry(previous_entries.get(key), path)
+                    if entry is None:
+                        entry = dict(self._store_file(path, stats), mtime=os.stat(path).st_mtime)
+                else:
+                    # Only the months still being written need an online copy
+                    copy_path = os.path.join(tmp_dir, os.path.basename(path))
+                    copy_database_online(path, copy_path, pages=pages, step_pause=step_pause)
+                    entry = self._store_file(copy_path, stats)
+                    os.remove(copy_path)
+                files[name] = dict(entry, partition=key)
+            
+            manifest = {
+                'id': snapshot_id,
+                'created_at': created_at.isoformat(),
+                'watermark': watermark,
+                'chunk_size': self.chunk_size,
+                'files': files,
+            }
+            # The manifest goes last: a snapshot exists only once all its chunks do
+            self._write_atomic(self._manifest_path(snapshot_id), json.dumps(manifest, indent=2).encode('utf-8'))
+        except Exception as e:
+            logger.error(f"Error creating backup snapshot: {e}")
+            return None
+        finally:
+            for name in os.listdir(tmp_dir):
+                os.remove(os.path.join(tmp_dir, name))
+            os.rmdir(tmp_dir)
+        
+        total = sum(entry['size'] for entry in manifest['files'].values())
+        logger.info(f"Created backup snapshot {snapshot_id}: {total} bytes, "
+                    f"{stats['new_chunks']} new chunks ({stats['new_bytes']} bytes stored)")
+        return manifest
+    
+    def list_snapshots(self) -> List[dict]:
+        """All manifests, oldest first"""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        manifests = []
+        for filename in sorted(os.listdir(self.snapshots_dir)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.snapshots_dir, filename), encoding='utf-8') as f:
+                    manifests.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable backup manifest {filename}: {e}")
+        return manifests
+    
+    def get_snapshot(self, snapshot_id: Optional[str] = None) -> Optional[dict]:
+        """A manifest by id, or the newest one when snapshot_id is None"""
+        snapshots = self.list_snapshots()
+        if snapshot_id is None:
+            return snapshots[-1] if snapshots else None
+        return next((manifest for manifest in snapshots if manifest['id'] == snapshot_id), None)
+    
+    def _read_chunk(self, digest: str) -> bytes:
+        with open(self._chunk_path(digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"chunk {digest} is corrupt")
+        return data
+    
+    def _restore_file(self, entry: dict, tmp_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(tmp_path)), exist_ok=True)
+        file_hash = hashlib.sha256()
+        with open(tmp_path, 'wb') as f:
+            for digest in entry['chunks']:
+                data = self._read_chunk(digest)
+                file_hash.update(data)
+                f.write(data)
+        if file_hash.hexdigest() != entry['sha256']:
+            raise ValueError("restored file doesn't match the snapshot checksum")
+    
+    def restore(self, target_path: str, snapshot_id: Optional[str] = None) -> bool:
+        """
+        Rebuild the database of a snapshot (the newest by default) at target_path
+        Partitions are restored next to it under the target's name; partitions at the
+        target that the snapshot doesn't have are removed
+        Returns True if successful, False otherwise
+        """
+        manifest = self.get_snapshot(snapshot_id)
+        if manifest is None:
+            logger.error(f"Backup snapshot not found: {snapshot_id or 'latest'}")
+            return False
+        targets = []
+        for entry in manifest['files'].values():
+            key = entry.get('partition')
+            path = target_path if key is None else partitions.partition_path(target_path, key)
+            targets.append((entry, path))
+        # The catalog is the first file
+        targets[0] = (targets[0][0], target_path)
+        try:
+            # Write every file before replacing any, so a bad chunk leaves the target untouched
+            for entry, path in targets:
+                self._restore_file(entry, path + '.tmp')
+            restored_keys = {entry['partition'] for entry, _ in targets if 'partition' in entry}
+            for key in partitions.list_partitions(target_path):
+                if key not in restored_keys:
+                    partitions.remove_partition(partitions.partition_path(target_path, key))
+            for _, path in targets:
+                if partitions.is_sealed(path):
+                    partitions.unseal_partition(path)
+                # Left-over WAL files of the old database would be replayed over the restored one
+                for suffix in ('-wal', '-shm', '-journal'):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+                os.replace(path + '.tmp', path)
+            logger.info(f"Restored backup snapshot {manifest['id']} to {target_path}")
+            return True
+        except (OSError, ValueError, zlib.error) as e:
+            logger.error(f"Error restoring backup snapshot {manifest['id']}: {e}")
+            for _, path in targets:
+                if os.path.exists(path + '.tmp'):
+                    os.remove(path + '.tmp')
+            return False
+    
+    def verify(self, snapshot_id: Optional[str] = None) -> Dict[str, List[str]]:
+        """
+        Check that every chunk of every snapshot (or just one) is present and intact
+        Chunks are named by their hash, so intact chunks imply an intact file
+        Returns {snapshot id: [problems]} with an empty list for a healthy snapshot
+        """
+        manifests = self.list_snapshots()
+        if snapshot_id is not None:
+            manifests = [manifest for manifest in manifests if manifest['id'] == snapshot_id]
+        # Snapshots share most chunks; check each one once
+        chunk_errors = {}
+        results = {}
+        for manifest in manifests:
+            problems = []
+            for name, entry in manifest['files'].items():
+                for digest in entry['chunks']:
+                    if digest not in chunk_errors:
+                        try:
+                            self._read_chunk(digest)
+                            chunk_errors[digest] = None
+                        except (OSError, ValueError, zlib.error) as e:
+                            chunk_errors[digest] = str(e)
+                    if chunk_errors[digest] is not None:
+                        problems.append(f"{name}: {chunk_errors[digest]}")
+            results[manifest['id']] = problems
+        return results
+    
+    def prune(self, keep_last: Optional[int] = None, keep_days: Optional[int] = None) -> int:
+        """
+        Delete snapshots outside the retention policy, then chunks no snapshot references
+        A snapshot is kept if it is among the keep_last newest or younger than keep_days
+        Returns the number of snapshots deleted
+        """
+        snapshots = self.list_snapshots()
+        cutoff = datetime.now() - timedelta(days=keep_days) if keep_days is not None else None
+        deleted = 0
+        for index, manifest in enumerate(snapshots):
+            is_recent = keep_last is not None and index >= len(snapshots) - keep_last
+            is_young = cutoff is not None and datetime.fromisoformat(manifest['created_at']) >= cutoff
+            if is_recent or is_young or (keep_last is None and keep_days is None):
+                continue
+            os.remove(self._manifest_path(manifest['id']))
+            deleted += 1
+        
+        freed = self._collect_garbage()
+        if deleted:
+            logger.info(f"Pruned {deleted} backup snapshots, freed {freed} bytes of chunks")
+        return deleted
+    
+    def _collect_garbage(self) -> int:
+        """Remove unreferenced chunks older than the grace period; returns bytes freed"""
+        if not os.path.isdir(self.chunks_dir):
+            return 0
+        referenced = set()
+        for manifest in self.list_snapshots():
+            for entry in manifest['files'].values():
+                referenced.update(entry['chunks'])
+        freed = 0
+        now = time.time()
+        for prefix in os.listdir(self.chunks_dir):
+            prefix_dir = os.path.join(self.chunks_dir, prefix)
+            for digest in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, digest)
+                if digest in referenced or now - os.path.getmtime(path) < CHUNK_GRACE_SECONDS:
+                    continue
+                freed += os.path.getsize(path)
+                os.remove(path)
+        return freed
+    
+    def stats(self) -> dict:
+        """Snapshot count, logical size of all snapshots and bytes actually stored"""
+        snapshots = self.list_snapshots()
+        stored = 0
+        if os.path.isdir(self.chunks_dir):
+            for prefix in os.listdir(self.chunks_dir):
+                prefix_dir = os.path.join(self.chunks_dir, prefix)
+                stored += sum(os.path.getsize(os.path.join(prefix_dir, name)) for name in os.listdir(prefix_dir))
+        return {
+            'snapshots': len(snapshots),
+            'logical_bytes': sum(entry['size'] for manifest in snapshots for entry in manifest['files'].values()),
+            'stored_bytes': stored,
+        }
@@ -0,0 +1,97 @@
+"""
+Aggregate report totals over a synthetic history with ReportEngine, time it against
+merging per-day and per-week shards, and check that all of them give the same totals
+and that the per-period totals of batch reports cover exactly the requested days.
+
+    python benchmarks/bench_report_engine.py --days 365
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger import ActivityLogger
+from migrations import to_epoch_ms
+from report_engine import ReportEngine, ReportTotals, aggregate_range, split_range
+
+APPS = [
+    ("main.py - Visual Studio Code", "Code.exe"),
+    ("YouTube - Google Chrome", "chrome.exe"),
+    ("GitHub - Google Chrome", "chrome.exe"),
+    ("Discord", "Discord.exe"),
+    ("Downloads", "explorer.exe"),
+]
+
+def populate(activity_logger, days, per_day, seed):
+    rng = random.Random(seed)
+    first_day = datetime.combine(datetime.now().date() - timedelta(days=days), datetime.min.time())
+    for day in range(days + 1):
+        day_start = first_day + timedelta(days=day)
+        entries = []
+        for _ in range(per_day):
+            window, process = rng.choice(APPS)
+            entries.append({'timestamp': day_start + timedelta(seconds=rng.uniform(0, 86399)),
+                            'window': window, 'process': process, 'time_spent_seconds': rng.uniform(1, 600)})
+        activity_logger.log_activities_batch(entries)
+    return first_day
+
+def same_totals(expected, actual):
+    for mine, theirs in ((expected.categories, actual.categories), (expected.windows, actual.windows),
+                         (expected.hours, actual.hours)):
+        if mine.keys() != theirs.keys() or any(abs(mine[key] - theirs[key]) > 1e-6 for key in mine):
+            return False
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="ReportEngine aggregation benchmark")
+    parser.add_argument("--days", type=int, default=365, help="Days of synthetic history")
+    parser.add_argument("--per-day", type=int, default=200, help="Activities per day")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        activity_logger = ActivityLogger(db_path=os.path.join(tmp, "activity.db"))
+        first_day = populate(activity_logger, args.days, args.per_day, args.seed)
+
+        # Start and end mid-week and mid-day, with history on both sides of the range
+        start_date = first_day + timedelta(days=10, hours=13)
+        end_date = datetime.combine((first_day + timedelta(days=args.days - 10)).date(), datetime.max.time())
+        while end_date.weekday() in (0, 6):
+            end_date -= timedelta(days=1)
+        engine = ReportEngine(activity_logger.db_path)
+        started = time.perf_counter()
+        expected = engine.aggregate(start_date, end_date)
+        elapsed = time.perf_counter() - started
+        print(f"range:          {start_date.date()} to {end_date.date()} ({end_date:%A})")
+        print(f"{'one query:':<19} {elapsed * 1000:8.1f}ms")
+
+        failed = False
+        for per in ('day', 'week'):
+            started = time.perf_counter()
+            totals = ReportTotals()
+            for shard_start, shard_end in split_range(start_date, end_date, per):
+                totals.merge(aggregate_range(activity_logger.db_path, to_epoch_ms(shard_start), to_epoch_ms(shard_end)))
+            elapsed = time.perf_counter() - started
+            ok = same_totals(expected, totals)
+            failed |= not ok
+            print(f"{per + ' shards:':<19} {elapsed * 1000:8.1f}ms  {'OK' if ok else 'totals differ from one query'}")
+
+        for per in ('day', 'week'):
+            periods = engine.aggregate_periods(start_date, end_date, per)
+            period_seconds = sum(sum(totals.categories.values()) for _, _, totals in periods)
+            ok = (abs(period_seconds - sum(expected.categories.values())) < 1e-6
+                  and periods[-1][1] == datetime.combine(end_date.date() + timedelta(days=1), datetime.min.time()))
+            failed |= not ok
+            print(f"{per + ' periods:':<19} {len(periods):8d}    {'OK' if ok else 'periods reach outside the range'}")
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
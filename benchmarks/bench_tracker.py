@@ -0,0 +1,78 @@
+"""
+Replay a synthetic focus trace through TimeTracker and report throughput and write latency.
+
+    python benchmarks/bench_tracker.py --events 1000000
+    python benchmarks/bench_tracker.py --trace recorded.jsonl
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger import ActivityLogger
+from tracker import TimeTracker
+from window_source import ReplayWindowSource, synthetic_events
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description="TimeTracker replay benchmark")
+    parser.add_argument("--events", type=int, default=100000, help="Number of synthetic focus changes")
+    parser.add_argument("--trace", help="Replay a recorded JSON-lines trace instead of synthetic events")
+    parser.add_argument("--mean-dwell", type=float, default=5.0, help="Mean seconds per synthetic focus change")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--capture-mode", choices=["events", "poll"], default="events",
+                        help="Replay focus changes as notifications or poll adaptively")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        activity_logger = ActivityLogger(db_path=os.path.join(tmp, "activity.db"))
+
+        # Time every write the tracker issues
+        write_latencies = []
+        log_batch = activity_logger.log_activities_batch
+        def timed_log_batch(entries):
+            started = time.perf_counter()
+            result = log_batch(entries)
+            write_latencies.append(time.perf_counter() - started)
+            return result
+        activity_logger.log_activities_batch = timed_log_batch
+
+        if args.trace:
+            source = ReplayWindowSource.from_file(args.trace, start_time=0.0)
+        else:
+            source = ReplayWindowSource(
+                synthetic_events(args.events, mean_dwell=args.mean_dwell, seed=args.seed), start_time=0.0)
+        tracker = TimeTracker(window_source=source, activity_logger=activity_logger,
+                              capture_mode=args.capture_mode)
+        tracker.backup_interval = None
+        tracker.recategorize_interval = None
+
+        started = time.perf_counter()
+        samples = tracker.run()
+        elapsed = time.perf_counter() - started
+        rows = activity_logger.count_activities()
+
+    print(f"samples:        {samples}")
+    print(f"rows written:   {rows}")
+    print(f"elapsed:        {elapsed:.2f}s")
+    print(f"samples/s:      {samples / elapsed:,.0f}")
+    print(f"wakeups/hour:   {samples / max(source.clock() / 3600, 1e-9):,.0f} (virtual)")
+    print(f"rows/s:         {rows / elapsed:,.0f}")
+    print(f"virtual time:   {source.clock() / 3600:.1f}h")
+    print(f"write batches:  {len(write_latencies)}")
+    print(f"write p50:      {percentile(write_latencies, 50) * 1000:.2f}ms")
+    print(f"write p99:      {percentile(write_latencies, 99) * 1000:.2f}ms")
+    print(f"write max:      {max(write_latencies, default=0) * 1000:.2f}ms")
+    print(f"cache stats:    {tracker.cache_stats()}")
+
+if __name__ == "__main__":
+    main()
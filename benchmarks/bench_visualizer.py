@@ -0,0 +1,80 @@
+"""
+Build the visualizer's report DataFrames from synthetic report totals and compare the old
+row-by-row construction (one datetime.fromtimestamp per hour) with the columnar one in
+DataVisualizer._prepare_totals_data, then resample and downsample the hours as the
+time series chart does.
+
+    python benchmarks/bench_visualizer.py --hours 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_engine import ReportTotals
+from visualizer import DEFAULT_MAX_POINTS, DataVisualizer
+
+CATEGORIES = [
+    ("Development", True),
+    ("Entertainment", False),
+    ("Communication", None),
+    ("Neutral", None),
+]
+
+def synthetic_totals(hours, seed):
+    """Merged totals of `hours` consecutive hour buckets, as ReportEngine.aggregate returns them"""
+    rng = random.Random(seed)
+    totals = ReportTotals()
+    first_ms = int(datetime(2020, 1, 1).timestamp()) * 1000
+    for hour in range(hours):
+        totals.hours[first_ms + hour * 3600000] = rng.uniform(0, 3600)
+    for label in CATEGORIES:
+        totals.categories[label] = rng.uniform(0, 3600 * hours / len(CATEGORIES))
+    return totals
+
+def prepare_row_by_row(totals):
+    """The previous implementation: one tuple and one fromtimestamp per hour"""
+    categories = pd.DataFrame([(category, is_productive, time_spent)
+                               for (category, is_productive), time_spent in totals.categories.items()],
+                              columns=['category', 'is_productive', 'time_spent'])
+    hours = pd.DataFrame([(datetime.fromtimestamp(bucket_ms / 1000), time_spent)
+                          for bucket_ms, time_spent in sorted(totals.hours.items())],
+                         columns=['timestamp', 'time_spent'])
+    return categories, hours
+
+def measure(name, prepare, totals):
+    started = time.perf_counter()
+    categories, hours = prepare(totals)
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    DataVisualizer._create_time_series(hours, "Activity Over Time", DEFAULT_MAX_POINTS)
+    charted = time.perf_counter() - started
+    memory = (categories.memory_usage(deep=True).sum() + hours.memory_usage(deep=True).sum()) / 1024 / 1024
+    print(f"{name:<13} build {built:6.2f}s  time series {charted:5.2f}s  memory {memory:7.1f} MB")
+    return hours.set_index('timestamp').resample('h')['time_spent'].sum()
+
+def main():
+    parser = argparse.ArgumentParser(description="Visualizer DataFrame construction benchmark")
+    parser.add_argument("--hours", type=int, default=1000000, help="Number of hourly totals")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    totals = synthetic_totals(args.hours, args.seed)
+    print(f"hours:        {len(totals.hours)}")
+    # Load plotly before timing anything
+    DataVisualizer._create_time_series(prepare_row_by_row(synthetic_totals(48, args.seed))[1], "warm-up")
+    before = measure("row by row", prepare_row_by_row, totals)
+    after = measure("columnar", DataVisualizer._prepare_totals_data, totals)
+    if not before.round(6).equals(after.round(6)):
+        print("hourly totals differ")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
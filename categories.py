@@ -1,4 +1,5 @@
-# Categories for time tracking
+# Default categories for time tracking
+# rules.py copies these into the user-editable rules file, which takes precedence
 PRODUCTIVE_CATEGORIES = {
     "Learning": [
         "udemy.com",
@@ -67,20 +68,9 @@ UNPRODUCTIVE_CATEGORIES = {
 
 def categorize_activity(window_title, process_name):
     """
-    Categorize an activity based on window title and process name
+    Categorize an activity based on window title and process name, using the current rules
     Returns: (category, subcategory, is_productive)
     """
-    # Check productive categories
-    for category, items in PRODUCTIVE_CATEGORIES.items():
-        for item in items:
-            if item.lower() in window_title.lower() or item.lower() in process_name.lower():
-                return (category, item, True)
-    
-    # Check unproductive categories
-    for category, items in UNPRODUCTIVE_CATEGORIES.items():
-        for item in items:
-            if item.lower() in window_title.lower() or item.lower() in process_name.lower():
-                return (category, item, False)
-    
-    # If no match found, return as neutral
-    return ("Neutral", process_name, None) 
\ No newline at end of file
+    # Imported here because rules.py reads the defaults above
+    from rules import categorize
+    return categorize(window_title, process_name)
@@ -0,0 +1,130 @@
+"""
+Headless tracker for running as a background service.
+
+No Rich rendering and no reporting/plotting imports: the daemon loads only the tracker,
+the logger and the window source. Instead of a terminal UI it rewrites a small JSON
+status file every heartbeat that other tools can poll.
+
+Resource budget (checked on every heartbeat and reported in the status file):
+- CPU: at most 0.5% of one core averaged since start. With event capture the
+  tracker only wakes on focus changes and once per heartbeat.
+- RSS: at most 60 MB.
+"""
+import json
+import os
+import signal
+import time
+from datetime import datetime
+from typing import Optional
+from tracker import TimeTracker
+from utils import setup_logging
+
+logger = setup_logging()
+
+CPU_BUDGET_PERCENT = 0.5
+RSS_BUDGET_MB = 60
+# Startup (imports, journal replay, backup) dominates the average before this
+BUDGET_WARMUP_SECONDS = 300
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return None
+
+class TrackerDaemon:
+    def __init__(self, status_path: str, heartbeat_interval: float = 30.0,
+                 tracker: Optional[TimeTracker] = None):
+        self.status_path = status_path
+        self.heartbeat_interval = heartbeat_interval
+        self.tracker = tracker or TimeTracker(idle_timeout=heartbeat_interval)
+        self.started_at = time.time()
+        self._started_cpu = self._cpu_seconds()
+        self._next_heartbeat = 0.0
+        self._over_budget = False
+        self.samples = 0
+
+    @staticmethod
+    def _cpu_seconds() -> float:
+        times = os.times()
+        return times.user + times.system
+
+    def status(self) -> dict:
+        """Snapshot of what the daemon is doing and what it costs"""
+        tracker = self.tracker
+        writer = tracker.writer
+        now = time.time()
+        uptime = max(now - self.started_at, 1e-9)
+        cpu_seconds = self._cpu_seconds() - self._started_cpu
+        cpu_percent = 100.0 * cpu_seconds / uptime
+        rss = _rss_bytes()
+        within_budget = None
+        if uptime >= BUDGET_WARMUP_SECONDS:
+            within_budget = cpu_percent <= CPU_BUDGET_PERCENT and (rss is None or rss <= RSS_BUDGET_MB * 1024 * 1024)
+        return {
+            "pid": os.getpid(),
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "updated_at": datetime.fromtimestamp(now).isoformat(),
+            "heartbeat_interval": self.heartbeat_interval,
+            "capture_mode": tracker.capture_mode,
+            "current": {
+                "window": tracker.previous_window,
+                "process": tracker.previous_process,
+                "since": datetime.fromtimestamp(tracker.start_time).isoformat() if tracker.start_time else None,
+            },
+            "samples": self.samples,
+            "activities_written": writer.committed if writer else 0,
+            "queue_depth": writer.queue.qsize() if writer else 0,
+            "failed_flushes": writer.failed_flushes if writer else 0,
+            "caches": tracker.cache_stats(),
+            "backups": tracker.backups.stats() if tracker.backups else None,
+            "recategorization": tracker.recategorizer.stats() if tracker.recategorizer else None,
+            "cpu_seconds": round(cpu_seconds, 3),
+            "cpu_percent": round(cpu_percent, 4),
+            "rss_bytes": rss,
+            "within_budget": within_budget,
+        }
+
+    def write_status(self, stopped: bool = False):
+        """Atomically replace the status file so readers never see a partial write"""
+        status = self.status()
+        status["running"] = not stopped
+        tmp_path = self.status_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(status, f, indent=2)
+            os.replace(tmp_path, self.status_path)
+        except OSError as e:
+            logger.error(f"Error writing status file: {e}")
+        over_budget = status["within_budget"] is False
+        if over_budget and not self._over_budget:
+            logger.warning(f"Tracker over budget: {status['cpu_percent']}% CPU, RSS {status['rss_bytes']} bytes")
+        self._over_budget = over_budget
+
+    def _on_sample(self):
+        self.samples += 1
+        now = time.monotonic()
+        if now >= self._next_heartbeat:
+            self._next_heartbeat = now + self.heartbeat_interval
+            self.write_status()
+
+    def run(self):
+        """Track until SIGTERM/SIGINT, then flush everything and mark the status file stopped"""
+        def handle_signal(signum, frame):
+            raise SystemExit(0)
+        signal.signal(signal.SIGTERM, handle_signal)
+
+        logger.info(f"Tracker daemon started (pid {os.getpid()}), status file: {self.status_path}")
+        try:
+            self.tracker.run(on_sample=self._on_sample)
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            self.write_status(stopped=True)
+            logger.info("Tracker daemon stopped")
+
+def run_daemon(status_path: Optional[str] = None, heartbeat_interval: float = 30.0):
+    if status_path is None:
+        status_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tracker_status.json")
+    TrackerDaemon(status_path, heartbeat_interval).run()
@@ -14,7 +14,6 @@ import darkdetect
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from logger import ActivityLogger
-from tracker import TimeTracker
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -22,9 +21,8 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Time Tracker")
         self.setMinimumSize(1000, 600)
         
-        # Initialize logger and tracker
+        # The window only reads stats; tracking runs from main.py
         self.activity_logger = ActivityLogger()
-        self.tracker = TimeTracker()
         
         # Cache for stats to prevent unnecessary updates
         self._stats_cache = {}
@@ -192,6 +190,7 @@ class MainWindow(QMainWindow):
         value_label = QLabel(value)
         value_label.setProperty("class", "stat-value")
         layout.addWidget(value_label)
+        widget.value_label = value_label
         
         return widget
     
@@ -221,24 +220,40 @@ class MainWindow(QMainWindow):
             # Only update if necessary
             if (not self._last_update or 
                 (datetime.now() - self._last_update).seconds > 30):
-                activities = self.activity_logger.get_activities(start_date, end_date)
-                self._stats_cache = self._process_activities(activities)
+                totals = self.activity_logger.get_rollups(start_date, end_date, 'day')
+                self._stats_cache = self._process_activities(totals)
                 self._last_update = datetime.now()
             
             self._update_display()
-            
+        
         except Exception as e:
             print(f"Error updating stats: {e}")
     
-    def _process_activities(self, activities):
-        # Process activities and return cached stats
-        # TODO: Implement activity processing
-        return {}
+    def _process_activities(self, totals):
+        # Today's daily rollups, already categorized when the activities were stored
+        stats = {'total': 0.0, 'productive': 0.0, 'unproductive': 0.0, 'categories': {}}
+        for _, _, category, is_productive, time_spent in totals:
+            time_spent = time_spent or 0.0
+            stats['total'] += time_spent
+            if is_productive:
+                stats['productive'] += time_spent
+            elif is_productive is False:
+                stats['unproductive'] += time_spent
+            stats['categories'][category] = stats['categories'].get(category, 0.0) + time_spent
+        return stats
+    
+    @staticmethod
+    def _format_duration(seconds):
+        minutes = int(seconds // 60)
+        return f"{minutes // 60}h {minutes % 60}m"
     
     def _update_display(self):
         # Update UI with cached stats
-        # TODO: Implement display update
-        pass
+        if not self._stats_cache:
+            return
+        self._total_time.value_label.setText(self._format_duration(self._stats_cache['total']))
+        self._productive_time.value_label.setText(self._format_duration(self._stats_cache['productive']))
+        self._unproductive_time.value_label.setText(self._format_duration(self._stats_cache['unproductive']))
     
     def closeEvent(self, event):
         event.ignore()
@@ -265,6 +280,6 @@ class MainWindow(QMainWindow):
             # Ensure window stays in front
             self.raise_()
             self.activateWindow()
-            
+        
         except Exception as e:
             print(f"Error applying theme: {e}") 
\ No newline at end of file
@@ -0,0 +1,161 @@
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Iterator, List, Optional
+from utils import setup_logging
+
+logger = setup_logging()
+
+class ActivityJournal:
+    """
+    Append-only JSON-lines journal of activities not yet committed to the database.
+    Every entry gets a sequence number; the database records the highest one it has
+    committed, so replaying the journal after a crash never inserts an entry twice.
+    """
+    def __init__(self, path: str, start_seq: int = 0, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self.seq = max(start_seq, max((entry["seq"] for entry in self.read(path)), default=0))
+        self._file = open(path, "a", encoding="utf-8")
+        if self._ends_with_torn_line(path):
+            # Terminate a partial line so the next entry doesn't get glued onto it
+            self._file.write("\n")
+            self._file.flush()
+
+    @staticmethod
+    def _ends_with_torn_line(path: str) -> bool:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    @staticmethod
+    def read(path: str) -> Iterator[dict]:
+        """Yield journal entries, skipping a torn last line from a hard kill"""
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping unreadable journal line in {path}")
+                    continue
+                entry["timestamp"] = datetime.fromisoformat(entry["timestamp"])
+                yield entry
+
+    def append(self, log_entry: dict) -> int:
+        """Write an entry to disk and return its sequence number"""
+        with self._lock:
+            self.seq += 1
+            record = dict(log_entry, seq=self.seq, timestamp=log_entry["timestamp"].isoformat())
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            return self.seq
+
+    def mark_committed(self, seq: int):
+        """Drop the journal contents once everything up to seq is in the database"""
+        with self._lock:
+            if seq >= self.seq:
+                self._file.truncate(0)
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+# Queue markers for BackgroundWriter
+_STOP = object()
+
+class BackgroundWriter:
+    """
+    Writes activities to the database on its own thread so a slow commit never stalls sampling.
+    Entries are journaled before they are queued and flushed when the batch is full
+    or flush_interval seconds after the first entry of a batch arrived.
+    """
+    def __init__(self, activity_logger, batch_size: int = 10, flush_interval: float = 5.0,
+                 max_queue: int = 10000, journal_path: Optional[str] = None, fsync: bool = False):
+        self.logger = activity_logger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.journal = ActivityJournal(journal_path or activity_logger.journal_path,
+                                       start_seq=activity_logger.get_journal_seq(), fsync=fsync)
+        # Anything left in the journal was replayed when the logger started
+        self.journal.mark_committed(activity_logger.get_journal_seq())
+        # Bounded so a stuck database applies backpressure instead of growing without limit
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.committed = 0
+        self.failed_flushes = 0
+        self._thread = threading.Thread(target=self._run, name="activity-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def submit(self, log_entry: dict):
+        """Journal an activity and hand it to the writer thread"""
+        seq = self.journal.append(log_entry)
+        self.queue.put(dict(log_entry, seq=seq))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything submitted so far has been written"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Flush remaining entries and stop the writer thread"""
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join(timeout)
+        self.journal.close()
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(batch)
+                return
+            if isinstance(item, threading.Event):
+                self._flush(batch)
+                item.set()
+            elif item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+            if not batch:
+                deadline = None
+            elif time.monotonic() >= deadline:
+                # Last flush failed, retry after another interval
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch: List[dict]):
+        """Write a batch; on failure it stays in the batch (and the journal) for a retry"""
+        if not batch:
+            return
+        if self.logger.log_activities_batch(batch):
+            self.committed += len(batch)
+            self.journal.mark_committed(batch[-1]["seq"])
+            batch.clear()
+        else:
+            self.failed_flushes += 1
+            logger.warning(f"Writing {len(batch)} activities failed, keeping them for retry")
@@ -1,79 +1,640 @@
 import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from itertools import islice
 import os
-from typing import List, Tuple, Optional
-from utils import setup_logging, backup_database
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Optional
+from utils import setup_logging, Cache
+from journal import ActivityJournal
+from migrations import migrate, to_epoch_ms, intern_name, intern_label, get_meta, set_meta
+import appnames
+import partitions
+import rollups
+import rules
 
 logger = setup_logging()
 
+# Seconds a connection waits on a locked database before giving up
+BUSY_TIMEOUT = 10.0
+
+# Applied to every new connection. WAL lets the dashboard and reports read while
+# the tracker writes; NORMAL sync is still crash-safe for the application in WAL mode.
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA temp_store = MEMORY',
+)
+
+# Partitions a connection keeps attached at once; SQLite allows at most 10
+MAX_ATTACHED = 8
+
+# Released connections kept open for the next thread, e.g. the next web request
+MAX_IDLE_CONNECTIONS = 4
+
+# SQL text is constant per partition, so the per-connection statement cache reuses prepared statements.
+# {schema} is the name the monthly partition is attached under, {activity} the month's rows
+# as given by ActivityLogger._activity_source.
+INSERT_ACTIVITY_SQL = '''
+    INSERT INTO {schema}.activity (start_ms, end_ms, window_id, process_id, time_spent_seconds)
+    VALUES (?, ?, ?, ?, ?)
+'''
+# Rows for a sealed month, which must not change under readers that attached it as immutable
+INSERT_LATE_ACTIVITY_SQL = '''
+    INSERT INTO main.late_activity (month, start_ms, end_ms, window_id, process_id, time_spent_seconds)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+SELECT_HAS_LATE_SQL = 'SELECT 1 FROM main.late_activity WHERE month = ? LIMIT 1'
+LATE_SOURCE_SQL = '''(
+    SELECT id, start_ms, end_ms, window_id, process_id, time_spent_seconds FROM {schema}.activity
+    UNION ALL
+    SELECT id, start_ms, end_ms, window_id, process_id, time_spent_seconds FROM main.late_activity
+    WHERE month = '{month}'
+)'''
+# Rows keep their historical (id, timestamp, window, process, time_spent_seconds) shape for callers,
+# plus start_ms, the keyset iter_activity_chunks pages on; titles and names come from the lookup tables
+SELECT_ACTIVITY_PAGE_SQL = '''
+    SELECT activity.id, strftime('%Y-%m-%d %H:%M:%S', start_ms / 1000, 'unixepoch', 'localtime'),
+           window_titles.title, process_names.name, time_spent_seconds, activity.start_ms
+    FROM {activity} AS activity
+    LEFT JOIN main.window_titles ON window_titles.id = activity.window_id
+    LEFT JOIN main.process_names ON process_names.id = activity.process_id
+'''
+# Same, plus the category, subcategory and productivity flag stored for the row's window/process pair
+SELECT_CATEGORIZED_PAGE_SQL = '''
+    SELECT activity.id, strftime('%Y-%m-%d %H:%M:%S', start_ms / 1000, 'unixepoch', 'localtime'),
+           window_titles.title, process_names.name, time_spent_seconds, activity.start_ms,
+           category_labels.category, category_labels.subcategory, category_labels.is_productive
+    FROM {activity} AS activity
+    LEFT JOIN main.window_titles ON window_titles.id = activity.window_id
+    LEFT JOIN main.process_names ON process_names.id = activity.process_id
+    LEFT JOIN main.pair_categories ON pair_categories.month = ?
+        AND pair_categories.window_id = ifnull(activity.window_id, 0)
+        AND pair_categories.process_id = ifnull(activity.process_id, 0)
+    LEFT JOIN main.category_labels ON category_labels.id = pair_categories.label_id
+'''
+# Categories are stored per (month, window id, process id); unknown ids are 0
+SELECT_PAIR_CATEGORY_SQL = '''
+    SELECT category_labels.category, category_labels.is_productive
+    FROM pair_categories
+    JOIN category_labels ON category_labels.id = pair_categories.label_id
+    WHERE pair_categories.month = ? AND pair_categories.window_id = ? AND pair_categories.process_id = ?
+'''
+INSERT_PAIR_CATEGORY_SQL = '''
+    INSERT INTO pair_categories (month, window_id, process_id, label_id, rules_version_id)
+    VALUES (?, ?, ?, ?, ?)
+'''
+UPDATE_PAIR_CATEGORY_SQL = '''
+    UPDATE pair_categories SET label_id = ?, rules_version_id = ?
+    WHERE month = ? AND window_id = ? AND process_id = ?
+'''
+SELECT_STALE_PAIRS_SQL = '''
+    SELECT pair_categories.window_id, pair_categories.process_id, window_titles.title, process_names.name,
+           category_labels.category, category_labels.is_productive
+    FROM pair_categories
+    JOIN category_labels ON category_labels.id = pair_categories.label_id
+    LEFT JOIN window_titles ON window_titles.id = pair_categories.window_id
+    LEFT JOIN process_names ON process_names.id = pair_categories.process_id
+    WHERE pair_categories.month = ? AND pair_categories.rules_version_id != ?
+    LIMIT ?
+'''
+SELECT_STALE_MONTHS_SQL = '''
+    SELECT DISTINCT month FROM pair_categories
+    WHERE rules_version_id IS NOT (SELECT id FROM rules_versions WHERE version = ?)
+    ORDER BY month DESC
+'''
+SELECT_PAIR_ACTIVITIES_SQL = '''
+    SELECT start_ms, time_spent_seconds FROM {activity} AS activity
+    WHERE process_id IS ? AND window_id IS ?
+'''
+# Rollup rows as (bucket_start, process, category, is_productive, time_spent_seconds)
+SELECT_ROLLUP_COLUMNS = '''
+    SELECT strftime('%Y-%m-%d %H:%M:%S', bucket_start_ms / 1000, 'unixepoch', 'localtime'),
+           process_names.name, category, is_productive, time_spent_seconds
+    FROM rollups
+    LEFT JOIN process_names ON process_names.id = rollups.process_id
+    WHERE granularity = ?
+'''
+# App names are stored per process id, and per window id for browsers (0 otherwise)
+SELECT_APP_NAME_SQL = '''
+    SELECT app_names.app
+    FROM process_names
+    LEFT JOIN window_titles ON window_titles.title = ?
+    JOIN app_names ON app_names.process_id = process_names.id AND app_names.window_id = ifnull(window_titles.id, 0)
+    WHERE process_names.name = ?
+'''
+INSERT_APP_NAME_SQL = '''
+    INSERT OR IGNORE INTO app_names (process_id, window_id, app)
+    SELECT process_names.id, ifnull(window_titles.id, 0), ?
+    FROM process_names
+    LEFT JOIN window_titles ON window_titles.title = ?
+    WHERE process_names.name = ? AND (? IS NULL OR window_titles.id IS NOT NULL)
+'''
+# The catalog (main) and every partition each record the last journal seq they committed
+SELECT_JOURNAL_SEQ_SQL = "SELECT value FROM {schema}.meta WHERE key = 'journal_seq'"
+UPDATE_JOURNAL_SEQ_SQL = "INSERT OR REPLACE INTO {schema}.meta (key, value) VALUES ('journal_seq', ?)"
+SEED_JOURNAL_SEQ_SQL = '''
+    INSERT OR IGNORE INTO {schema}.meta (key, value)
+    SELECT key, value FROM main.meta WHERE key = 'journal_seq'
+'''
+# Days whose totals changed take the data generation of that change
+BUMP_DATA_GENERATION_SQL = '''
+    INSERT INTO meta (key, value) VALUES ('data_generation', '1')
+    ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+'''
+CURRENT_GENERATION_SQL = "(SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'data_generation')"
+TOUCH_DAY_SQL = f'''
+    INSERT INTO day_generations (day_start_ms, generation) VALUES (?, {CURRENT_GENERATION_SQL})
+    ON CONFLICT (day_start_ms) DO UPDATE SET generation = excluded.generation
+'''
+# Days of the range that lost their totals keep their row, so their removal still moves the watermark
+TOUCH_DAY_RANGE_SQL = (
+    f'''
+    UPDATE day_generations SET generation = {CURRENT_GENERATION_SQL}
+    WHERE day_start_ms >= ? AND day_start_ms < ?
+    ''',
+    f'''
+    INSERT OR IGNORE INTO day_generations (day_start_ms, generation)
+    SELECT DISTINCT bucket_start_ms, {CURRENT_GENERATION_SQL} FROM rollups
+    WHERE granularity = 'day' AND bucket_start_ms >= ? AND bucket_start_ms < ?
+    ''',
+)
+SELECT_RANGE_GENERATION_SQL = '''
+    SELECT MAX(generation) FROM day_generations WHERE day_start_ms >= ? AND day_start_ms <= ?
+'''
+SELECT_DAY_GENERATIONS_SQL = '''
+    SELECT day_start_ms, generation FROM day_generations WHERE day_start_ms >= ? AND day_start_ms <= ?
+'''
+# Stand-ins for an open end of a range in epoch milliseconds
+MIN_MS = -(1 << 63)
+MAX_MS = (1 << 63) - 1
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'activity.db')
+
+class _PooledConnection:
+    """
+    A connection with the partitions attached to it
+    Closed once neither a thread nor the idle pool holds it, so a thread that exits
+    without releasing its connection doesn't leak it
+    """
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        # month key -> attached read-only (sealed), least recently used first
+        self.attached = OrderedDict()
+        self.close = weakref.finalize(self, conn.close)
+
 class ActivityLogger:
     def __init__(self, db_path=None):
         # Get the absolute path to the database file
         if db_path is None:
-            self.db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'activity.db')
+            self.db_path = DEFAULT_DB_PATH
         else:
             self.db_path = db_path
         logger.debug(f"Using database at: {self.db_path}")
         
+        # One connection per thread at a time. Threads that are done with it, like web requests,
+        # release it to a small idle pool instead of closing it, so the next one skips the setup.
+        self._local = threading.local()
+        self._connections = weakref.WeakSet()
+        self._idle = []
+        self._connections_lock = threading.Lock()
+        
+        # Lookup ids of recently written titles and names, shared by all threads
+        self._name_ids = {
+            'window_titles': Cache(max_size=20000),
+            'process_names': Cache(max_size=2000),
+        }
+        # (process, window or None) -> canonical app name, see appnames.memo_key
+        self._app_names = Cache(max_size=20000)
+        
+        # Each database has its own rules.json, so a scratch database never touches the user's rules
+        self.rules = rules.get_database_engine(self.db_path)
+        
         # Only initialize if the database doesn't exist
         if not os.path.exists(self.db_path):
             logger.info("Database not found, initializing new database")
-            self._init_db()
         else:
             logger.info("Using existing database")
+        self._init_db()
+        self.seal_old_partitions()
         
-        # Create backup with 7-day retention
-        self._backup_database()
+        # Activities the tracker journaled but never committed, e.g. after a hard kill
+        self.journal_path = os.path.splitext(self.db_path)[0] + '.journal'
+        self.replay_journal()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, taking an idle one or opening and tuning a new one"""
+        pooled = getattr(self._local, 'pooled', None)
+        if pooled is None:
+            with self._connections_lock:
+                pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                # uri=True so sealed partitions can be attached with file: URIs. Pooled connections
+                # move between threads, but only one thread uses a connection at a time.
+                conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, cached_statements=256,
+                                       uri=True, check_same_thread=False)
+                conn.execute('PRAGMA journal_mode = WAL')
+                for pragma in CONNECTION_PRAGMAS:
+                    conn.execute(pragma)
+                pooled = _PooledConnection(conn)
+                with self._connections_lock:
+                    self._connections.add(pooled)
+            self._local.pooled = pooled
+            self._local.conn = pooled.conn
+            self._local.attached = pooled.attached
+        return self._local.conn
+    
+    def release_connection(self):
+        """
+        Hand this thread's connection to the idle pool, or close it when the pool is full
+        Call when a short-lived thread is done with the logger, e.g. at the end of a web request
+        """
+        pooled = getattr(self._local, 'pooled', None)
+        if pooled is None:
+            return
+        del self._local.pooled, self._local.conn, self._local.attached
+        try:
+            if pooled.conn.in_transaction:
+                pooled.conn.rollback()
+        except sqlite3.Error:
+            pooled.close()
+            return
+        with self._connections_lock:
+            if len(self._idle) < MAX_IDLE_CONNECTIONS:
+                self._idle.append(pooled)
+                return
+        pooled.close()
+    
+    def close(self):
+        """Close every connection this logger opened"""
+        with self._connections_lock:
+            for pooled in list(self._connections):
+                try:
+                    pooled.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+            self._idle.clear()
+        self._local = threading.local()
     
-    def _backup_database(self):
-        """Create a backup of the database with 7-day retention"""
-        if backup_database(self.db_path, keep_days=7):
-            logger.info("Database backup created successfully")
+    def _partition_path(self, key: str) -> str:
+        return partitions.partition_path(self.db_path, key)
+    
+    def _attach(self, conn: sqlite3.Connection, key: str, writable: bool = False) -> Optional[str]:
+        """
+        Attach a monthly partition to this thread's connection and return its schema name
+        Only valid outside a transaction. A missing partition is created when writable,
+        otherwise None is returned. Sealed partitions are attached immutable either way,
+        see _write_schema.
+        """
+        attached = self._local.attached
+        schema = partitions.schema_name(key)
+        if key in attached:
+            attached.move_to_end(key)
+            return schema
+        
+        path = self._partition_path(key)
+        if not os.path.exists(path):
+            if not writable:
+                return None
+            partitions.create_partition(path, key)
+        sealed = partitions.is_sealed(path)
+        
+        while len(attached) >= MAX_ATTACHED:
+            self._detach(conn, next(iter(attached)))
+        conn.execute('ATTACH DATABASE ? AS ' + schema, (partitions.attach_uri(path, sealed),))
+        if not sealed:
+            conn.execute(f'PRAGMA {schema}.journal_mode = WAL')
+            conn.execute(f'PRAGMA {schema}.synchronous = NORMAL')
+        if not sealed:
+            # A partition without its own journal mark is in step with the catalog: it is either
+            # new, or from before per-partition marks, when both were written together
+            conn.execute(partitions.PARTITION_META_DDL.format(table=f'{schema}.meta'))
+            if conn.execute(SELECT_JOURNAL_SEQ_SQL.format(schema=schema)).fetchone() is None:
+                conn.execute(SEED_JOURNAL_SEQ_SQL.format(schema=schema))
+                conn.commit()
+        attached[key] = sealed
+        return schema
+    
+    def _write_schema(self, conn: sqlite3.Connection, key: str) -> str:
+        """
+        Attach the partition of month key for new rows and return the schema they go to
+        Other connections may have a sealed partition attached as immutable, and SQLite gives
+        them wrong results if it changes, so rows for a sealed month go to main.late_activity
+        """
+        schema = self._attach(conn, key, writable=True)
+        return 'main' if self._local.attached[key] else schema
+    
+    @staticmethod
+    def _insert_rows(cursor, key: str, schema: str, rows: List[Tuple]):
+        if schema == 'main':
+            cursor.executemany(INSERT_LATE_ACTIVITY_SQL, [(key,) + row for row in rows])
         else:
-            logger.warning("Failed to create database backup")
+            cursor.executemany(INSERT_ACTIVITY_SQL.format(schema=schema), rows)
+    
+    def _activity_source(self, conn: sqlite3.Connection, key: str, schema: str) -> str:
+        """Table expression for the rows of an attached month, with the late rows of a sealed one"""
+        if self._local.attached.get(key) and conn.execute(SELECT_HAS_LATE_SQL, (key,)).fetchone():
+            return LATE_SOURCE_SQL.format(schema=schema, month=key)
+        return f'{schema}.activity'
+    
+    def _detach(self, conn: sqlite3.Connection, key: str):
+        conn.execute('DETACH DATABASE ' + partitions.schema_name(key))
+        del self._local.attached[key]
+    
+    def _release_finished(self, conn: sqlite3.Connection):
+        """Detach finished months still attached writable, so seal_old_partitions can seal them"""
+        for key in [key for key, sealed in self._local.attached.items() if not sealed and partitions.should_seal(key)]:
+            self._detach(conn, key)
+    
+    def _detach_all(self, conn: sqlite3.Connection):
+        for key in list(self._local.attached):
+            self._detach(conn, key)
+    
+    def partition_files(self) -> Dict[str, str]:
+        """Month key -> path of every partition file, oldest first"""
+        return {key: self._partition_path(key) for key in partitions.list_partitions(self.db_path)}
+    
+    def seal_old_partitions(self) -> int:
+        """
+        Make partitions of months that ended more than partitions.SEAL_AFTER_DAYS ago read-only
+        A partition another connection still holds open is left for a later call
+        Returns the number of partitions sealed
+        """
+        conn = self._connect()
+        try:
+            self._detach_all(conn)
+        except sqlite3.Error as e:
+            logger.error(f"Error detaching partitions: {e}")
+            return 0
+        sealed = 0
+        for key, path in self.partition_files().items():
+            if partitions.should_seal(key) and not partitions.is_sealed(path):
+                if partitions.seal_partition(path):
+                    sealed += 1
+                    logger.info(f"Sealed partition {key}")
+                else:
+                    logger.debug(f"Partition {key} is busy, sealing it later")
+        return sealed
     
     def _init_db(self):
-        """Initialize the database with proper error handling"""
+        """Create the schema for a new database or migrate an existing one to the current version"""
+        conn = self._connect()
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE activity (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT,
-                    window TEXT,
-                    process TEXT,
-                    time_spent_seconds REAL
-                )
-            ''')
-            conn.commit()
-            conn.close()
-            logger.info("Database initialized successfully")
+            if migrate(conn) == 0:
+                logger.info("Database initialized successfully")
+            # Existing rollups were categorized with whatever rules were in effect when written
+            if get_meta(conn, 'rollups_rules_version') is None:
+                set_meta(conn, 'rollups_rules_version', self.rules.version)
+                conn.commit()
+            # Stored app names from an older normalization are recomputed on demand
+            if get_meta(conn, 'app_names_version') != str(appnames.NORMALIZATION_VERSION):
+                conn.execute('DELETE FROM app_names')
+                set_meta(conn, 'app_names_version', appnames.NORMALIZATION_VERSION)
+                conn.commit()
         except sqlite3.Error as e:
             logger.error(f"Database initialization error: {e}")
             raise
     
+    def _name_id(self, conn: sqlite3.Connection, table: str, value: Optional[str], new_ids: dict) -> Optional[int]:
+        """
+        Lookup id for a title or process name, interning it inside the current transaction
+        New ids go to new_ids and only reach the cache once the transaction commits
+        """
+        if value is None:
+            return None
+        key = (table, value)
+        name_id = self._name_ids[table].get(value)
+        if name_id is None:
+            name_id = new_ids.get(key)
+        if name_id is None:
+            name_id = intern_name(conn, table, value)
+            new_ids[key] = name_id
+        return name_id
+    
+    def _cache_name_ids(self, new_ids: dict):
+        for (table, value), name_id in new_ids.items():
+            self._name_ids[table].set(value, name_id)
+    
+    def _pair_category(self, conn: sqlite3.Connection, month: str, window_id: Optional[int],
+                       process_id: Optional[int], window: Optional[str], process: Optional[str],
+                       pairs: dict) -> Tuple[str, Optional[bool]]:
+        """
+        (category, is_productive) stored for a window/process pair in a month
+        A pair seen for the first time is categorized with the current rules and stored, tagged with
+        their version, inside the current transaction. pairs memoizes lookups for that transaction.
+        """
+        key = (month, window_id or 0, process_id or 0)
+        found = pairs.get(key)
+        if found is None:
+            row = conn.execute(SELECT_PAIR_CATEGORY_SQL, key).fetchone()
+            if row is None:
+                compiled = self.rules.current()
+                category, subcategory, is_productive = compiled.categorize(window or '', process or '')
+                conn.execute(INSERT_PAIR_CATEGORY_SQL, key + (
+                    intern_label(conn, category, subcategory, is_productive),
+                    intern_name(conn, 'rules_versions', compiled.version),
+                ))
+                found = (category, is_productive)
+            else:
+                found = (row[0], None if row[1] is None else bool(row[1]))
+            pairs[key] = found
+        return found
+    
+    def _activity_row(self, conn: sqlite3.Connection, log_entry: dict, new_ids: dict, rollup_deltas: dict,
+                      window_deltas: dict, pairs: dict) -> tuple:
+        """Insert parameters for an activity; also stores its category and accumulates its rollup deltas"""
+        timestamp = log_entry['timestamp']
+        start_ms = to_epoch_ms(timestamp)
+        time_spent = log_entry['time_spent_seconds']
+        window_id = self._name_id(conn, 'window_titles', log_entry['window'], new_ids)
+        process_id = self._name_id(conn, 'process_names', log_entry['process'], new_ids)
+        category, is_productive = self._pair_category(conn, partitions.month_key(timestamp), window_id, process_id,
+                                                      log_entry['window'], log_entry['process'], pairs)
+        rollups.add_activity(rollup_deltas, timestamp, process_id, category, is_productive, time_spent)
+        rollups.add_window_activity(window_deltas, timestamp, process_id, window_id, time_spent)
+        return (
+            start_ms,
+            start_ms + int(round(time_spent * 1000)),
+            window_id,
+            process_id,
+            time_spent
+        )
+    
+    def get_app_names(self, pairs: Iterable[Tuple[Optional[str], Optional[str]]]) -> Dict[Tuple, str]:
+        """
+        Canonical app name (appnames.app_name) for each raw (process, window) pair
+        Names come from a bounded memo, then from the app_names table. A pair normalized for the
+        first time is stored there, so each distinct raw name is normalized once per database
+        """
+        names = {}
+        missing = {}
+        for pair in pairs:
+            if pair in names:
+                continue
+            key = appnames.memo_key(*pair)
+            app = self._app_names.get(key)
+            if app is None:
+                missing.setdefault(key, []).append(pair)
+            else:
+                names[pair] = app
+        if not missing:
+            return names
+        
+        conn = self._connect()
+        new_names = {}
+        try:
+            for process, window in missing:
+                row = conn.execute(SELECT_APP_NAME_SQL, (window, process)).fetchone() if process else None
+                if row is None:
+                    new_names[(process, window)] = appnames.app_name(process, window)
+                else:
+                    self._app_names.set((process, window), row[0])
+            if new_names:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany(INSERT_APP_NAME_SQL, [
+                    (app, window, process, window) for (process, window), app in new_names.items() if process
+                ])
+                conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            # The names are still right, they just get normalized again next time
+            logger.error(f"Error storing app names: {e}")
+        for key, app in new_names.items():
+            self._app_names.set(key, app)
+        
+        for key, pairs_for_key in missing.items():
+            app = self._app_names.get(key) or appnames.app_name(*key)
+            for pair in pairs_for_key:
+                names[pair] = app
+        return names
+    
+    def get_meta(self, key: str, default=None):
+        try:
+            return get_meta(self._connect(), key, default)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading meta {key}: {e}")
+            return default
+    
+    def set_meta(self, key: str, value) -> bool:
+        conn = self._connect()
+        try:
+            set_meta(conn, key, value)
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"Error writing meta {key}: {e}")
+            return False
+    
+    def get_data_watermark(self) -> str:
+        """Changes whenever stored data changes; every insert, delete and rebuild bumps data_generation"""
+        return str(get_meta(self._connect(), 'data_generation', 0))
+    
+    @staticmethod
+    def _day_bounds(start_date: Optional[datetime], end_date: Optional[datetime]) -> Tuple[int, int]:
+        """Inclusive bounds on the start of the days overlapping [start_date, end_date]"""
+        return (MIN_MS if start_date is None else to_epoch_ms(rollups.bucket_start(start_date, 'day')),
+                MAX_MS if end_date is None else to_epoch_ms(end_date))
+    
+    def get_day_generations(self, start_date: datetime = None, end_date: datetime = None) -> Dict[int, int]:
+        """Generation of the last change to each day overlapping [start_date, end_date], by day start in epoch ms"""
+        return dict(self._connect().execute(SELECT_DAY_GENERATIONS_SQL, self._day_bounds(start_date, end_date)))
+    
+    def get_range_watermark(self, start_date: datetime = None, end_date: datetime = None,
+                            generations: Optional[Dict[int, int]] = None) -> str:
+        """
+        Changes whenever the stored totals of a day overlapping [start_date, end_date] change
+        Writes to other days leave it alone, so a closed past range keeps its watermark.
+        generations from get_day_generations, covering the range, saves the query for each of many ranges
+        """
+        start_ms, end_ms = self._day_bounds(start_date, end_date)
+        if generations is None:
+            return str(self._connect().execute(SELECT_RANGE_GENERATION_SQL, (start_ms, end_ms)).fetchone()[0] or 0)
+        return str(max((generation for day_ms, generation in generations.items() if start_ms <= day_ms <= end_ms),
+                       default=0))
+    
+    @staticmethod
+    def _bump_data_generation(conn: sqlite3.Connection, days: Iterable[int] = (),
+                              day_range: Optional[Tuple[Optional[int], Optional[int]]] = None):
+        """
+        Record a change of the stored data; runs inside the caller's transaction
+        The days starting at the epoch ms in days, and those in day_range [start_ms, end_ms)
+        (None for an open end), take the new generation
+        """
+        conn.execute(BUMP_DATA_GENERATION_SQL)
+        conn.executemany(TOUCH_DAY_SQL, [(day_ms,) for day_ms in days])
+        if day_range is not None:
+            start_ms, end_ms = day_range
+            bounds = (MIN_MS if start_ms is None else start_ms, MAX_MS if end_ms is None else end_ms)
+            for sql in TOUCH_DAY_RANGE_SQL:
+                conn.execute(sql, bounds)
+    
+    def get_journal_seq(self) -> int:
+        """Sequence number of the last journal entry committed to the database"""
+        return self._journal_seq(self._connect(), 'main')
+    
+    @staticmethod
+    def _journal_seq(conn: sqlite3.Connection, schema: str) -> int:
+        row = conn.execute(SELECT_JOURNAL_SEQ_SQL.format(schema=schema)).fetchone()
+        return int(row[0]) if row else 0
+    
+    def replay_journal(self) -> int:
+        """
+        Insert journaled activities that never reached the database
+        Every entry is passed on: a crash between the commits of the catalog and a partition
+        leaves an entry in one file only, and _log_batch completes it in the other
+        Returns the number of journal entries replayed
+        """
+        if not os.path.exists(self.journal_path) or os.path.getsize(self.journal_path) == 0:
+            return 0
+        entries = list(ActivityJournal.read(self.journal_path))
+        if entries and self.log_activities_batch(entries):
+            logger.info(f"Replayed {len(entries)} activities from {self.journal_path}")
+            return len(entries)
+        return 0
+    
+    def count_activities(self) -> int:
+        """Total number of stored activities across all partitions"""
+        conn = self._connect()
+        try:
+            total = 0
+            for key in partitions.list_partitions(self.db_path):
+                schema = self._attach(conn, key)
+                total += conn.execute(f'SELECT COUNT(*) FROM {self._activity_source(conn, key, schema)}').fetchone()[0]
+            return total
+        except sqlite3.Error as e:
+            logger.error(f"Error counting activities: {e}")
+            return 0
+    
     def log_activity(self, log_entry: dict) -> bool:
         """
         Log an activity with proper error handling
         Returns True if successful, False otherwise
         """
+        conn = self._connect()
+        new_ids = {}
+        rollup_deltas = {}
+        window_deltas = {}
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO activity (timestamp, window, process, time_spent_seconds)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                log_entry['timestamp'],
-                log_entry['window'],
-                log_entry['process'],
-                log_entry['time_spent_seconds']
-            ))
+            self._release_finished(conn)
+            key = partitions.month_key(log_entry['timestamp'])
+            schema = self._write_schema(conn, key)
+            # Locked up front: the stored category is read and used within the same transaction
+            conn.execute('BEGIN IMMEDIATE')
+            self._insert_rows(conn, key, schema,
+                              [self._activity_row(conn, log_entry, new_ids, rollup_deltas, window_deltas, {})])
+            rollups.apply_deltas(conn, rollup_deltas)
+            rollups.apply_window_deltas(conn, window_deltas)
+            self._bump_data_generation(conn, rollups.days_of(rollup_deltas))
             conn.commit()
-            conn.close()
+            self._cache_name_ids(new_ids)
             return True
         except sqlite3.Error as e:
+            conn.rollback()
             logger.error(f"Error logging activity: {e}")
             return False
     
@@ -81,98 +642,413 @@ class ActivityLogger:
         """
         Get activities from the database with optional date range and limit
         """
+        chunk_size = min(limit, 5000) if limit else 5000
+        activities = list(islice(self.iter_activities(start_date, end_date, chunk_size), limit))
+        logger.debug(f"Retrieved {len(activities)} activities from database")
+        return activities
+    
+    def iter_activity_chunks(self, start_date: datetime = None, end_date: datetime = None,
+                             chunk_size: int = 1000, categorized: bool = False) -> Iterator[List[Tuple]]:
+        """
+        Yield activities newest first in lists of at most chunk_size rows
+        Only the monthly partitions overlapping the range are attached, newest month first.
+        Every chunk is its own keyset query on (start_ms, id), so memory stays flat however
+        large the range is and no read transaction is held open while the caller works
+        categorized appends the stored (category, subcategory, is_productive) to each row
+        """
+        conditions = []
+        params = []
+        if start_date:
+            conditions.append('activity.start_ms >= ?')
+            params.append(to_epoch_ms(start_date))
+        if end_date:
+            conditions.append('activity.start_ms <= ?')
+            params.append(to_epoch_ms(end_date))
+        
+        conn = self._connect()
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            query = 'SELECT * FROM activity'
-            params = []
-            
-            if start_date or end_date:
-                query += ' WHERE'
-                if start_date:
-                    query += ' timestamp >= ?'
-                    params.append(start_date.strftime('%Y-%m-%d %H:%M:%S'))
-                if end_date:
-                    if start_date:
-                        query += ' AND'
-                    query += ' timestamp <= ?'
-                    params.append(end_date.strftime('%Y-%m-%d %H:%M:%S'))
-            
-            query += ' ORDER BY timestamp DESC'
+            self._release_finished(conn)
+        except sqlite3.Error as e:
+            logger.error(f"Error detaching partitions: {e}")
+            return
+        for key in reversed(partitions.list_partitions(self.db_path, start_date, end_date)):
+            last_key = None
+            while True:
+                page_conditions = list(conditions)
+                page_params = list(params)
+                if last_key is not None:
+                    # Strictly after the last row of the previous page in (start_ms, id) DESC order
+                    page_conditions.append('activity.start_ms <= ? AND (activity.start_ms < ? OR activity.id < ?)')
+                    page_params += [last_key[0], last_key[0], last_key[1]]
+                
+                try:
+                    # Re-attach every page: the caller may have used this connection for other months meanwhile
+                    schema = self._attach(conn, key)
+                    if schema is None:
+                        break
+                    source = self._activity_source(conn, key, schema)
+                    if categorized:
+                        query = SELECT_CATEGORIZED_PAGE_SQL.format(activity=source)
+                        page_params.insert(0, key)
+                    else:
+                        query = SELECT_ACTIVITY_PAGE_SQL.format(activity=source)
+                    if page_conditions:
+                        query += ' WHERE ' + ' AND '.join(page_conditions)
+                    query += ' ORDER BY activity.start_ms DESC, activity.id DESC LIMIT ?'
+                    page_params.append(chunk_size)
+                    rows = conn.execute(query, page_params).fetchall()
+                except sqlite3.Error as e:
+                    logger.error(f"Error getting activities: {e}")
+                    return
+                if not rows:
+                    break
+                last_key = (rows[-1][5], rows[-1][0])
+                if categorized:
+                    yield [row[:5] + (row[6], row[7], None if row[8] is None else bool(row[8])) for row in rows]
+                else:
+                    yield [row[:5] for row in rows]
+                if len(rows) < chunk_size:
+                    break
+    
+    def iter_activities(self, start_date: datetime = None, end_date: datetime = None,
+                        chunk_size: int = 1000, categorized: bool = False) -> Iterator[Tuple]:
+        """Yield activities one row at a time, same rows and order as get_activities"""
+        for chunk in self.iter_activity_chunks(start_date, end_date, chunk_size, categorized):
+            yield from chunk
+    
+    def get_rollups(self, start_date: datetime = None, end_date: datetime = None,
+                    granularity: str = 'day') -> List[Tuple]:
+        """
+        Get pre-aggregated totals per hour or day, process and category
+        A bucket is included when its start lies within the range
+        """
+        try:
+            query = SELECT_ROLLUP_COLUMNS
+            params = [granularity]
+            if start_date:
+                query += ' AND bucket_start_ms >= ?'
+                params.append(to_epoch_ms(start_date))
+            if end_date:
+                query += ' AND bucket_start_ms <= ?'
+                params.append(to_epoch_ms(end_date))
+            query += ' ORDER BY bucket_start_ms'
             
-            if limit:
-                query += ' LIMIT ?'
-                params.append(limit)
+            return [
+                (bucket, process, category, None if is_productive is None else bool(is_productive), time_spent)
+                for bucket, process, category, is_productive, time_spent in self._connect().execute(query, params)
+            ]
+        except sqlite3.Error as e:
+            logger.error(f"Error getting rollups: {e}")
+            return []
+    
+    def rollups_match_rules(self) -> bool:
+        """False while stored categories from older rules are still waiting to be re-categorized"""
+        return self.get_meta('rollups_rules_version') == self.rules.version
+    
+    def stale_category_months(self, version: str) -> List[str]:
+        """Months with window/process pairs categorized by rules other than version, newest first"""
+        try:
+            return [row[0] for row in self._connect().execute(SELECT_STALE_MONTHS_SQL, (version,))]
+        except sqlite3.Error as e:
+            logger.error(f"Error finding stale categories: {e}")
+            return []
+    
+    def recategorize_batch(self, key: str, compiled: rules.CompiledRules, batch_size: int = 500) -> Optional[int]:
+        """
+        Re-categorize up to batch_size window/process pairs of a month that other rules categorized
+        Activities of pairs whose category or productivity changed are moved between rollup rows
+        in the same transaction, so the rollups always match the stored categories. Partitions are
+        only read, sealed ones included.
+        Returns the number of pairs updated, 0 once the month is current, None on a database error
+        """
+        conn = self._connect()
+        try:
+            self._release_finished(conn)
+            schema = self._attach(conn, key)
+            conn.execute('BEGIN IMMEDIATE')
+            source = None if schema is None else self._activity_source(conn, key, schema)
+            version_id = intern_name(conn, 'rules_versions', compiled.version)
+            stale = conn.execute(SELECT_STALE_PAIRS_SQL, (key, version_id, batch_size)).fetchall()
+            removed = {}
+            added = {}
+            updates = []
+            labels = compiled.categorize_columns([row[2] for row in stale], [row[3] for row in stale])
+            for (window_id, process_id, window, process, old_category, old_productive), label in zip(stale, labels):
+                category, subcategory, is_productive = label
+                updates.append((intern_label(conn, category, subcategory, is_productive), version_id,
+                                key, window_id, process_id))
+                old_productive = None if old_productive is None else bool(old_productive)
+                # A missing partition has no activities left to move
+                if source is None or (category, is_productive) == (old_category, old_productive):
+                    continue
+                pair_rows = conn.execute(SELECT_PAIR_ACTIVITIES_SQL.format(activity=source),
+                                         (process_id or None, window_id or None))
+                for start_ms, time_spent in pair_rows:
+                    timestamp = datetime.fromtimestamp(start_ms / 1000)
+                    rollups.add_activity(removed, timestamp, process_id, old_category, old_productive,
+                                         time_spent, sign=-1)
+                    rollups.add_activity(added, timestamp, process_id, category, is_productive, time_spent)
             
-            cursor.execute(query, params)
-            activities = cursor.fetchall()
-            conn.close()
+            rollups.move_activities(conn, removed, added)
+            conn.executemany(UPDATE_PAIR_CATEGORY_SQL, updates)
+            if removed:
+                self._bump_data_generation(conn, rollups.days_of(removed))
+            conn.commit()
+            return len(stale)
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"Database error while re-categorizing {key}: {e}")
+            return None
+    
+    def rebuild_rollups(self, progress=None) -> bool:
+        """
+        Recompute all rollups from the raw activities and their stored categories, one month per transaction
+        Returns True if successful, False otherwise
+        """
+        conn = self._connect()
+        try:
+            previous_end = None
+            for key in partitions.list_partitions(self.db_path):
+                month_start, month_end = (to_epoch_ms(bound) for bound in partitions.month_bounds(key))
+                schema = self._attach(conn, key)
+                conn.execute('BEGIN IMMEDIATE')
+                # Months without a partition have no activities, so no rollups either
+                rollups.delete_rollups(conn, previous_end, month_start)
+                rollups.rebuild_rollups(conn, month_start, month_end, progress,
+                                        table=self._activity_source(conn, key, schema), month=key)
+                conn.commit()
+                previous_end = month_end
             
-            logger.debug(f"Retrieved {len(activities)} activities from database")
-            return activities
+            conn.execute('BEGIN IMMEDIATE')
+            rollups.delete_rollups(conn, previous_end)
+            self._bump_data_generation(conn, day_range=(None, None))
+            conn.commit()
+            return True
         except sqlite3.Error as e:
-            logger.error(f"Error getting activities: {e}")
-            return []
+            conn.rollback()
+            logger.error(f"Database error while rebuilding rollups: {e}")
+            return False
     
     def log_activities_batch(self, log_entries: List[dict]) -> bool:
         """
         Log multiple activities in a single transaction
+        Entries carrying a journal 'seq' are skipped if that seq was already committed
+        A batch spanning more months than can be attached at once is written in consecutive parts,
+        in seq order: each part raises the journal marks to its highest seq, so a later part
+        holding lower seqs would have them skipped as already committed
         Returns True if successful, False otherwise
         """
+        groups = [[]]
+        months = set()
+        for entry in sorted(log_entries, key=lambda entry: entry.get('seq', 0)):
+            key = partitions.month_key(entry['timestamp'])
+            if key not in months and len(months) == MAX_ATTACHED:
+                groups.append([])
+                months = set()
+            months.add(key)
+            groups[-1].append(entry)
+        return all(self._log_batch(group) for group in groups)
+    
+    def _log_batch(self, log_entries: List[dict]) -> bool:
+        """Write entries spanning at most MAX_ATTACHED months in one transaction"""
+        conn = self._connect()
+        new_ids = {}
+        rollup_deltas = {}
+        window_deltas = {}
         try:
-            conn = sqlite3.connect(self.db_path)
+            # Attaching has to happen before the transaction starts
+            self._release_finished(conn)
+            schemas = {}
+            for entry in log_entries:
+                key = partitions.month_key(entry['timestamp'])
+                if key not in schemas:
+                    schemas[key] = self._write_schema(conn, key)
             cursor = conn.cursor()
+            # Lock before reading the journal high-water marks and the stored categories,
+            # so concurrent replays can't both insert and re-categorization can't interleave
+            cursor.execute('BEGIN IMMEDIATE')
             
-            # Prepare the data for batch insertion
-            data = [
-                (
-                    entry["timestamp"].strftime("%Y-%m-%d %H:%M:%S"),
-                    entry["window"],
-                    entry["process"],
-                    entry["time_spent_seconds"]
-                )
-                for entry in log_entries
-            ]
+            # In WAL mode SQLite commits the catalog and each partition separately, so a crash
+            # between those commits leaves a journaled entry in some files only. Each file has
+            # its own high-water mark: rows go into partitions that lack them, and rollups
+            # into the catalog if it lacks them, so a replay never counts anything twice.
+            # Late rows of sealed months live in the catalog and share its mark.
+            journal_seqs = [entry['seq'] for entry in log_entries if 'seq' in entry]
+            catalog_seq = 0
+            partition_seqs = {}
+            if journal_seqs:
+                catalog_seq = self._journal_seq(cursor, 'main')
+                partition_seqs = {schema: self._journal_seq(cursor, schema) for schema in schemas.values()}
+                partition_seqs['main'] = catalog_seq
+            
+            # Prepare the data for batch insertion, grouped by partition
+            data = {}
+            pairs = {}
+            written_seqs = {}
+            for entry in log_entries:
+                key = partitions.month_key(entry['timestamp'])
+                schema = schemas[key]
+                seq = entry.get('seq')
+                in_catalog = seq is not None and seq <= catalog_seq
+                in_partition = seq is not None and seq <= partition_seqs[schema]
+                if in_catalog and in_partition:
+                    continue
+                row = self._activity_row(conn, entry, new_ids, {} if in_catalog else rollup_deltas,
+                                         {} if in_catalog else window_deltas, pairs)
+                if not in_partition:
+                    data.setdefault(key, []).append(row)
+                    if seq is not None and schema != 'main':
+                        written_seqs[schema] = max(written_seqs.get(schema, 0), seq)
             
-            cursor.executemany('''
-                INSERT INTO activity (timestamp, window, process, time_spent_seconds)
-                VALUES (?, ?, ?, ?)
-            ''', data)
+            for key, rows in data.items():
+                self._insert_rows(cursor, key, schemas[key], rows)
+            for schema, seq in written_seqs.items():
+                cursor.execute(UPDATE_JOURNAL_SEQ_SQL.format(schema=schema), (str(seq),))
+            if journal_seqs:
+                cursor.execute(UPDATE_JOURNAL_SEQ_SQL.format(schema='main'), (str(max(catalog_seq, max(journal_seqs))),))
+            # Rollups change in the same transaction, so they always match the raw rows
+            rollups.apply_deltas(conn, rollup_deltas)
+            rollups.apply_window_deltas(conn, window_deltas)
+            self._bump_data_generation(conn, rollups.days_of(rollup_deltas))
             
             conn.commit()
-            conn.close()
+            self._cache_name_ids(new_ids)
             logger.debug(f"Successfully logged {len(log_entries)} activities")
             return True
         except sqlite3.Error as e:
+            conn.rollback()
             logger.error(f"Database error while batch logging activities: {e}")
             return False
         except Exception as e:
+            conn.rollback()
             logger.error(f"Unexpected error while batch logging activities: {e}")
             return False
     
-    def cleanup_old_data(self, days_to_keep: int = 30) -> bool:
+    def cleanup_old_data(self, days_to_keep: int = 30, batch_size: int = 5000, pause: float = 0.05,
+                         vacuum_pages: int = 1000, progress: Optional[Callable[[dict], None]] = None) -> bool:
         """
-        Remove old data from the database
+        Remove old data from the database in bounded batches and give the space back
+        Months entirely past retention are dropped as whole partition files. Sealed months are
+        never rewritten, so one the cutoff falls in is kept whole until it is entirely past
+        retention. Each batch is its own short transaction followed by a pause, so the tracker's
+        writes get the lock in between. Freed pages are released with incremental vacuum.
+        progress receives a dict with phase, deleted, freed_pages, elapsed and rows_per_second
         Returns True if successful, False otherwise
         """
+        conn = self._connect()
+        started = time.monotonic()
+        status = {'phase': 'delete', 'deleted': 0, 'freed_pages': 0, 'elapsed': 0.0, 'rows_per_second': 0.0}
+        
+        def report(phase):
+            status['phase'] = phase
+            status['elapsed'] = time.monotonic() - started
+            status['rows_per_second'] = status['deleted'] / status['elapsed'] if status['elapsed'] else 0.0
+            if progress:
+                progress(dict(status))
+        
         try:
-            cutoff_date = (datetime.now() - timedelta(days=days_to_keep)).strftime("%Y-%m-%d %H:%M:%S")
+            cutoff_date = datetime.now() - timedelta(days=days_to_keep)
+            cutoff_ms = to_epoch_ms(cutoff_date)
+            vacuum_schemas = ['main']
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            # Start of the first month kept whole, if a sealed month stops the cleanup early
+            kept_from_ms = None
+            for key in partitions.list_partitions(self.db_path, end=cutoff_date):
+                path = self._partition_path(key)
+                month_start_ms, month_end_ms = (to_epoch_ms(bound) for bound in partitions.month_bounds(key))
+                if month_end_ms <= cutoff_ms:
+                    # The whole month is past retention: drop the file instead of deleting rows
+                    schema = self._attach(conn, key)
+                    count = conn.execute(f'SELECT COUNT(*) FROM {self._activity_source(conn, key, schema)}').fetchone()[0]
+                    self._detach(conn, key)
+                    try:
+                        partitions.remove_partition(path)
+                    except OSError as e:
+                        # e.g. another process still has it open on Windows
+                        logger.warning(f"Couldn't remove partition {key}: {e}")
+                    else:
+                        conn.execute('BEGIN IMMEDIATE')
+                        rollups.delete_rollups(conn, end_ms=month_end_ms)
+                        conn.execute("DELETE FROM pair_categories WHERE month = ?", (key,))
+                        conn.execute("DELETE FROM late_activity WHERE month = ?", (key,))
+                        self._bump_data_generation(conn, day_range=(None, month_end_ms))
+                        conn.commit()
+                        status['deleted'] += count
+                        report('delete')
+                        continue
+                
+                if partitions.is_sealed(path):
+                    # Readers may have it attached as immutable; try again once the month can go whole
+                    logger.info(f"Keeping sealed partition {key} until all of it is past retention")
+                    kept_from_ms = month_start_ms
+                    break
+                schema = self._attach(conn, key, writable=True)
+                vacuum_schemas.append(schema)
+                while True:
+                    conn.execute('BEGIN IMMEDIATE')
+                    # Oldest first: once a batch ends at `boundary` nothing older is left
+                    row = conn.execute(
+                        f"SELECT start_ms FROM {schema}.activity WHERE start_ms < ? ORDER BY start_ms LIMIT 1 OFFSET ?",
+                        (cutoff_ms, batch_size - 1)
+                    ).fetchone()
+                    boundary = row[0] if row else cutoff_ms - 1
+                    cursor = conn.execute(f"DELETE FROM {schema}.activity WHERE start_ms <= ?", (boundary,))
+                    # Rollups of days that are now completely gone
+                    boundary_day = rollups.bucket_start(datetime.fromtimestamp(boundary / 1000), 'day')
+                    rollups.delete_rollups(conn, end_ms=to_epoch_ms(boundary_day))
+                    conn.commit()
+                    status['deleted'] += cursor.rowcount
+                    report('delete')
+                    if row is None:
+                        break
+                    time.sleep(pause)
             
-            cursor.execute("DELETE FROM activity WHERE timestamp < ?", (cutoff_date,))
-            deleted_count = cursor.rowcount
+            if kept_from_ms is not None:
+                conn.execute('BEGIN IMMEDIATE')
+                rollups.delete_rollups(conn, end_ms=kept_from_ms)
+                self._bump_data_generation(conn, day_range=(None, kept_from_ms))
+                conn.commit()
+            else:
+                # Recompute the day the cutoff falls in, it lost only part of its activities
+                cutoff_day = rollups.bucket_start(cutoff_date, 'day')
+                day_range = (to_epoch_ms(cutoff_day), to_epoch_ms(cutoff_day + timedelta(days=1)))
+                cutoff_month = partitions.month_key(cutoff_date)
+                schema = self._attach(conn, cutoff_month)
+                conn.execute('BEGIN IMMEDIATE')
+                rollups.delete_rollups(conn, end_ms=day_range[0])
+                if schema is None:
+                    rollups.delete_rollups(conn, end_ms=day_range[1])
+                else:
+                    rollups.rebuild_rollups(conn, *day_range, table=self._activity_source(conn, cutoff_month, schema),
+                                            month=cutoff_month)
+                self._bump_data_generation(conn, day_range=(None, day_range[1]))
+                conn.commit()
             
-            conn.commit()
-            conn.close()
+            # Hand free pages back to the filesystem a step at a time
+            for schema in vacuum_schemas:
+                freelist_sql = f'PRAGMA {schema}.freelist_count'
+                while conn.execute(freelist_sql).fetchone()[0] > 0:
+                    before = conn.execute(freelist_sql).fetchone()[0]
+                    # executescript steps the pragma to completion; execute() frees a single page
+                    conn.executescript(f'PRAGMA {schema}.incremental_vacuum({int(vacuum_pages)})')
+                    freed = before - conn.execute(freelist_sql).fetchone()[0]
+                    if freed <= 0:
+                        # auto_vacuum isn't incremental on this database
+                        break
+                    status['freed_pages'] += freed
+                    report('vacuum')
+                    time.sleep(pause)
             
-            logger.info(f"Cleaned up {deleted_count} old records")
+            report('done')
+            logger.info(f"Cleaned up {status['deleted']} old records in {status['elapsed']:.1f}s "
+                        f"({status['rows_per_second']:.0f} rows/s), freed {status['freed_pages']} pages")
+            self.seal_old_partitions()
             return True
         except sqlite3.Error as e:
+            conn.rollback()
             logger.error(f"Database error while cleaning up old data: {e}")
             return False
         except Exception as e:
+            conn.rollback()
             logger.error(f"Unexpected error while cleaning up old data: {e}")
-            return False 
\ No newline at end of file
+            return False
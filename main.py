@@ -1,64 +1,174 @@
 import argparse
-from rich.console import Console
-from rich.panel import Panel
-from tracker import TimeTracker
-from reporter import ReportGenerator
-from visualizer import DataVisualizer
 import sys
-from logger import ActivityLogger
-from rich.table import Table
-import webbrowser
 import os
 
-console = Console()
+# Feature modules are imported where they are used so --daemon doesn't load Rich, pandas or plotly
 
-def view_all_apps():
+def get_console():
+    from rich.console import Console
+    return Console()
+
+def view_all_apps(chunk_size: int = 500):
+    from itertools import chain
+    from rich.table import Table
+    from logger import ActivityLogger
+    
+    console = get_console()
     logger = ActivityLogger()
-    activities = logger.get_activities()
+    # Stream the history a chunk at a time instead of loading it all
+    chunks = logger.iter_activity_chunks(chunk_size=chunk_size)
+    first_chunk = next(chunks, None)
     
-    if not activities:
+    if not first_chunk:
         console.print("[yellow]No activity data found.[/yellow]")
         return
     
-    # Create a table to display all activities
-    table = Table(show_header=True, header_style="bold magenta")
-    table.add_column("Timestamp")
-    table.add_column("Window")
-    table.add_column("Process")
-    table.add_column("Time Spent")
-    
-    for _, timestamp, window, process, time_spent in activities:
-        hours = time_spent / 3600
-        table.add_row(
-            timestamp,
-            window,
-            process,
-            f"{hours:.2f} hours"
-        )
-    
-    console.print(Panel(table, title="All Tracked Activities"))
+    console.rule("All Tracked Activities")
+    for index, activities in enumerate(chain([first_chunk], chunks)):
+        # One table per chunk; fixed widths and ratios keep the columns aligned across chunks
+        table = Table(show_header=index == 0, header_style="bold magenta", expand=True)
+        table.add_column("Timestamp", width=19, no_wrap=True)
+        table.add_column("Window", ratio=3)
+        table.add_column("Process", ratio=1)
+        table.add_column("Time Spent", width=12, no_wrap=True)
+        
+        for _, timestamp, window, process, time_spent in activities:
+            hours = time_spent / 3600
+            table.add_row(
+                timestamp,
+                window,
+                process,
+                f"{hours:.2f} hours"
+            )
+        
+        console.print(table)
+
+def parse_date(value: str):
+    from datetime import datetime
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a date as YYYY-MM-DD, got {value!r}")
+
+def get_date_range(args):
+    """Start and end of the --from/--to days, (None, None) for the whole history"""
+    from datetime import datetime
+    if not args.from_date and not args.to_date:
+        return None, None
+    end_day = args.to_date or datetime.now()
+    end_date = end_day.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return args.from_date, end_date
 
 def open_report(report_path: str):
     """Open the generated report in the default web browser"""
+    import webbrowser
+    console = get_console()
     if os.path.exists(report_path):
         webbrowser.open(f'file://{os.path.abspath(report_path)}')
     else:
         console.print(f"[red]Report file not found: {report_path}[/red]")
 
+def manage_backups(args):
+    from rich.table import Table
+    from backup_store import BackupStore
+    from logger import DEFAULT_DB_PATH, ActivityLogger
+    
+    console = get_console()
+    store = BackupStore.for_database(DEFAULT_DB_PATH)
+    
+    if args.backup:
+        activity_logger = ActivityLogger()
+        manifest = store.create_snapshot(DEFAULT_DB_PATH, watermark=activity_logger.get_data_watermark(),
+                                         partition_files=activity_logger.partition_files())
+        if manifest is None:
+            console.print("[red]Backup failed, see the log for details[/red]")
+            return
+        console.print(f"[green]Created backup snapshot {manifest['id']}[/green]")
+    
+    elif args.list_backups:
+        table = Table(show_header=True, header_style="bold magenta", title="Backup Snapshots")
+        table.add_column("Snapshot")
+        table.add_column("Created")
+        table.add_column("Size", justify="right")
+        for manifest in store.list_snapshots():
+            size = sum(entry['size'] for entry in manifest['files'].values())
+            table.add_row(manifest['id'], manifest['created_at'], f"{size / 1024 / 1024:.1f} MB")
+        console.print(table)
+        stats = store.stats()
+        console.print(f"{stats['snapshots']} snapshots, {stats['logical_bytes'] / 1024 / 1024:.1f} MB of data "
+                      f"stored in {stats['stored_bytes'] / 1024 / 1024:.1f} MB")
+    
+    elif args.verify_backups:
+        results = store.verify()
+        for snapshot_id, problems in results.items():
+            if problems:
+                console.print(f"[red]{snapshot_id}: {len(problems)} problems[/red]")
+                for problem in problems:
+                    console.print(f"  {problem}")
+            else:
+                console.print(f"[green]{snapshot_id}: OK[/green]")
+        if not results:
+            console.print("[yellow]No backup snapshots found.[/yellow]")
+    
+    elif args.restore_backup:
+        snapshot_id = None if args.restore_backup == "latest" else args.restore_backup
+        target = args.restore_to or os.path.join(os.path.dirname(DEFAULT_DB_PATH), "activity.restored.db")
+        if store.restore(target, snapshot_id):
+            console.print(f"[green]Restored backup to {target}[/green]")
+            console.print("To roll back, stop the tracker and restore again with --restore-to pointing at activity.db.")
+        else:
+            console.print("[red]Restore failed, see the log for details[/red]")
+    
+    elif args.prune_backups:
+        deleted = store.prune(keep_last=args.keep_last, keep_days=args.keep_days)
+        console.print(f"[green]Deleted {deleted} backup snapshots[/green]")
+
 def main():
     parser = argparse.ArgumentParser(description="Where Did My Time Go - Time Tracking Application")
     parser.add_argument("--start", action="store_true", help="Start tracking time")
+    parser.add_argument("--daemon", action="store_true", help="Track in the background without a terminal UI")
+    parser.add_argument("--status-file", help="Heartbeat/status JSON written in daemon mode")
+    parser.add_argument("--heartbeat", type=float, default=30.0, help="Seconds between status file updates in daemon mode")
     parser.add_argument("--report", action="store_true", help="Generate a report")
     parser.add_argument("--today", action="store_true", help="Generate report for today")
     parser.add_argument("--week", action="store_true", help="Generate report for this week")
+    parser.add_argument("--from", dest="from_date", type=parse_date, metavar="YYYY-MM-DD", help="First day for --report/--visualize")
+    parser.add_argument("--to", dest="to_date", type=parse_date, metavar="YYYY-MM-DD", help="Last day for --report/--visualize (default: today)")
     parser.add_argument("--view-all", action="store_true", help="View all tracked activities")
+    parser.add_argument("--migrate", action="store_true", help="Upgrade the activity database to the current schema (resumable)")
+    parser.add_argument("--rebuild-rollups", action="store_true", help="Recompute the hourly/daily report totals from all tracked activities")
+    parser.add_argument("--recategorize", action="store_true", help="Apply changed categorization rules to stored activities now")
+    parser.add_argument("--cleanup", action="store_true", help="Delete activities older than --retention-days and reclaim the space")
+    parser.add_argument("--retention-days", type=int, default=30, help="Days of activity history --cleanup keeps")
+    parser.add_argument("--backup", action="store_true", help="Snapshot the database into the backup store now")
+    parser.add_argument("--list-backups", action="store_true", help="List backup snapshots")
+    parser.add_argument("--verify-backups", action="store_true", help="Check every backup snapshot for missing or corrupt chunks")
+    parser.add_argument("--restore-backup", metavar="SNAPSHOT", help="Restore a backup snapshot ('latest' for the newest) to --restore-to")
+    parser.add_argument("--restore-to", help="Target file for --restore-backup (default: activity.restored.db next to the database)")
+    parser.add_argument("--prune-backups", action="store_true", help="Delete backup snapshots outside --keep-days/--keep-last")
+    parser.add_argument("--keep-days", type=int, default=30, help="Keep backup snapshots younger than this many days")
+    parser.add_argument("--keep-last", type=int, default=5, help="Always keep this many of the newest backup snapshots")
     parser.add_argument("--visualize", action="store_true", help="Generate and open visualization report")
     parser.add_argument("--visualize-today", action="store_true", help="Generate and open today's visualization")
     parser.add_argument("--visualize-week", action="store_true", help="Generate and open weekly visualization")
+    parser.add_argument("--visualize-range", action="store_true", help="Generate one visualization per --per period of --from/--to and an index page")
+    parser.add_argument("--per", choices=["day", "week"], default="day", help="Period of each --visualize-range report")
+    parser.add_argument("--offline", action="store_true", help="Inline plotly.js so visualization reports open without internet")
+    parser.add_argument("--max-points", type=int, default=2000, help="Most points per chart series in visualization reports")
+    parser.add_argument("--reports-max-mb", type=int, default=200, help="Size limit of the reports directory; least recently used reports are deleted")
     
     args = parser.parse_args()
     
+    if args.daemon:
+        from daemon import run_daemon
+        run_daemon(args.status_file, args.heartbeat)
+        return
+    
+    console = get_console()
+    
     if args.start:
+        from rich.panel import Panel
+        from tracker import TimeTracker
         try:
             console.print(Panel.fit("Starting time tracking...", title="Time Tracker"))
             tracker = TimeTracker()
@@ -68,32 +178,81 @@ def main():
             sys.exit(0)
     
     elif args.report or args.today or args.week:
+        from reporter import ReportGenerator
         reporter = ReportGenerator()
         if args.today:
             reporter.generate_daily_report()
         elif args.week:
             reporter.generate_weekly_report()
         else:
-            reporter.generate_report()
+            reporter.generate_report(*get_date_range(args))
     
-    elif args.visualize or args.visualize_today or args.visualize_week:
-        visualizer = DataVisualizer()
+    elif args.visualize or args.visualize_today or args.visualize_week or args.visualize_range:
+        from visualizer import DataVisualizer
+        visualizer = DataVisualizer(offline=args.offline, max_points=args.max_points,
+                                    max_cache_bytes=args.reports_max_mb * 1024 * 1024)
         if args.visualize_today:
             report_path = visualizer.generate_daily_report()
             console.print(f"[green]Generated daily visualization report: {report_path}[/green]")
             open_report(report_path)
+        elif args.visualize_range:
+            index_path = visualizer.generate_batch_reports(*get_date_range(args), per=args.per)
+            if index_path is None:
+                console.print("[yellow]No activity data found for this period.[/yellow]")
+                return
+            console.print(f"[green]Generated per-{args.per} visualization reports: {index_path}[/green]")
+            open_report(index_path)
         elif args.visualize_week:
             report_path = visualizer.generate_weekly_report()
             console.print(f"[green]Generated weekly visualization report: {report_path}[/green]")
             open_report(report_path)
         else:
-            report_path = visualizer.generate_report()
+            report_path = visualizer.generate_report(*get_date_range(args))
             console.print(f"[green]Generated visualization report: {report_path}[/green]")
             open_report(report_path)
     
     elif args.view_all:
         view_all_apps()
     
+    elif args.migrate:
+        from logger import DEFAULT_DB_PATH
+        from migrations import SCHEMA_VERSION, migrate_database
+        previous = migrate_database(DEFAULT_DB_PATH, progress=console.print)
+        if previous == SCHEMA_VERSION:
+            console.print(f"[green]Database is already at schema v{SCHEMA_VERSION}[/green]")
+        else:
+            console.print(f"[green]Migrated database from schema v{previous} to v{SCHEMA_VERSION}[/green]")
+    
+    elif args.rebuild_rollups:
+        from logger import ActivityLogger
+        if ActivityLogger().rebuild_rollups(progress=console.print):
+            console.print("[green]Rebuilt report rollups[/green]")
+        else:
+            console.print("[red]Rebuilding report rollups failed, see the log for details[/red]")
+    
+    elif args.recategorize:
+        from logger import ActivityLogger
+        from recategorizer import Recategorizer
+        updated = Recategorizer(ActivityLogger()).run_once(progress=console.print)
+        if updated is None:
+            console.print("[red]Re-categorization failed, see the log for details[/red]")
+        else:
+            console.print(f"[green]Stored categories match the current rules ({updated} window/process pairs updated)[/green]")
+    
+    elif args.cleanup:
+        from logger import ActivityLogger
+        
+        def show_progress(status):
+            console.print(f"{status['phase']}: {status['deleted']} rows deleted, {status['freed_pages']} pages freed, "
+                          f"{status['rows_per_second']:.0f} rows/s")
+        if ActivityLogger().cleanup_old_data(args.retention_days, progress=show_progress):
+            console.print(f"[green]Removed activities older than {args.retention_days} days[/green]")
+        else:
+            console.print("[red]Cleanup failed, see the log for details[/red]")
+    
+    elif args.backup or args.list_backups or args.verify_backups or args.restore_backup or args.prune_backups:
+        manage_backups(args)
+    
     else:
         parser.print_help()
 
@@ -0,0 +1,575 @@
+"""
+Versioned schema for activity.db and in-place migrations between versions.
+
+The schema version lives in the meta table. Migrations copy data in small
+transactions and record their progress in meta, so an interrupted migration
+resumes where it stopped and never holds the write lock for long.
+"""
+import sqlite3
+from datetime import datetime
+from typing import Callable, Optional
+from utils import setup_logging
+import partitions
+
+logger = setup_logging()
+
+SCHEMA_VERSION = 11
+
+META_DDL = 'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)'
+
+ACTIVITY_V2_DDL = '''
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        start_ms INTEGER NOT NULL,
+        end_ms INTEGER NOT NULL,
+        window TEXT,
+        process TEXT,
+        time_spent_seconds REAL
+    )
+'''
+
+# Covering indexes: time-range totals and per-process totals never touch the table rows
+ACTIVITY_V2_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_activity_start ON activity (start_ms, time_spent_seconds)',
+    'CREATE INDEX IF NOT EXISTS idx_activity_process_start ON activity (process, start_ms, time_spent_seconds)',
+)
+
+# v3: window titles and process names are stored once in lookup tables and referenced by id
+LOOKUP_DDL = (
+    'CREATE TABLE IF NOT EXISTS process_names (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)',
+    'CREATE TABLE IF NOT EXISTS window_titles (id INTEGER PRIMARY KEY, title TEXT NOT NULL UNIQUE)',
+)
+
+ACTIVITY_V3_DDL = '''
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        start_ms INTEGER NOT NULL,
+        end_ms INTEGER NOT NULL,
+        window_id INTEGER REFERENCES window_titles (id),
+        process_id INTEGER REFERENCES process_names (id),
+        time_spent_seconds REAL
+    )
+'''
+
+# With integer ids the time-range index can cover whole rows cheaply
+ACTIVITY_V3_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_activity_start ON activity (start_ms, process_id, window_id, time_spent_seconds)',
+    'CREATE INDEX IF NOT EXISTS idx_activity_process_start ON activity (process_id, start_ms, time_spent_seconds)',
+)
+
+# v4: per hour/day totals by process and category, maintained by rollups.py
+ROLLUPS_DDL = '''
+    CREATE TABLE IF NOT EXISTS rollups (
+        granularity TEXT NOT NULL,
+        bucket_start_ms INTEGER NOT NULL,
+        process_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        is_productive INTEGER,
+        time_spent_seconds REAL NOT NULL DEFAULT 0,
+        activity_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, bucket_start_ms, process_id, category)
+    ) WITHOUT ROWID
+'''
+
+# v7: categories are stored at ingest, with the labels and rules versions dictionary-encoded.
+# Each (month, window, process) pair of activities carries the label the rules gave it and the
+# version of those rules. Labelling pairs rather than rows leaves sealed partitions untouched
+# when the rules change. An unknown window or process is stored as id 0.
+CATEGORY_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS category_labels (
+        id INTEGER PRIMARY KEY,
+        category TEXT NOT NULL,
+        subcategory TEXT NOT NULL,
+        is_productive INTEGER
+    )
+    ''',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_category_labels_unique '
+    'ON category_labels (category, subcategory, ifnull(is_productive, -1))',
+    'CREATE TABLE IF NOT EXISTS rules_versions (id INTEGER PRIMARY KEY, version TEXT NOT NULL UNIQUE)',
+    '''
+    CREATE TABLE IF NOT EXISTS pair_categories (
+        month TEXT NOT NULL,
+        window_id INTEGER NOT NULL,
+        process_id INTEGER NOT NULL,
+        label_id INTEGER NOT NULL,
+        rules_version_id INTEGER NOT NULL,
+        PRIMARY KEY (month, window_id, process_id)
+    ) WITHOUT ROWID
+    ''',
+)
+
+# v8: canonical app names (appnames.py) per process, and per window title for browsers
+# (window_id 0 otherwise), so each distinct raw name is normalized once per database
+APP_NAMES_DDL = '''
+    CREATE TABLE IF NOT EXISTS app_names (
+        process_id INTEGER NOT NULL,
+        window_id INTEGER NOT NULL,
+        app TEXT NOT NULL,
+        PRIMARY KEY (process_id, window_id)
+    ) WITHOUT ROWID
+'''
+
+# v9: daily totals per process and window title, maintained by rollups.py for per-app totals
+WINDOW_ROLLUPS_DDL = '''
+    CREATE TABLE IF NOT EXISTS window_rollups (
+        day_start_ms INTEGER NOT NULL,
+        process_id INTEGER NOT NULL,
+        window_id INTEGER NOT NULL,
+        time_spent_seconds REAL NOT NULL DEFAULT 0,
+        activity_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day_start_ms, process_id, window_id)
+    ) WITHOUT ROWID
+'''
+
+# v10: rows that arrive for a month whose partition is already sealed (see partitions.py)
+LATE_ACTIVITY_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS late_activity (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        month TEXT NOT NULL,
+        start_ms INTEGER NOT NULL,
+        end_ms INTEGER NOT NULL,
+        window_id INTEGER,
+        process_id INTEGER,
+        time_spent_seconds REAL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_late_activity_month ON late_activity (month, start_ms)',
+)
+
+# v11: data generation of the last change to each day's totals, so the watermark of a date range
+# only moves when a day it covers changes (ActivityLogger.get_range_watermark)
+DAY_GENERATIONS_DDL = '''
+    CREATE TABLE IF NOT EXISTS day_generations (
+        day_start_ms INTEGER PRIMARY KEY,
+        generation INTEGER NOT NULL
+    ) WITHOUT ROWID
+'''
+
+def create_late_activity(conn: sqlite3.Connection):
+    for ddl in LATE_ACTIVITY_DDL:
+        conn.execute(ddl)
+    conn.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'late_activity', ? "
+        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'late_activity')",
+        (partitions.LATE_ID_BASE,)
+    )
+
+def get_meta(conn: sqlite3.Connection, key: str, default=None):
+    row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+def set_meta(conn: sqlite3.Connection, key: str, value):
+    conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+def delete_meta(conn: sqlite3.Connection, key: str):
+    conn.execute('DELETE FROM meta WHERE key = ?', (key,))
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Schema version of the database, 0 for an empty file"""
+    conn.execute(META_DDL)
+    version = get_meta(conn, 'schema_version')
+    if version is not None:
+        return int(version)
+    # Databases from before versioning have an activity table and no version
+    has_activity = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activity'"
+    ).fetchone()
+    return 1 if has_activity else 0
+
+def create_schema(conn: sqlite3.Connection):
+    """Create the current schema in an empty database; activities go to partition files (partitions.py)"""
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute(META_DDL)
+    for ddl in LOOKUP_DDL:
+        conn.execute(ddl)
+    conn.execute(ROLLUPS_DDL)
+    for ddl in CATEGORY_DDL:
+        conn.execute(ddl)
+    conn.execute(APP_NAMES_DDL)
+    conn.execute(WINDOW_ROLLUPS_DDL)
+    create_late_activity(conn)
+    conn.execute(DAY_GENERATIONS_DDL)
+    set_meta(conn, 'schema_version', SCHEMA_VERSION)
+    conn.commit()
+    # The meta table may already exist, and auto_vacuum only changes on VACUUM after that
+    conn.execute('VACUUM')
+
+def to_epoch_ms(timestamp: datetime) -> int:
+    """
+    Local naive datetime -> integer milliseconds since the epoch, truncated
+    Never rounds up: a range ending at 23:59:59.999999 must stay before the next midnight
+    """
+    return int(timestamp.replace(microsecond=0).timestamp()) * 1000 + timestamp.microsecond // 1000
+
+# Value column of each single-column lookup table
+LOOKUP_COLUMNS = {'process_names': 'name', 'window_titles': 'title', 'rules_versions': 'version'}
+
+def intern_name(conn: sqlite3.Connection, table: str, value: Optional[str]) -> Optional[int]:
+    """Return the id of value in a lookup table, inserting it if needed"""
+    if value is None:
+        return None
+    column = LOOKUP_COLUMNS[table]
+    select_sql = f'SELECT id FROM {table} WHERE {column} = ?'
+    row = conn.execute(select_sql, (value,)).fetchone()
+    if row is None:
+        # OR IGNORE: another connection may have interned the same value meanwhile
+        conn.execute(f'INSERT OR IGNORE INTO {table} ({column}) VALUES (?)', (value,))
+        row = conn.execute(select_sql, (value,)).fetchone()
+    return row[0]
+
+def intern_label(conn: sqlite3.Connection, category: str, subcategory: str, is_productive: Optional[bool]) -> int:
+    """Return the id of a (category, subcategory, is_productive) label, inserting it if needed"""
+    params = (category, subcategory or '', None if is_productive is None else int(is_productive))
+    select_sql = 'SELECT id FROM category_labels WHERE category = ? AND subcategory = ? AND is_productive IS ?'
+    row = conn.execute(select_sql, params).fetchone()
+    if row is None:
+        conn.execute('INSERT OR IGNORE INTO category_labels (category, subcategory, is_productive) VALUES (?, ?, ?)',
+                     params)
+        row = conn.execute(select_sql, params).fetchone()
+    return row[0]
+
+def _copy_in_chunks(conn: sqlite3.Connection, version: int, select_sql: str, convert, insert_sql: str,
+                    finalize, chunk_size: int, progress: Optional[Callable[[str], None]]):
+    """
+    Copy activity rows into a new table chunk by chunk, keyed on id.
+    The last copied id is committed with each chunk so the copy can resume;
+    finalize(conn) runs in the same transaction as the final catch-up chunk.
+    """
+    progress_key = f'migration_v{version}_last_id'
+    total = conn.execute('SELECT COUNT(*) FROM activity').fetchone()[0]
+    
+    def copy_chunk(limit: Optional[int]) -> int:
+        last_id = int(get_meta(conn, progress_key, 0))
+        query = select_sql + ' WHERE id > ? ORDER BY id'
+        params = [last_id]
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        rows = conn.execute(query, params).fetchall()
+        conn.executemany(insert_sql, convert(rows))
+        if rows:
+            set_meta(conn, progress_key, rows[-1][0])
+        return len(rows)
+    
+    copied = 0
+    while True:
+        # Each chunk is its own short transaction; progress is committed with the rows
+        conn.execute('BEGIN IMMEDIATE')
+        count = copy_chunk(chunk_size)
+        conn.commit()
+        copied += count
+        if progress and count:
+            progress(f"Migrated {copied}/{total} activities to schema v{version}")
+        if count < chunk_size:
+            break
+    
+    # Pick up rows written while we were copying, then swap the tables atomically
+    conn.execute('BEGIN IMMEDIATE')
+    copy_chunk(None)
+    finalize(conn)
+    delete_meta(conn, progress_key)
+    set_meta(conn, 'schema_version', version)
+    conn.commit()
+
+def _parse_v1_timestamp(value) -> Optional[datetime]:
+    """v1 rows hold '%Y-%m-%d %H:%M:%S' from batch inserts and str(datetime) with microseconds from single inserts"""
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def _migrate_v1_to_v2(conn: sqlite3.Connection, chunk_size: int, progress: Optional[Callable[[str], None]]):
+    """TEXT timestamps -> epoch-millisecond start/end columns plus covering indexes"""
+    conn.execute(ACTIVITY_V2_DDL.format(table='IF NOT EXISTS activity_v2'))
+    conn.commit()
+    skipped = 0
+    
+    def convert(rows):
+        nonlocal skipped
+        data = []
+        for row_id, timestamp, window, process, time_spent in rows:
+            started = _parse_v1_timestamp(timestamp)
+            if started is None:
+                skipped += 1
+                continue
+            start_ms = to_epoch_ms(started)
+            time_spent = time_spent or 0.0
+            data.append((row_id, start_ms, start_ms + int(round(time_spent * 1000)), window, process, time_spent))
+        return data
+    
+    def finalize(conn):
+        conn.execute('DROP TABLE activity')
+        conn.execute('ALTER TABLE activity_v2 RENAME TO activity')
+        for ddl in ACTIVITY_V2_INDEXES:
+            conn.execute(ddl)
+    
+    _copy_in_chunks(
+        conn, 2,
+        'SELECT id, timestamp, window, process, time_spent_seconds FROM activity',
+        convert,
+        '''
+            INSERT OR REPLACE INTO activity_v2 (id, start_ms, end_ms, window, process, time_spent_seconds)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''',
+        finalize, chunk_size, progress
+    )
+    if skipped:
+        logger.warning(f"Skipped {skipped} activities with unreadable timestamps during migration")
+
+def _migrate_v2_to_v3(conn: sqlite3.Connection, chunk_size: int, progress: Optional[Callable[[str], None]]):
+    """Window titles and process names -> ids into lookup tables"""
+    for ddl in LOOKUP_DDL:
+        conn.execute(ddl)
+    conn.execute(ACTIVITY_V3_DDL.format(table='IF NOT EXISTS activity_v3'))
+    conn.commit()
+    ids = {}
+    
+    def lookup(table, value):
+        key = (table, value)
+        if key not in ids:
+            ids[key] = intern_name(conn, table, value)
+        return ids[key]
+    
+    def convert(rows):
+        return [
+            (row_id, start_ms, end_ms, lookup('window_titles', window), lookup('process_names', process), time_spent)
+            for row_id, start_ms, end_ms, window, process, time_spent in rows
+        ]
+    
+    def finalize(conn):
+        conn.execute('DROP TABLE activity')
+        conn.execute('ALTER TABLE activity_v3 RENAME TO activity')
+        for ddl in ACTIVITY_V3_INDEXES:
+            conn.execute(ddl)
+    
+    _copy_in_chunks(
+        conn, 3,
+        'SELECT id, start_ms, end_ms, window, process, time_spent_seconds FROM activity',
+        convert,
+        '''
+            INSERT OR REPLACE INTO activity_v3 (id, start_ms, end_ms, window_id, process_id, time_spent_seconds)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''',
+        finalize, chunk_size, progress
+    )
+    # The old table's pages are free now; give them back to the filesystem.
+    # Switching auto_vacuum here as well spares v5 a second full VACUUM.
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+
+def _migrate_v3_to_v4(conn: sqlite3.Connection, chunk_size: int, progress: Optional[Callable[[str], None]]):
+    """Add the rollups table and fill it from the existing activities"""
+    from rollups import rebuild_rollups
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute(ROLLUPS_DDL)
+    rebuild_rollups(conn, progress=progress, windows=False)
+    set_meta(conn, 'schema_version', 4)
+    conn.commit()
+
+def _migrate_v4_to_v5(conn: sqlite3.Connection, chunk_size: int, progress: Optional[Callable[[str], None]]):
+    """Incremental auto_vacuum, so retention cleanup can give space back without a full VACUUM"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        if progress:
+            progress("Rewriting the database to enable incremental vacuum")
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    set_meta(conn, 'schema_version', 5)
+    conn.commit()
+
+def _migrate_v5_to_v6(conn: sqlite3.Connection, chunk_size: int, progress: Optional[Callable[[str], None]]):
+    """Move activities out of activity.db into monthly partition files"""
+    catalog_path = next(row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main')
+    progress_key = 'migration_v6_last_id'
+    total = conn.execute('SELECT COUNT(*) FROM activity').fetchone()[0]
+    targets = {}
+    
+    def copy_chunk(limit: Optional[int]) -> int:
+        last_id = int(get_meta(conn, progress_key, 0))
+        query = 'SELECT id, start_ms, end_ms, window_id, process_id, time_spent_seconds FROM activity WHERE id > ? ORDER BY id'
+        params = [last_id]
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        rows = conn.execute(query, params).fetchall()
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(partitions.month_key_of_ms(row[1]), []).append(row)
+        for key, month_rows in by_month.items():
+            if key not in targets:
+                path = partitions.partition_path(catalog_path, key)
+                partitions.create_partition(path, key)
+                targets[key] = sqlite3.connect(path, timeout=10.0)
+            # Ids are kept; OR REPLACE makes re-copying after an interruption harmless
+            targets[key].executemany(
+                'INSERT OR REPLACE INTO activity (id, start_ms, end_ms, window_id, process_id, time_spent_seconds) '
+                'VALUES (?, ?, ?, ?, ?, ?)', month_rows
+            )
+            # Partition rows are committed before the progress that covers them
+            targets[key].commit()
+        if rows:
+            set_meta(conn, progress_key, rows[-1][0])
+        return len(rows)
+    
+    try:
+        copied = 0
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            count = copy_chunk(chunk_size)
+            conn.commit()
+            copied += count
+            if progress and count:
+                progress(f"Moved {copied}/{total} activities into monthly partitions")
+            if count < chunk_size:
+                break
+        
+        # Pick up rows written meanwhile and drop the old table in one transaction
+        conn.execute('BEGIN IMMEDIATE')
+        copy_chunk(None)
+        conn.execute('DROP TABLE activity')
+        delete_meta(conn, progress_key)
+        set_meta(conn, 'schema_version', 6)
+        conn.commit()
+    finally:
+        for target in targets.values():
+            target.close()
+    # Give the old table's pages back; v5 made auto_vacuum incremental
+    conn.executescript('PRAGMA incremental_vacuum')
+
+def _migrate_v6_to_v7(conn: sqlite3.Connection, chunk_size: int, progress: Optional[Callable[[str], None]]):
+    """Categorize every (month, window, process) pair once and rebuild the rollups from the stored labels"""
+    import rules
+    from rollups import rebuild_rollups
+    for ddl in CATEGORY_DDL:
+        conn.execute(ddl)
+    conn.commit()
+    catalog_path = next(row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main')
+    engine = rules.get_database_engine(catalog_path)
+    labels = {}
+    
+    # One month per transaction; months whose pairs are already stored are done
+    for key in partitions.list_partitions(catalog_path):
+        if conn.execute('SELECT 1 FROM pair_categories WHERE month = ? LIMIT 1', (key,)).fetchone():
+            continue
+        conn.execute('ATTACH DATABASE ? AS partition', (partitions.partition_path(catalog_path, key),))
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            version_id = intern_name(conn, 'rules_versions', engine.version)
+            pairs = conn.execute('''
+                SELECT DISTINCT activity.window_id, activity.process_id, window_titles.title, process_names.name
+                FROM partition.activity AS activity
+                LEFT JOIN window_titles ON window_titles.id = activity.window_id
+                LEFT JOIN process_names ON process_names.id = activity.process_id
+            ''').fetchall()
+            data = []
+            for window_id, process_id, title, name in pairs:
+                label = engine.categorize(title, name)
+                if label not in labels:
+                    labels[label] = intern_label(conn, *label)
+                data.append((key, window_id or 0, process_id or 0, labels[label], version_id))
+            conn.executemany('INSERT OR REPLACE INTO pair_categories VALUES (?, ?, ?, ?, ?)', data)
+            month_start, month_end = partitions.month_bounds(key)
+            rebuild_rollups(conn, to_epoch_ms(month_start), to_epoch_ms(month_end),
+                            table='partition.activity', month=key, windows=False)
+            conn.commit()
+        finally:
+            conn.rollback()
+            conn.execute('DETACH DATABASE partition')
+        if progress:
+            progress(f"Categorized {len(pairs)} window/process pairs of {key.replace('_', '-')}")
+    
+    set_meta(conn, 'rollups_rules_version', engine.version)
+    set_meta(conn, 'schema_version', 7)
+    conn.commit()
+
+def _migrate_v7_to_v8(conn: sqlite3.Connection, chunk_size: int, progress: Optional[Callable[[str], None]]):
+    """Add the app name table; names are filled in as reports ask for them"""
+    conn.execute(APP_NAMES_DDL)
+    set_meta(conn, 'schema_version', 8)
+    conn.commit()
+
+def _migrate_v8_to_v9(conn: sqlite3.Connection, chunk_size: int, progress: Optional[Callable[[str], None]]):
+    """Add the per-window daily totals and fill them one month per transaction"""
+    from rollups import rebuild_rollups
+    conn.execute(WINDOW_ROLLUPS_DDL)
+    conn.commit()
+    catalog_path = next(row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main')
+    
+    for key in partitions.list_partitions(catalog_path):
+        month_start, month_end = (to_epoch_ms(bound) for bound in partitions.month_bounds(key))
+        # Months that already have totals were done before an interruption
+        if conn.execute('SELECT 1 FROM window_rollups WHERE day_start_ms >= ? AND day_start_ms < ? LIMIT 1',
+                        (month_start, month_end)).fetchone():
+            continue
+        conn.execute('ATTACH DATABASE ? AS partition', (partitions.partition_path(catalog_path, key),))
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            count = rebuild_rollups(conn, month_start, month_end, table='partition.activity', month=key)
+            conn.commit()
+        finally:
+            conn.rollback()
+            conn.execute('DETACH DATABASE partition')
+        if progress:
+            progress(f"Summed {count} activities of {key.replace('_', '-')} per window")
+    
+    set_meta(conn, 'schema_version', 9)
+    conn.commit()
+
+def _migrate_v9_to_v10(conn: sqlite3.Connection, chunk_size: int, progress: Optional[Callable[[str], None]]):
+    """Add the table for late rows of sealed months"""
+    create_late_activity(conn)
+    set_meta(conn, 'schema_version', 10)
+    conn.commit()
+
+def _migrate_v10_to_v11(conn: sqlite3.Connection, chunk_size: int, progress: Optional[Callable[[str], None]]):
+    """Add the per-day generations, starting every stored day at the current data generation"""
+    conn.execute(DAY_GENERATIONS_DDL)
+    conn.execute(
+        "INSERT OR IGNORE INTO day_generations (day_start_ms, generation) "
+        "SELECT DISTINCT bucket_start_ms, ? FROM rollups WHERE granularity = 'day'",
+        (int(get_meta(conn, 'data_generation', 0)),)
+    )
+    set_meta(conn, 'schema_version', 11)
+    conn.commit()
+
+MIGRATIONS = {
+    1: _migrate_v1_to_v2,
+    2: _migrate_v2_to_v3,
+    3: _migrate_v3_to_v4,
+    4: _migrate_v4_to_v5,
+    5: _migrate_v5_to_v6,
+    6: _migrate_v6_to_v7,
+    7: _migrate_v7_to_v8,
+    8: _migrate_v8_to_v9,
+    9: _migrate_v9_to_v10,
+    10: _migrate_v10_to_v11,
+}
+
+def migrate(conn: sqlite3.Connection, chunk_size: int = 5000,
+            progress: Optional[Callable[[str], None]] = None) -> int:
+    """
+    Bring the database up to SCHEMA_VERSION, creating it if empty
+    Returns the schema version the database was at before migrating
+    """
+    version = get_schema_version(conn)
+    conn.commit()
+    if version == 0:
+        create_schema(conn)
+        return 0
+    start_version = version
+    while version < SCHEMA_VERSION:
+        logger.info(f"Migrating database from schema v{version} to v{version + 1}")
+        MIGRATIONS[version](conn, chunk_size, progress)
+        version += 1
+    return start_version
+
+def migrate_database(db_path: str, chunk_size: int = 5000,
+                     progress: Optional[Callable[[str], None]] = None) -> int:
+    """Open db_path and migrate it; safe to re-run after an interruption"""
+    conn = sqlite3.connect(db_path, timeout=10.0)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+        return migrate(conn, chunk_size, progress)
+    finally:
+        conn.close()
@@ -0,0 +1,160 @@
+"""
+Monthly partition files for activity rows.
+
+activity.db is the catalog: meta, the window title/process name lookups and the
+rollups. Activities live in one file per local calendar month next to it:
+    
+    activity.db
+    activity_partitions/activity_2026_10.db
+
+Hot-path writes, backups and vacuum only touch the current month. Retention drops
+whole files. Once a month is over for SEAL_AFTER_DAYS, its file is switched out of
+WAL mode and made read-only, and readers attach it as immutable. A sealed file is
+never written again: SQLite gives wrong results to readers of an immutable file that
+changes under them. Rows that arrive late for a sealed month go to the catalog's
+late_activity table instead, and retention only ever drops a sealed month whole.
+"""
+import os
+import sqlite3
+import stat
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Late journal replays can still land in last month's file for a while after it ends
+SEAL_AFTER_DAYS = 7
+
+# Each partition hands out ids from its own range so ids stay unique across files
+ID_RANGE_BITS = 32
+
+# Ids of late_activity rows in the catalog, above every partition's range
+LATE_ID_BASE = 1 << 62
+
+# Holds the last journal seq committed to the partition, see ActivityLogger._log_batch
+PARTITION_META_DDL = 'CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT)'
+
+PARTITION_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS activity (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        start_ms INTEGER NOT NULL,
+        end_ms INTEGER NOT NULL,
+        window_id INTEGER,
+        process_id INTEGER,
+        time_spent_seconds REAL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_activity_start ON activity (start_ms, process_id, window_id, time_spent_seconds)',
+    'CREATE INDEX IF NOT EXISTS idx_activity_process_start ON activity (process_id, start_ms, time_spent_seconds)',
+    PARTITION_META_DDL.format(table='meta'),
+)
+
+def month_key(timestamp: datetime) -> str:
+    return timestamp.strftime('%Y_%m')
+
+def month_key_of_ms(epoch_ms: int) -> str:
+    return month_key(datetime.fromtimestamp(epoch_ms / 1000))
+
+def month_bounds(key: str) -> Tuple[datetime, datetime]:
+    """Local start of the month and start of the next month"""
+    start = datetime.strptime(key, '%Y_%m')
+    next_start = (start + timedelta(days=32)).replace(day=1)
+    return start, next_start
+
+def schema_name(key: str) -> str:
+    """Name the partition is attached under"""
+    return 'p' + key
+
+def id_base(key: str) -> int:
+    year, month = (int(part) for part in key.split('_'))
+    return (year * 12 + month - 1) << ID_RANGE_BITS
+
+def partitions_dir(catalog_path: str) -> str:
+    base = os.path.splitext(os.path.basename(catalog_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(catalog_path)), f'{base}_partitions')
+
+def partition_path(catalog_path: str, key: str) -> str:
+    base = os.path.splitext(os.path.basename(catalog_path))[0]
+    return os.path.join(partitions_dir(catalog_path), f'{base}_{key}.db')
+
+def list_partitions(catalog_path: str, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> List[str]:
+    """Month keys of existing partitions overlapping [start, end], oldest first"""
+    directory = partitions_dir(catalog_path)
+    if not os.path.isdir(directory):
+        return []
+    prefix = os.path.splitext(os.path.basename(catalog_path))[0] + '_'
+    keys = []
+    for filename in os.listdir(directory):
+        if not (filename.startswith(prefix) and filename.endswith('.db')):
+            continue
+        key = filename[len(prefix):-3]
+        try:
+            month_start, month_end = month_bounds(key)
+        except ValueError:
+            continue
+        if (start is None or month_end > start) and (end is None or month_start <= end):
+            keys.append(key)
+    return sorted(keys)
+
+def create_partition(path: str, key: str):
+    """Create the partition file if needed; safe to call concurrently from several processes"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10.0)
+    try:
+        # Only takes effect while the file has no tables yet
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+        for ddl in PARTITION_DDL:
+            conn.execute(ddl)
+        conn.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT 'activity', ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'activity')",
+            (id_base(key),)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def is_sealed(path: str) -> bool:
+    # Permission bits rather than os.access, which is always True for root
+    return os.path.exists(path) and not os.stat(path).st_mode & stat.S_IWUSR
+
+def attach_uri(path: str, sealed: bool) -> str:
+    """URI to ATTACH a partition; sealed files are opened read-only without locking"""
+    uri = Path(path).resolve().as_uri()
+    return uri + '?mode=ro&immutable=1' if sealed else uri
+
+def should_seal(key: str, now: Optional[datetime] = None) -> bool:
+    _, month_end = month_bounds(key)
+    return (now or datetime.now()) >= month_end + timedelta(days=SEAL_AFTER_DAYS)
+
+def seal_partition(path: str) -> bool:
+    """
+    Checkpoint a finished month, leave WAL mode and make the file read-only
+    Returns False if another connection still has it open for writing
+    """
+    conn = sqlite3.connect(path, timeout=1.0)
+    try:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        mode = conn.execute('PRAGMA journal_mode = DELETE').fetchone()[0]
+        if mode.lower() != 'delete':
+            return False
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+    os.chmod(path, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+    return True
+
+def unseal_partition(path: str):
+    """Make a sealed partition writable again, e.g. to replace or delete the file"""
+    os.chmod(path, stat.S_IREAD | stat.S_IWRITE | stat.S_IRGRP | stat.S_IROTH)
+
+def remove_partition(path: str):
+    """Delete a partition file together with its WAL files"""
+    if is_sealed(path):
+        unseal_partition(path)
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import Optional
+from utils import setup_logging
+
+logger = setup_logging()
+
+class Recategorizer:
+    """
+    Brings stored categories up to date with the categorization rules on a background thread.
+    Activities are categorized once, when they are written, and tagged with the rules version.
+    After the rules change, only the window/process pairs categorized by other rules are
+    re-categorized, newest month first, in small batches with a pause after each, so the
+    tracker keeps writing meanwhile. Once nothing is stale, the rules version is recorded in
+    meta as rollups_rules_version.
+    """
+    def __init__(self, activity_logger, interval: float = 30.0, batch_size: int = 500, pause: float = 0.05):
+        """
+        interval: seconds between checks for changed rules
+        batch_size: window/process pairs re-categorized per transaction
+        pause: seconds between batches
+        """
+        self.logger = activity_logger
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.pairs_updated = 0
+        self.runs = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="recategorizer", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: Optional[float] = None):
+        """Stop after the batch in progress"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def run_once(self, progress=None) -> Optional[int]:
+        """
+        Re-categorize everything categorized by rules other than the current ones
+        progress receives a message after each month
+        Returns the number of pairs updated, None if stopped or interrupted by an error
+        """
+        # One compiled rule set for the whole run; a newer one is picked up by the next run
+        compiled = self.logger.rules.current()
+        updated = 0
+        for key in self.logger.stale_category_months(compiled.version):
+            month_updated = 0
+            while True:
+                if self._stop_event.is_set():
+                    return None
+                count = self.logger.recategorize_batch(key, compiled, self.batch_size)
+                if count is None:
+                    return None
+                month_updated += count
+                self.pairs_updated += count
+                if count < self.batch_size:
+                    break
+                time.sleep(self.pause)
+            updated += month_updated
+            if progress:
+                progress(f"Re-categorized {month_updated} window/process pairs in {key.replace('_', '-')}")
+        if self.logger.get_meta('rollups_rules_version') != compiled.version:
+            self.logger.set_meta('rollups_rules_version', compiled.version)
+            logger.info(f"Categories are up to date with rules {compiled.version} ({updated} pairs changed)")
+        self.runs += 1
+        return updated
+    
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "pairs_updated": self.pairs_updated,
+            "rules_version": self.logger.get_meta('rollups_rules_version'),
+        }
+    
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Re-categorization failed: {e}")
+            if self._stop_event.wait(self.interval):
+                break
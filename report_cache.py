@@ -0,0 +1,91 @@
+"""
+Content-addressed cache for generated HTML reports.
+
+A report is fully determined by its inputs: the date range, the categorization
+rules version, the watermark of the range (ActivityLogger.get_range_watermark,
+moved by every insert, delete, rebuild and re-categorization touching a day of
+the range) and the rendering options.
+The SHA-256 of those inputs names the report file, so asking for the same report
+again while nothing relevant changed returns the existing file without querying
+or rendering anything.
+
+The reports directory is kept under a size limit by deleting the least recently
+used reports first; a cache hit refreshes the file's mtime.
+"""
+import hashlib
+import json
+import os
+from typing import Iterable, Optional
+from utils import setup_logging
+
+logger = setup_logging()
+
+# Bump when the report layout changes, so reports rendered by older code are not reused
+REPORT_FORMAT_VERSION = 1
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+class ReportCache:
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(**inputs) -> str:
+        """Hash of everything the report content depends on"""
+        inputs['format'] = REPORT_FORMAT_VERSION
+        encoded = json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()[:24]
+    
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f'report_{key}.html')
+    
+    def get(self, key: str) -> Optional[str]:
+        """Path of the cached report, None if it has to be generated"""
+        path = self.path(key)
+        try:
+            # Mark it as recently used for eviction
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+    
+    def evict(self, keep: Iterable[str] = ()) -> int:
+        """
+        Delete the least recently used reports until the directory fits in max_bytes
+        Reports in keep are never deleted
+        Returns the number of reports deleted
+        """
+        keep = {os.path.abspath(path) for path in keep}
+        reports = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith('.html'):
+                        stat_result = entry.stat()
+                        reports.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+        except OSError as e:
+            logger.warning(f"Could not list reports in {self.directory}: {e}")
+            return 0
+        
+        total = sum(size for _, size, _ in reports)
+        deleted = 0
+        for _, size, path in sorted(reports):
+            if total <= self.max_bytes:
+                break
+            if os.path.abspath(path) in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not delete report {path}: {e}")
+                continue
+            total -= size
+            deleted += 1
+        return deleted
+    
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,198 @@
+"""
+Aggregation of report totals over a date range.
+
+The totals come from the day and hourly rollups, so even a year takes a few
+indexed queries on one read-only connection to activity.db. Batch reports read
+the range's hourly totals once and split them into day or week periods in memory.
+Aggregating day or week shards in a process pool was measured to gain nothing:
+each shard's connection costs more than its queries.
+"""
+import sqlite3
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from migrations import to_epoch_ms
+from utils import setup_logging
+
+logger = setup_logging()
+
+# Report totals, aggregated in SQLite so only one row per group comes back
+SELECT_CATEGORY_TOTALS_SQL = '''
+    SELECT category, is_productive, SUM(time_spent_seconds) FROM rollups
+    WHERE granularity = 'day' AND bucket_start_ms >= ? AND bucket_start_ms < ?
+    GROUP BY category, is_productive
+'''
+# Grouped first, so the lookups are joined once per (process, window) group rather than per row
+SELECT_WINDOW_TOTALS_SQL = '''
+    SELECT process_names.name, window_titles.title, totals.time_spent
+    FROM (
+        SELECT process_id, window_id, SUM(time_spent_seconds) AS time_spent
+        FROM window_rollups WHERE day_start_ms >= ? AND day_start_ms < ?
+        GROUP BY process_id, window_id
+    ) AS totals
+    LEFT JOIN process_names ON process_names.id = totals.process_id
+    LEFT JOIN window_titles ON window_titles.id = totals.window_id
+'''
+SELECT_HOURLY_TOTALS_SQL = '''
+    SELECT bucket_start_ms, SUM(time_spent_seconds) FROM rollups
+    WHERE granularity = 'hour' AND bucket_start_ms >= ? AND bucket_start_ms < ?
+    GROUP BY bucket_start_ms
+'''
+SELECT_HOURLY_CATEGORY_TOTALS_SQL = '''
+    SELECT bucket_start_ms, category, is_productive, SUM(time_spent_seconds) FROM rollups
+    WHERE granularity = 'hour' AND bucket_start_ms >= ? AND bucket_start_ms < ?
+    GROUP BY bucket_start_ms, category, is_productive
+'''
+SELECT_DAY_RANGE_SQL = "SELECT MIN(bucket_start_ms), MAX(bucket_start_ms) FROM rollups WHERE granularity = 'day'"
+
+class ReportTotals:
+    """Partial or merged report aggregates for a date range"""
+    def __init__(self):
+        # (category, is_productive) -> seconds
+        self.categories: Dict[Tuple[str, Optional[bool]], float] = {}
+        # (process, window) -> seconds; turned into app names by ActivityLogger.get_app_names
+        self.windows: Dict[Tuple[Optional[str], Optional[str]], float] = {}
+        # hour bucket start in epoch ms -> seconds
+        self.hours: Dict[int, float] = {}
+    
+    def merge(self, other: 'ReportTotals') -> 'ReportTotals':
+        for mine, theirs in ((self.categories, other.categories), (self.windows, other.windows),
+                             (self.hours, other.hours)):
+            for key, seconds in theirs.items():
+                mine[key] = mine.get(key, 0.0) + seconds
+        return self
+    
+    def productivity(self) -> Tuple[float, float, float]:
+        """(productive, unproductive, neutral) seconds"""
+        totals = {True: 0.0, False: 0.0, None: 0.0}
+        for (_, is_productive), seconds in self.categories.items():
+            totals[is_productive] += seconds
+        return totals[True], totals[False], totals[None]
+    
+    def category_totals(self) -> Dict[str, float]:
+        totals = {}
+        for (category, _), seconds in self.categories.items():
+            totals[category] = totals.get(category, 0.0) + seconds
+        return totals
+    
+    def app_totals(self, activity_logger) -> Dict[str, float]:
+        """Seconds per canonical app name"""
+        totals = {}
+        for pair, app in activity_logger.get_app_names(self.windows).items():
+            totals[app] = totals.get(app, 0.0) + self.windows[pair]
+        return totals
+    
+    def __bool__(self) -> bool:
+        return bool(self.categories or self.windows)
+
+def connect_read_only(db_path: str) -> sqlite3.Connection:
+    """Read-only connection that never takes a write lock or creates files"""
+    return sqlite3.connect(Path(db_path).resolve().as_uri() + '?mode=ro', uri=True, timeout=10.0)
+
+def aggregate_range(db_path: str, start_ms: int, end_ms: int) -> ReportTotals:
+    """Totals of the day buckets in [start_ms, end_ms)"""
+    totals = ReportTotals()
+    conn = connect_read_only(db_path)
+    try:
+        # One read transaction, so the three queries see the same data
+        conn.execute('BEGIN')
+        for category, is_productive, seconds in conn.execute(SELECT_CATEGORY_TOTALS_SQL, (start_ms, end_ms)):
+            totals.categories[(category, None if is_productive is None else bool(is_productive))] = seconds or 0.0
+        for process, window, seconds in conn.execute(SELECT_WINDOW_TOTALS_SQL, (start_ms, end_ms)):
+            totals.windows[(process, window)] = seconds or 0.0
+        for bucket_ms, seconds in conn.execute(SELECT_HOURLY_TOTALS_SQL, (start_ms, end_ms)):
+            totals.hours[bucket_ms] = seconds or 0.0
+    finally:
+        conn.close()
+    return totals
+
+def split_range(start: datetime, end: datetime, per: str = 'day') -> List[Tuple[datetime, datetime]]:
+    """
+    Consecutive [period_start, period_end) days or Monday-based weeks covering the days from start to end
+    The first and last week are clipped to those days, so no period reaches outside the range
+    """
+    step = timedelta(days=7 if per == 'week' else 1)
+    first_day = datetime.combine(start.date(), datetime.min.time())
+    # Calendar arithmetic on the date, so DST changes don't shift the boundaries
+    range_end = datetime.combine(end.date() + timedelta(days=1), datetime.min.time())
+    period_start = first_day
+    if per == 'week':
+        period_start -= timedelta(days=period_start.weekday())
+    periods = []
+    while period_start <= end:
+        period_end = datetime.combine(period_start.date() + step, datetime.min.time())
+        periods.append((max(period_start, first_day), min(period_end, range_end)))
+        period_start = period_end
+    return periods
+
+class ReportEngine:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+    
+    def data_range(self) -> Optional[Tuple[datetime, datetime]]:
+        """First and last day with any activity, None for an empty database"""
+        conn = connect_read_only(self.db_path)
+        try:
+            first_ms, last_ms = conn.execute(SELECT_DAY_RANGE_SQL).fetchone()
+        finally:
+            conn.close()
+        if first_ms is None:
+            return None
+        return datetime.fromtimestamp(first_ms / 1000), datetime.fromtimestamp(last_ms / 1000)
+    
+    def _resolve_range(self, start_date: Optional[datetime], end_date: Optional[datetime]) -> Tuple:
+        """Missing bounds default to the first and last day with data; (None, None) for an empty database"""
+        if start_date is None or end_date is None:
+            data_range = self.data_range()
+            if data_range is None:
+                return None, None
+            start_date = start_date or data_range[0]
+            end_date = end_date or data_range[1]
+        return start_date, end_date
+    
+    def aggregate(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> ReportTotals:
+        """Totals of the days from start_date to end_date, the whole history by default"""
+        try:
+            start_date, end_date = self._resolve_range(start_date, end_date)
+            if start_date is None:
+                return ReportTotals()
+            first_day = datetime.combine(start_date.date(), datetime.min.time())
+            range_end = datetime.combine(end_date.date() + timedelta(days=1), datetime.min.time())
+            return aggregate_range(self.db_path, to_epoch_ms(first_day), to_epoch_ms(range_end))
+        except sqlite3.Error as e:
+            logger.error(f"Error aggregating report totals: {e}")
+            return ReportTotals()
+    
+    def aggregate_periods(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                          per: str = 'day') -> List[Tuple[datetime, datetime, ReportTotals]]:
+        """
+        Category and hourly totals of each day or week from start_date to end_date
+        The whole range is read with one query and split into periods in memory; windows stay empty
+        Returns (period_start, period_end, totals) per period, period_end exclusive
+        """
+        try:
+            start_date, end_date = self._resolve_range(start_date, end_date)
+            if start_date is None:
+                return []
+            periods = split_range(start_date, end_date, per)
+            if not periods:
+                return []
+            bounds = [to_epoch_ms(period_start) for period_start, _ in periods]
+            period_totals = [ReportTotals() for _ in periods]
+            
+            conn = connect_read_only(self.db_path)
+            try:
+                rows = conn.execute(SELECT_HOURLY_CATEGORY_TOTALS_SQL, (bounds[0], to_epoch_ms(periods[-1][1])))
+                for bucket_ms, category, is_productive, seconds in rows:
+                    totals = period_totals[bisect_right(bounds, bucket_ms) - 1]
+                    key = (category, None if is_productive is None else bool(is_productive))
+                    totals.categories[key] = totals.categories.get(key, 0.0) + (seconds or 0.0)
+                    totals.hours[bucket_ms] = totals.hours.get(bucket_ms, 0.0) + (seconds or 0.0)
+            finally:
+                conn.close()
+            return [(period_start, period_end, totals)
+                    for (period_start, period_end), totals in zip(periods, period_totals)]
+        except sqlite3.Error as e:
+            logger.error(f"Error aggregating report periods: {e}")
+            return []
@@ -1,15 +1,15 @@
 from datetime import datetime, timedelta
-from collections import defaultdict
 from logger import ActivityLogger
+from report_engine import ReportEngine
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 from rich.text import Text
-from categories import categorize_activity
 
 class ReportGenerator:
     def __init__(self):
         self.logger = ActivityLogger()
+        self.engine = ReportEngine(self.logger.db_path)
         self.console = Console()
     
     def _get_time_range(self, days=0):
@@ -27,22 +27,6 @@ class ReportGenerator:
             return f"{minutes:.1f} minutes"
         return f"{hours:.2f} hours"
     
-    def _simplify_app_name(self, window_title, process_name):
-        # Common browser names
-        browsers = ["chrome", "firefox", "edge", "safari", "opera"]
-        
-        # Check if it's a browser
-        for browser in browsers:
-            if browser.lower() in process_name.lower():
-                # Extract domain or service name from window title
-                if " - " in window_title:
-                    service = window_title.split(" - ")[-1]
-                    return f"{browser.capitalize()} - {service}"
-                return browser.capitalize()
-        
-        # For standalone apps, just return the process name
-        return process_name
-    
     def _create_productivity_table(self, productive_time, unproductive_time, neutral_time):
         table = Table(show_header=True, header_style="bold magenta", title="Productivity Summary")
         table.add_column("Type", style="cyan")
@@ -100,35 +84,17 @@ class ReportGenerator:
         return table
     
     def generate_report(self, start_date=None, end_date=None):
-        activities = self.logger.get_activities(start_date, end_date)
-        
-        # Initialize dictionaries for tracking
-        time_by_category = defaultdict(float)
-        time_by_app = defaultdict(float)
-        productive_time = 0
-        unproductive_time = 0
-        neutral_time = 0
-        
-        for _, _, window, process, time_spent in activities:
-            category, subcategory, is_productive = categorize_activity(window, process)
-            
-            # Update category totals
-            time_by_category[category] += time_spent
-            
-            # Simplify app name and update app totals
-            simplified_app = self._simplify_app_name(window, process)
-            time_by_app[simplified_app] += time_spent
-            
-            # Update productivity totals
-            if is_productive:
-                productive_time += time_spent
-            elif is_productive is False:
-                unproductive_time += time_spent
-            else:
-                neutral_time += time_spent
+        # Read from the rollups, a few queries for any range
+        totals = self.engine.aggregate(start_date, end_date)
+        productive_time, unproductive_time, neutral_time = totals.productivity()
+        time_by_category = totals.category_totals()
+        time_by_app = totals.app_totals(self.logger)
         
         # Print all three tables with clear separation
         self.console.print("\n")
+        if not self.logger.rollups_match_rules():
+            self.console.print("[yellow]The categorization rules changed and past activity is still being "
+                               "re-categorized; run with --recategorize to finish it now.[/yellow]")
         self.console.print(self._create_productivity_table(productive_time, unproductive_time, neutral_time))
         self.console.print("\n")
         self.console.print(self._create_category_table(time_by_category))
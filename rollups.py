@@ -0,0 +1,211 @@
+"""
+Pre-aggregated time totals per hour and per day, by process and category.
+
+ActivityLogger updates the rollups in the same transaction that inserts the
+activities, so reports and the dashboard read a handful of rows per bucket
+instead of every raw activity. An activity counts towards the buckets its
+start time falls in, the same way the reports have always attributed time.
+
+window_rollups holds daily totals per process and window title, which is what
+per-application totals need (browser app names depend on the title).
+"""
+import sqlite3
+from datetime import datetime
+from typing import Callable, Optional, Set
+import rules
+from migrations import to_epoch_ms
+
+GRANULARITIES = ('hour', 'day')
+
+UPSERT_ROLLUP_SQL = '''
+    INSERT INTO rollups (granularity, bucket_start_ms, process_id, category, is_productive,
+                         time_spent_seconds, activity_count)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, bucket_start_ms, process_id, category) DO UPDATE SET
+        is_productive = excluded.is_productive,
+        time_spent_seconds = time_spent_seconds + excluded.time_spent_seconds,
+        activity_count = activity_count + excluded.activity_count
+'''
+
+UPSERT_WINDOW_ROLLUP_SQL = '''
+    INSERT INTO window_rollups (day_start_ms, process_id, window_id, time_spent_seconds, activity_count)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (day_start_ms, process_id, window_id) DO UPDATE SET
+        time_spent_seconds = time_spent_seconds + excluded.time_spent_seconds,
+        activity_count = activity_count + excluded.activity_count
+'''
+
+# Buckets a re-categorization emptied
+DELETE_EMPTY_ROLLUP_SQL = '''
+    DELETE FROM rollups
+    WHERE granularity = ? AND bucket_start_ms = ? AND process_id = ? AND category = ? AND activity_count <= 0
+'''
+
+REBUILD_SOURCE_SQL = '''
+    SELECT activity.start_ms, activity.window_id, activity.process_id,
+           window_titles.title, process_names.name, activity.time_spent_seconds
+    FROM {table} AS activity
+    LEFT JOIN window_titles ON window_titles.id = activity.window_id
+    LEFT JOIN process_names ON process_names.id = activity.process_id
+'''
+
+# Same, with the category stored for each (month, window, process) pair
+REBUILD_LABELLED_SOURCE_SQL = '''
+    SELECT activity.start_ms, activity.window_id, activity.process_id,
+           window_titles.title, process_names.name, activity.time_spent_seconds,
+           category_labels.category, category_labels.is_productive
+    FROM {table} AS activity
+    LEFT JOIN window_titles ON window_titles.id = activity.window_id
+    LEFT JOIN process_names ON process_names.id = activity.process_id
+    LEFT JOIN pair_categories ON pair_categories.month = ?
+        AND pair_categories.window_id = ifnull(activity.window_id, 0)
+        AND pair_categories.process_id = ifnull(activity.process_id, 0)
+    LEFT JOIN category_labels ON category_labels.id = pair_categories.label_id
+'''
+# Source rows fetched, and their unlabelled pairs categorized, at a time
+REBUILD_CHUNK_ROWS = 10000
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Start of the local hour or day containing timestamp"""
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def add_activity(deltas: dict, timestamp: datetime, process_id: Optional[int],
+                 category: str, is_productive: Optional[bool], time_spent: float, sign: int = 1):
+    """
+    Accumulate one activity into deltas, keyed like the rollups primary key
+    sign=-1 takes the activity out again, e.g. from the category it used to have
+    """
+    for granularity in GRANULARITIES:
+        key = (granularity, to_epoch_ms(bucket_start(timestamp, granularity)), process_id or 0, category)
+        delta = deltas.get(key)
+        if delta is None:
+            deltas[key] = [is_productive, sign * (time_spent or 0.0), sign]
+        else:
+            delta[1] += sign * (time_spent or 0.0)
+            delta[2] += sign
+
+def days_of(deltas: dict) -> Set[int]:
+    """Starts of the days whose totals deltas change"""
+    return {key[1] for key in deltas if key[0] == 'day'}
+
+def add_window_activity(deltas: dict, timestamp: datetime, process_id: Optional[int],
+                        window_id: Optional[int], time_spent: float):
+    """Accumulate one activity into daily per-window deltas, keyed like the window_rollups primary key"""
+    key = (to_epoch_ms(bucket_start(timestamp, 'day')), process_id or 0, window_id or 0)
+    delta = deltas.get(key)
+    if delta is None:
+        deltas[key] = [time_spent or 0.0, 1]
+    else:
+        delta[0] += time_spent or 0.0
+        delta[1] += 1
+
+def apply_deltas(conn: sqlite3.Connection, deltas: dict):
+    """Upsert accumulated deltas; runs inside the caller's transaction"""
+    conn.executemany(UPSERT_ROLLUP_SQL, [
+        (granularity, bucket_ms, process_id, category,
+         None if is_productive is None else int(is_productive), time_spent, count)
+        for (granularity, bucket_ms, process_id, category), (is_productive, time_spent, count) in deltas.items()
+    ])
+
+def apply_window_deltas(conn: sqlite3.Connection, deltas: dict):
+    """Upsert accumulated per-window deltas; runs inside the caller's transaction"""
+    conn.executemany(UPSERT_WINDOW_ROLLUP_SQL, [key + tuple(delta) for key, delta in deltas.items()])
+
+def delete_rollups(conn: sqlite3.Connection, start_ms: Optional[int] = None, end_ms: Optional[int] = None):
+    """Delete the hourly, daily and per-window totals of buckets starting in [start_ms, end_ms)"""
+    for table, column in (('rollups', 'bucket_start_ms'), ('window_rollups', 'day_start_ms')):
+        where = []
+        params = []
+        if start_ms is not None:
+            where.append(f'{column} >= ?')
+            params.append(start_ms)
+        if end_ms is not None:
+            where.append(f'{column} < ?')
+            params.append(end_ms)
+        conn.execute(f'DELETE FROM {table}' + (' WHERE ' + ' AND '.join(where) if where else ''), params)
+
+def move_activities(conn: sqlite3.Connection, removed: dict, added: dict):
+    """
+    Move activities between categories; runs inside the caller's transaction
+    removed holds negative deltas for the old categories, added positive ones for the new
+    """
+    apply_deltas(conn, removed)
+    apply_deltas(conn, added)
+    conn.executemany(DELETE_EMPTY_ROLLUP_SQL, list(removed))
+
+def rebuild_rollups(conn: sqlite3.Connection, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                    progress: Optional[Callable[[str], None]] = None, table: str = 'activity',
+                    month: Optional[str] = None, windows: bool = True) -> int:
+    """
+    Recompute the rollups for activities starting in [start_ms, end_ms) from an activity table
+    The range must be day-aligned so every affected bucket is rebuilt whole; the caller commits
+    table names the activity table, e.g. an attached monthly partition. Given the partition's
+    month, the categories stored in pair_categories are used; pairs without one, and tables
+    from before schema v7, are categorized with the current rules. windows=False leaves
+    window_rollups alone, for schemas from before v9 that don't have it
+    Returns the number of activities aggregated
+    """
+    where = []
+    params = []
+    if start_ms is not None:
+        where.append('bucket_start_ms >= ?')
+        params.append(start_ms)
+    if end_ms is not None:
+        where.append('bucket_start_ms < ?')
+        params.append(end_ms)
+    if windows:
+        delete_rollups(conn, start_ms, end_ms)
+    else:
+        conn.execute('DELETE FROM rollups' + (' WHERE ' + ' AND '.join(where) if where else ''), params)
+    
+    query = (REBUILD_SOURCE_SQL if month is None else REBUILD_LABELLED_SOURCE_SQL).format(table=table)
+    if where:
+        query += ' WHERE ' + ' AND '.join(condition.replace('bucket_start_ms', 'activity.start_ms')
+                                          for condition in where)
+    source_params = params if month is None else [month] + params
+    
+    # Categories only depend on the (window, process) pair, which repeats a lot
+    categories = {}
+    compiled = None
+    deltas = {}
+    window_deltas = {}
+    count = 0
+    cursor = conn.execute(query, source_params)
+    while True:
+        rows = cursor.fetchmany(REBUILD_CHUNK_ROWS)
+        if not rows:
+            break
+        # Unlabelled pairs of the chunk are categorized together as columns
+        unlabelled = {(row[1], row[2]): row[3:5] for row in rows
+                      if (len(row) == 6 or row[6] is None) and (row[1], row[2]) not in categories}
+        if unlabelled:
+            if compiled is None:
+                # Unlabelled activities are categorized with the rules next to the catalog
+                catalog_path = next(row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main')
+                compiled = rules.get_database_engine(catalog_path).current()
+            names = list(unlabelled.values())
+            results = compiled.categorize_columns([name[0] for name in names], [name[1] for name in names])
+            for key, (category, _, is_productive) in zip(unlabelled, results):
+                categories[key] = (category, is_productive)
+        
+        for start, window_id, process_id, window, process, time_spent, *stored in rows:
+            if stored and stored[0] is not None:
+                category, is_productive = stored[0], None if stored[1] is None else bool(stored[1])
+            else:
+                category, is_productive = categories[(window_id, process_id)]
+            timestamp = datetime.fromtimestamp(start / 1000)
+            add_activity(deltas, timestamp, process_id, category, is_productive, time_spent)
+            if windows:
+                add_window_activity(window_deltas, timestamp, process_id, window_id, time_spent)
+            count += 1
+            if progress and count % 100000 == 0:
+                progress(f"Aggregated {count} activities")
+    
+    apply_deltas(conn, deltas)
+    if windows:
+        apply_window_deltas(conn, window_deltas)
+    if progress:
+        progress(f"Rebuilt {len(deltas)} rollup rows from {count} activities")
+    return count
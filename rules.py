@@ -0,0 +1,224 @@
+"""
+Categorization rules shared by the tracker, reports, the dashboard and the GUI.
+
+The rules live in a user-editable JSON file, rules.json next to activity.db,
+created from the defaults in categories.py on first use:
+    
+    {"categories": [
+        {"name": "Development", "productive": true, "keywords": ["pycharm", "xcode"]},
+        {"name": "Gaming", "productive": false, "keywords": ["steam"]}
+    ]}
+
+A category matches when one of its keywords appears in the window title or the
+process name, case-insensitively. Categories are tried in file order and keywords
+in list order; the first keyword that matches anywhere wins. Nothing matching
+gives ("Neutral", process name, None).
+
+The engine compiles the file once and checks its mtime at most every few seconds.
+A changed file is recompiled and swapped in as a whole, so callers see either the
+old or the new rules, never a mix. A broken file is logged and the previous rules
+stay in effect.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+from categories import PRODUCTIVE_CATEGORIES, UNPRODUCTIVE_CATEGORIES
+from utils import setup_logging
+
+logger = setup_logging()
+
+RULES_FILENAME = 'rules.json'
+# Next to the default activity.db
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), RULES_FILENAME)
+
+# Seconds between checks of the rules file for changes
+CHECK_INTERVAL = 2.0
+
+def default_rules() -> List[dict]:
+    """The built-in categories from categories.py, productive ones first"""
+    return [
+        {'name': name, 'productive': is_productive, 'keywords': list(keywords)}
+        for categories, is_productive in ((PRODUCTIVE_CATEGORIES, True), (UNPRODUCTIVE_CATEGORIES, False))
+        for name, keywords in categories.items()
+    ]
+
+def _validate(categories) -> List[dict]:
+    """Normalized copy of a category list; raises ValueError on malformed rules"""
+    if not isinstance(categories, list):
+        raise ValueError("'categories' must be a list")
+    normalized = []
+    for index, category in enumerate(categories):
+        if not isinstance(category, dict) or not isinstance(category.get('name'), str):
+            raise ValueError(f"category #{index + 1} needs a 'name'")
+        productive = category.get('productive')
+        if productive is not None and not isinstance(productive, bool):
+            raise ValueError(f"category {category['name']}: 'productive' must be true, false or null")
+        keywords = category.get('keywords', [])
+        if not isinstance(keywords, list) or not all(isinstance(keyword, str) for keyword in keywords):
+            raise ValueError(f"category {category['name']}: 'keywords' must be a list of strings")
+        normalized.append({
+            'name': category['name'],
+            'productive': productive,
+            # An empty keyword would match everything
+            'keywords': [keyword for keyword in keywords if keyword],
+        })
+    return normalized
+
+class CompiledRules:
+    """An immutable, compiled rule set with its own memo of results"""
+    def __init__(self, categories: List[dict]):
+        self.categories = categories
+        # Content hash: equal rules give equal versions in every process
+        canonical = json.dumps(categories, sort_keys=True, separators=(',', ':'))
+        self.version = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:12]
+        
+        keywords = {}
+        for category in categories:
+            for keyword in category['keywords']:
+                keywords.setdefault(keyword.lower(), (len(keywords), (category['name'], keyword, category['productive'])))
+        self._keywords = keywords
+        if keywords:
+            alternation = '|'.join(re.escape(keyword) for keyword in keywords)
+            # The plain alternation finds the leftmost match, or quickly that there is none.
+            # The lookahead reports, at every position, the highest-precedence keyword starting
+            # there, so one scan finds every candidate even when keywords overlap.
+            self._any_keyword = re.compile(alternation)
+            self._every_keyword = re.compile('(?=(' + alternation + '))')
+        else:
+            self._any_keyword = None
+        self.categorize = lru_cache(maxsize=65536)(self._categorize)
+    
+    def _categorize(self, window_title: str, process_name: str) -> Tuple[str, str, Optional[bool]]:
+        if self._any_keyword is not None:
+            # Title and process are scanned together; no keyword contains the separator
+            text = window_title.lower() + '\0' + process_name.lower()
+            first = self._any_keyword.search(text)
+            if first is not None:
+                # Nothing matches before the leftmost match, so only scan from there.
+                # The earliest keyword in the rules wins, wherever it appears.
+                matches = self._every_keyword.findall(text, first.start())
+                return min((self._keywords[keyword] for keyword in matches), key=lambda match: match[0])[1]
+        return ("Neutral", process_name, None)
+    
+    def categorize_columns(self, window_titles: Iterable[Optional[str]],
+                           process_names: Iterable[Optional[str]]) -> List[Tuple[str, str, Optional[bool]]]:
+        """
+        Categorize whole columns of window titles and process names, e.g. a batch of rows
+        Each distinct (window, process) pair is matched once and the result is shared by every
+        row that has it, so the cost scales with distinct pairs rather than rows. None counts
+        as an empty string. Returns one (category, subcategory, is_productive) per row
+        """
+        results = {}
+        column = []
+        for pair in zip(window_titles, process_names):
+            result = results.get(pair)
+            if result is None:
+                result = results[pair] = self.categorize(pair[0] or '', pair[1] or '')
+            column.append(result)
+        return column
+
+class RulesEngine:
+    def __init__(self, path: str = DEFAULT_RULES_PATH, check_interval: float = CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature = None
+        self._next_check = 0.0
+        self._rules = CompiledRules(default_rules())
+        if not os.path.exists(path):
+            self.write_defaults()
+        self.reload()
+    
+    def write_defaults(self) -> bool:
+        """
+        Write the built-in rules to the rules file as a starting point for editing
+        Returns True if successful, False otherwise
+        """
+        try:
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'categories': default_rules()}, f, indent=2)
+            os.replace(tmp_path, self.path)
+            logger.info(f"Wrote default categorization rules to {self.path}")
+            return True
+        except OSError as e:
+            logger.error(f"Error writing default rules: {e}")
+            return False
+    
+    def _file_signature(self):
+        try:
+            stat_result = os.stat(self.path)
+            return stat_result.st_mtime_ns, stat_result.st_size
+        except OSError:
+            return None
+    
+    def reload(self) -> bool:
+        """
+        Recompile the rules file and swap it in
+        Returns True if new rules are in effect, False if the file is missing or invalid
+        """
+        with self._lock:
+            signature = self._file_signature()
+            self._signature = signature
+            self._next_check = time.monotonic() + self.check_interval
+            if signature is None:
+                return False
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    rules = CompiledRules(_validate(json.load(f).get('categories')))
+            except (OSError, ValueError, AttributeError, re.error) as e:
+                logger.error(f"Keeping the previous categorization rules, {self.path} is invalid: {e}")
+                return False
+            if rules.version != self._rules.version:
+                logger.info(f"Loaded categorization rules {rules.version} from {self.path}")
+            # A single assignment, so concurrent readers see the old or the new rules
+            self._rules = rules
+            return True
+    
+    def current(self) -> CompiledRules:
+        """The rules in effect, reloading first if the file changed"""
+        if time.monotonic() >= self._next_check and self._file_signature() != self._signature:
+            self.reload()
+        return self._rules
+    
+    @property
+    def version(self) -> str:
+        return self.current().version
+    
+    def categorize(self, window_title: Optional[str], process_name: Optional[str]) -> Tuple[str, str, Optional[bool]]:
+        """(category, subcategory, is_productive) for one window title and process name"""
+        return self.current().categorize(window_title or '', process_name or '')
+    
+    def describe(self) -> dict:
+        rules = self.current()
+        return {'path': self.path, 'version': rules.version, 'categories': rules.categories}
+
+_engines = {}
+_engine_lock = threading.Lock()
+
+def rules_path(db_path: str) -> str:
+    """The rules file belonging to a database: rules.json in the same directory"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), RULES_FILENAME)
+
+def get_engine(path: Optional[str] = None) -> RulesEngine:
+    """The process-wide engine for a rules file, the default one if path is None"""
+    path = os.path.abspath(path or DEFAULT_RULES_PATH)
+    engine = _engines.get(path)
+    if engine is None:
+        with _engine_lock:
+            engine = _engines.get(path)
+            if engine is None:
+                engine = _engines[path] = RulesEngine(path)
+    return engine
+
+def get_database_engine(db_path: str) -> RulesEngine:
+    """The engine for the rules file next to a database, see rules_path"""
+    return get_engine(rules_path(db_path))
+
+def categorize(window_title: Optional[str], process_name: Optional[str]) -> Tuple[str, str, Optional[bool]]:
+    return get_engine().categorize(window_title, process_name)
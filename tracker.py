@@ -1,30 +1,65 @@
-import time
-import win32gui
-import win32process
-import psutil
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple
 from logger import ActivityLogger
-from rich.console import Console
-from rich.live import Live
-from rich.table import Table
 import sys
-from utils import Cache, setup_logging
+from utils import Cache, ProcessNameCache, setup_logging
+from window_source import WindowSource, Win32WindowSource
+from journal import BackgroundWriter
+from backup import BackupScheduler
+from recategorizer import Recategorizer
 
 logger = setup_logging()
 
+class AdaptivePoller:
+    """
+    Polling interval for sources without focus notifications.
+    Starts fast after a switch and backs off while the window stays the same.
+    """
+    def __init__(self, min_interval: float = 0.25, max_interval: float = 5.0, backoff: float = 1.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+    
+    def next_interval(self, changed: bool) -> float:
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        return self.interval
+
 class TimeTracker:
-    def __init__(self):
-        self.logger = ActivityLogger()
-        self.console = Console()
+    def __init__(self, window_source: Optional[WindowSource] = None,
+                 activity_logger: Optional[ActivityLogger] = None,
+                 capture_mode: str = "auto", idle_timeout: float = 60.0):
+        """
+        capture_mode: "events" waits for focus notifications, "poll" uses the adaptive poller,
+        "auto" picks events when the window source supports them.
+        idle_timeout: longest wait between samples in event mode.
+        """
+        self.window_source = window_source or Win32WindowSource(use_events=capture_mode != "poll")
+        self.logger = activity_logger or ActivityLogger()
+        if capture_mode == "auto":
+            capture_mode = "events" if self.window_source.supports_events else "poll"
+        self.capture_mode = capture_mode
+        self.idle_timeout = idle_timeout
+        self.poller = AdaptivePoller()
         self.previous_window = None
         self.previous_process = None
         self.start_time = None
         self.blocklist = ["keepass.exe", "lastpass.exe"]
-        self.window_cache = Cache()
-        self.process_cache = Cache()
+        # HWND -> pid; titles are always read fresh since they change under the same HWND
+        self.window_cache = Cache(max_size=1000, ttl=10.0, clock=self.window_source.clock)
+        self.process_cache = ProcessNameCache(clock=self.window_source.clock)
         self.batch_size = 10
-        self.pending_logs = []
+        self.flush_interval = 5.0
+        self.writer = None
+        # Seconds between database backups while tracking, None disables them
+        self.backup_interval = 6 * 3600
+        self.backups = None
+        # Seconds between checks for changed categorization rules, None disables re-categorization
+        self.recategorize_interval = 30.0
+        self.recategorizer = None
     
     def get_active_window_info(self) -> Tuple[Optional[str], Optional[str]]:
         """
@@ -32,88 +67,169 @@ class TimeTracker:
         Returns: (window_title, process_name)
         """
         try:
-            window = win32gui.GetForegroundWindow()
-            window_title = win32gui.GetWindowText(window)
+            source = self.window_source
+            window = source.get_foreground_window()
+            if window is None:
+                return None, None
+            window_title = source.get_window_text(window)
             
             # Check cache first
-            cached_info = self.window_cache.get(window)
-            if cached_info:
-                return cached_info
+            pid = self.window_cache.get(window)
+            if pid is None:
+                pid = source.get_window_pid(window)
+                self.window_cache.set(window, pid)
+            process_name = self.process_cache.get(pid, source.get_process_create_time, source.get_process_info, window)
             
             if not window_title:
-                _, pid = win32process.GetWindowThreadProcessId(window)
-                process = psutil.Process(pid)
-                window_title = process.name()
-            else:
-                _, pid = win32process.GetWindowThreadProcessId(window)
-                process = psutil.Process(pid)
-            
-            process_name = process.name()
-            
-            # Cache the result
-            self.window_cache.set(window, (window_title, process_name))
+                window_title = process_name
             return window_title, process_name
         except Exception as e:
             logger.error(f"Error getting window info: {e}")
             return None, None
     
-    def create_status_table(self) -> Table:
+    def cache_stats(self) -> dict:
+        """Hit/miss/eviction counters of the window and process caches"""
+        return {"windows": self.window_cache.stats(), "processes": self.process_cache.stats()}
+    
+    def create_status_table(self):
         """Create a status table for display"""
+        # Rich is only needed for the interactive display, not for daemon mode
+        from rich.table import Table
         table = Table(show_header=True, header_style="bold magenta", box=None)
         table.add_column("Current Window", style="cyan")
         table.add_column("Process", style="green")
         table.add_column("Time Spent", style="yellow")
         return table
     
+    def _start_writer(self):
+        """Start the background writer; it also journals entries so a hard kill loses nothing"""
+        if self.writer is None or not self.writer.running:
+            self.writer = BackgroundWriter(self.logger, batch_size=self.batch_size,
+                                           flush_interval=self.flush_interval)
+    
+    def _start_backups(self):
+        """Back up the database in the background while tracking"""
+        if self.backup_interval is not None and (self.backups is None or not self.backups.running):
+            self.backups = BackupScheduler(self.logger, interval=self.backup_interval)
+            self.backups.start()
+    
+    def _start_recategorizer(self):
+        """Re-categorize stored activities in the background after the rules change"""
+        if self.recategorize_interval is not None and (self.recategorizer is None or not self.recategorizer.running):
+            self.recategorizer = Recategorizer(self.logger, interval=self.recategorize_interval)
+            self.recategorizer.start()
+    
     def _log_pending_activities(self):
-        """Log any pending activities in batch"""
-        if self.pending_logs:
-            self.logger.log_activities_batch(self.pending_logs)
-            self.pending_logs.clear()
+        """Wait for the writer to commit everything queued so far"""
+        if self.writer is not None and self.writer.running:
+            self.writer.flush()
+    
+    def _close_current_activity(self, end_time: float):
+        """Queue the activity that just lost focus"""
+        log_entry = {
+            "timestamp": datetime.fromtimestamp(self.start_time),
+            "window": self.previous_window,
+            "process": self.previous_process,
+            "time_spent_seconds": end_time - self.start_time
+        }
+        
+        # Journaled immediately, written to the database in batches by the writer thread
+        self.writer.submit(log_entry)
+    
+    def _sample(self) -> Tuple[Optional[str], Optional[str], bool]:
+        """
+        Read the focused window once and record a switch if it changed
+        Returns: (window_title, process_name, switched) after privacy filtering
+        """
+        current_title, current_process = self.get_active_window_info()
+        
+        if current_title is None or current_process is None:
+            return None, None, False
+        
+        # Check for privacy mode
+        if current_process.lower() in self.blocklist:
+            current_title = "PRIVATE"
+            current_process = "PRIVATE"
+        
+        if current_title != self.previous_window:
+            now = self.window_source.clock()
+            if self.previous_window is not None:
+                self._close_current_activity(now)
+            
+            self.previous_window = current_title
+            self.previous_process = current_process
+            self.start_time = now
+            return current_title, current_process, True
+        
+        return current_title, current_process, False
+    
+    def _wait(self, switched: bool, timeout: float):
+        """Wait for the next sample: until notified in event mode, adaptively otherwise"""
+        if self.capture_mode == "events":
+            self.window_source.wait_for_change(timeout)
+        else:
+            self.window_source.sleep(min(timeout, self.poller.next_interval(switched)))
+    
+    def _stop(self):
+        """Save the last entry and flush everything still pending"""
+        if self.previous_window is not None:
+            self._close_current_activity(self.window_source.clock())
+            self.previous_window = None
+        if self.writer is not None:
+            self.writer.close()
+        if self.backups is not None:
+            self.backups.stop()
+        if self.recategorizer is not None:
+            self.recategorizer.stop()
+    
+    def run(self, max_samples: Optional[int] = None, on_sample: Optional[Callable[[], None]] = None) -> int:
+        """
+        Track without any display until the window source is exhausted
+        or max_samples samples were taken. on_sample is called after every sample.
+        Returns the number of samples.
+        """
+        source = self.window_source
+        self._start_writer()
+        self._start_backups()
+        self._start_recategorizer()
+        self.start_time = source.clock()
+        samples = 0
+        
+        try:
+            while not source.exhausted and (max_samples is None or samples < max_samples):
+                _, _, switched = self._sample()
+                samples += 1
+                if on_sample is not None:
+                    on_sample()
+                self._wait(switched, self.idle_timeout)
+        finally:
+            self._stop()
+            source.close()
+        return samples
     
     def start_tracking(self):
         """Start tracking time with improved error handling and batching"""
-        self.start_time = time.time()
+        from rich.console import Console
+        from rich.live import Live
+        
+        source = self.window_source
+        self._start_writer()
+        self._start_backups()
+        self._start_recategorizer()
+        self.start_time = source.clock()
         
         try:
             with Live(self.create_status_table(), refresh_per_second=1, vertical_overflow="visible") as live:
                 while True:
-                    current_title, current_process = self.get_active_window_info()
+                    current_title, current_process, switched = self._sample()
                     
-                    if current_title is None or current_process is None:
-                        time.sleep(1)
+                    if current_title is None:
+                        self._wait(False, 1)
                         continue
                     
-                    # Check for privacy mode
-                    if current_process.lower() in self.blocklist:
-                        current_title = "PRIVATE"
-                        current_process = "PRIVATE"
-                    
-                    if current_title != self.previous_window:
-                        if self.previous_window is not None:
-                            end_time = time.time()
-                            time_spent = end_time - self.start_time
-                            
-                            log_entry = {
-                                "timestamp": datetime.fromtimestamp(self.start_time),
-                                "window": self.previous_window,
-                                "process": self.previous_process,
-                                "time_spent_seconds": time_spent
-                            }
-                            
-                            self.pending_logs.append(log_entry)
-                            
-                            # Log in batches to improve performance
-                            if len(self.pending_logs) >= self.batch_size:
-                                self._log_pending_activities()
-                        
-                        self.previous_window = current_title
-                        self.previous_process = current_process
-                        self.start_time = time.time()
-                    
                     # Update the display
                     table = self.create_status_table()
-                    current_time_spent = time.time() - self.start_time
+                    current_time_spent = source.clock() - self.start_time
                     table.add_row(
                         current_title[:50],  # Limit title length
                         current_process,
@@ -121,26 +237,16 @@ class TimeTracker:
                     )
                     live.update(table)
                     
-                    time.sleep(1)
+                    # Wake at least once a second to refresh the elapsed time
+                    self._wait(switched, 1)
         except KeyboardInterrupt:
             # Save the last entry when stopping
-            if self.previous_window is not None:
-                end_time = time.time()
-                time_spent = end_time - self.start_time
-                
-                log_entry = {
-                    "timestamp": datetime.fromtimestamp(self.start_time),
-                    "window": self.previous_window,
-                    "process": self.previous_process,
-                    "time_spent_seconds": time_spent
-                }
-                
-                self.pending_logs.append(log_entry)
-                self._log_pending_activities()
+            self._stop()
+            source.close()
             
-            self.console.print("\n[green]Tracking stopped. Data saved.[/green]")
+            Console().print("\n[green]Tracking stopped. Data saved.[/green]")
             sys.exit(0)
         except Exception as e:
             logger.error(f"Unexpected error in tracking: {e}")
             self._log_pending_activities()
-            raise 
\ No newline at end of file
+            raise
\ No newline at end of file
@@ -1,7 +1,10 @@
 import logging
 import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-import shutil
 
 logger = logging.getLogger(__name__)
 
@@ -13,36 +16,39 @@ def setup_logging():
     )
     return logging.getLogger(__name__)
 
-def backup_database(db_path: str, keep_days: int = 7) -> bool:
+def copy_database_online(db_path: str, target_path: str, pages: int = 256, step_pause: float = 0.0):
     """
-    Create a backup of the database with timestamp and clean up old backups
-    Returns True if successful, False otherwise
+    Copy a live database with SQLite's online backup API in steps of `pages` pages
+    The copy comes from a single read snapshot, so it is consistent and writers to
+    a WAL database never wait on it. Writes to a temporary file renamed on success.
+    Raises sqlite3.Error or OSError on failure
     """
+    tmp_path = target_path + '.tmp'
+    source = sqlite3.connect(db_path, timeout=10.0)
+    target = sqlite3.connect(tmp_path)
     try:
-        # Create backups directory if it doesn't exist
-        backup_dir = os.path.join(os.path.dirname(db_path), 'backups')
-        os.makedirs(backup_dir, exist_ok=True)
+        # Pin one read snapshot for the whole copy; commits from other connections
+        # would otherwise restart the backup between steps
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
         
-        # Generate backup filename with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_filename = f'activity_backup_{timestamp}.db'
-        backup_path = os.path.join(backup_dir, backup_filename)
-        
-        # Create the backup
-        shutil.copy2(db_path, backup_path)
-        logger.info(f"Created backup: {backup_filename}")
-        
-        # Clean up old backups
-        cleanup_old_backups(backup_dir, keep_days)
-        
-        return True
-    except Exception as e:
-        logger.error(f"Error creating backup: {e}")
-        return False
+        def pause(status, remaining, total):
+            if step_pause:
+                time.sleep(step_pause)
+        source.backup(target, pages=pages, progress=pause)
+        source.rollback()
+    except Exception:
+        target.close()
+        os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(tmp_path, target_path)
 
 def cleanup_old_backups(backup_dir: str, keep_days: int):
     """
-    Remove backups older than keep_days
+    Remove full-copy backups (activity_backup_*.db) older than keep_days
     """
     try:
         now = datetime.now()
@@ -68,19 +74,107 @@ def cleanup_old_backups(backup_dir: str, keep_days: int):
         logger.error(f"Error cleaning up old backups: {e}")
 
 class Cache:
-    """Simple cache implementation for window and process information"""
-    def __init__(self, max_size=1000):
-        self.cache = {}
+    """
+    Thread-safe LRU cache with an optional time-to-live per entry.
+    Keeps hit/miss/eviction/expiration counters for diagnostics.
+    """
+    def __init__(self, max_size=1000, ttl=None, clock=time.monotonic):
+        self.cache = OrderedDict()
         self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
     
-    def get(self, key):
-        return self.cache.get(key)
+    def get(self, key, default=None):
+        with self._lock:
+            item = self.cache.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= self._clock():
+                del self.cache[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return value
     
     def set(self, key, value):
-        if len(self.cache) >= self.max_size:
-            # Remove oldest item
-            self.cache.pop(next(iter(self.cache)))
-        self.cache[key] = value
+        expires_at = None if self.ttl is None else self._clock() + self.ttl
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+            elif len(self.cache) >= self.max_size:
+                # Remove least recently used item
+                self.cache.popitem(last=False)
+                self.evictions += 1
+            self.cache[key] = (value, expires_at)
+    
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self.cache.pop(key, None)
+            return default if item is None else item[0]
+    
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+    
+    def __len__(self):
+        return len(self.cache)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self.cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+class ProcessNameCache:
+    """
+    Process names keyed by (pid, create_time), so a reused pid never returns the old name.
+    A pid can only be reused after its process, and with it the process's windows, is gone.
+    So while the same window and pid stay in focus the last name is returned without any
+    process query; create_time is read again when either changes, and at least every
+    `recheck_interval` seconds.
+    """
+    def __init__(self, max_size=512, recheck_interval=5.0, clock=time.monotonic):
+        self.names = Cache(max_size)
+        self.recheck_interval = recheck_interval
+        self._clock = clock
+        # ((pid, window), name, time create_time was last read)
+        self._last = None
+        self.unchecked = 0
+    
+    def get(self, pid, create_time_of, lookup, window=None):
+        """
+        Return the name for pid, calling create_time_of(pid) -> create_time only when the pid or
+        window changed or the last check is too old, and lookup(pid) -> (create_time, name)
+        only when that (pid, create_time) isn't cached yet
+        """
+        now = self._clock()
+        last = self._last
+        if last is not None and last[0] == (pid, window) and now - last[2] < self.recheck_interval:
+            self.unchecked += 1
+            return last[1]
+        name = self.names.get((pid, create_time_of(pid)))
+        if name is None:
+            create_time, name = lookup(pid)
+            self.names.set((pid, create_time), name)
+        self._last = ((pid, window), name, now)
+        return name
     
     def clear(self):
-        self.cache.clear() 
\ No newline at end of file
+        self.names.clear()
+        self._last = None
+    
+    def stats(self) -> dict:
+        return {"names": self.names.stats(), "unchecked": self.unchecked}
@@ -1,36 +1,106 @@
 import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from typing import List, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple, Optional
 import os
+import time
 from logger import ActivityLogger
-from categories import categorize_activity
+from report_cache import DEFAULT_MAX_BYTES, ReportCache
+from report_engine import ReportEngine, ReportTotals
+
+# Most points drawn per time series; a year of hourly totals is downsampled to this
+DEFAULT_MAX_POINTS = 2000
+
+# Batches with fewer reports to render than this are rendered without a process pool
+PARALLEL_MIN_REPORTS = 4
+
+DAY_MS = 86400000
+
+def local_datetimes(epoch_ms: np.ndarray) -> np.ndarray:
+    """
+    Local wall-clock datetime64[ns] for integer epoch milliseconds, the same as datetime.fromtimestamp
+    The UTC offset is looked up once per day, and per value only on days where it changes (DST)
+    """
+    def offset_ms(ms) -> int:
+        return time.localtime(int(ms) // 1000).tm_gmtoff * 1000
+    
+    days, day_index = np.unique(epoch_ms // DAY_MS, return_inverse=True)
+    day_start = np.array([offset_ms(day * DAY_MS) for day in days], dtype=np.int64)
+    day_end = np.array([offset_ms((day + 1) * DAY_MS - 1) for day in days], dtype=np.int64)
+    offsets = day_start[day_index]
+    changing = (day_start != day_end)[day_index]
+    offsets[changing] = [offset_ms(ms) for ms in epoch_ms[changing]]
+    return (epoch_ms + offsets).astype('datetime64[ms]').astype('datetime64[ns]')
+
+def lttb(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Indices of at most max_points points picked by Largest-Triangle-Three-Buckets
+    The first and last points are kept. The points in between are split into max_points - 2
+    buckets, and each bucket keeps the point that forms the largest triangle with the point
+    kept from the previous bucket and the average of the next bucket, so peaks survive
+    """
+    count = len(x)
+    if max_points >= count or max_points < 3:
+        return np.arange(count)
+    edges = np.linspace(1, count - 1, max_points - 1).astype(np.int64)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        # Twice the triangle areas; the factor doesn't change which one is largest
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        keep[bucket + 1] = previous
+    return keep
 
 class DataVisualizer:
-    def __init__(self):
+    def __init__(self, offline: bool = False, max_points: int = DEFAULT_MAX_POINTS,
+                 max_cache_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        offline: inline plotly.js into each report instead of loading it from the CDN
+        max_points: most points per time series, see lttb
+        max_cache_bytes: size limit of the reports directory, see ReportCache
+        """
         self.logger = ActivityLogger()
+        self.engine = ReportEngine(self.logger.db_path)
+        self.offline = offline
+        self.max_points = max_points
         self.output_dir = "reports"
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
+        self.cache = ReportCache(self.output_dir, max_cache_bytes)
     
-    def _prepare_data(self, activities: List[Tuple]) -> pd.DataFrame:
-        """Convert activities to a pandas DataFrame for easier analysis"""
-        data = []
-        for _, timestamp, window, process, time_spent in activities:
-            category, subcategory, is_productive = categorize_activity(window, process)
-            data.append({
-                'timestamp': datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S"),
-                'window': window,
-                'process': process,
-                'time_spent': time_spent,
-                'category': category,
-                'subcategory': subcategory,
-                'is_productive': is_productive
-            })
-        return pd.DataFrame(data)
+    @staticmethod
+    def _prepare_totals_data(totals: ReportTotals) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Merged report totals as one row per category and one row per hour
+        Columns are built straight from the totals with their final dtypes: category is categorical,
+        and the hour starts are converted to local datetimes in one vectorized step
+        """
+        labels = list(totals.categories)
+        categories = pd.DataFrame({
+            'category': pd.Categorical([category for category, _ in labels]),
+            'is_productive': pd.Series([is_productive for _, is_productive in labels], dtype=object),
+            'time_spent': np.fromiter(totals.categories.values(), dtype=np.float64, count=len(labels)),
+        })
+        bucket_ms = np.fromiter(totals.hours.keys(), dtype=np.int64, count=len(totals.hours))
+        seconds = np.fromiter(totals.hours.values(), dtype=np.float64, count=len(totals.hours))
+        order = np.argsort(bucket_ms, kind='stable')
+        hours = pd.DataFrame({
+            'timestamp': pd.to_datetime(local_datetimes(bucket_ms[order])),
+            'time_spent': seconds[order],
+        })
+        return categories, hours
     
-    def _create_productivity_pie(self, df: pd.DataFrame, title: str) -> go.Figure:
+    @staticmethod
+    def _create_productivity_pie(df: pd.DataFrame, title: str) -> go.Figure:
         """Create a pie chart showing productivity distribution"""
         productive_time = df[df['is_productive'] == True]['time_spent'].sum()
         unproductive_time = df[df['is_productive'] == False]['time_spent'].sum()
@@ -49,9 +119,10 @@ class DataVisualizer:
         
         return fig
     
-    def _create_category_bar(self, df: pd.DataFrame, title: str) -> go.Figure:
+    @staticmethod
+    def _create_category_bar(df: pd.DataFrame, title: str) -> go.Figure:
         """Create a bar chart showing time by category"""
-        category_time = df.groupby('category')['time_spent'].sum().reset_index()
+        category_time = df.groupby('category', observed=True)['time_spent'].sum().reset_index()
         category_time['hours'] = category_time['time_spent'] / 3600
         
         fig = go.Figure(data=[go.Bar(
@@ -70,13 +141,19 @@ class DataVisualizer:
         
         return fig
     
-    def _create_time_series(self, df: pd.DataFrame, title: str) -> go.Figure:
+    @staticmethod
+    def _create_time_series(df: pd.DataFrame, title: str, max_points: int = DEFAULT_MAX_POINTS) -> go.Figure:
         """Create a time series plot showing activity over time"""
-        # Resample to hourly data
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        hourly_data = df.set_index('timestamp').resample('H')['time_spent'].sum().reset_index()
+        # Resample to hourly data; the timestamp column is already datetime64
+        hourly_data = df.set_index('timestamp').resample('h')['time_spent'].sum().reset_index()
         hourly_data['hours'] = hourly_data['time_spent'] / 3600
         
+        # Long ranges would embed thousands of hours; keep the shape within the point budget
+        if len(hourly_data) > max_points:
+            keep = lttb(hourly_data['timestamp'].to_numpy().astype(np.int64).astype(np.float64),
+                        hourly_data['hours'].to_numpy(dtype=np.float64), max_points)
+            hourly_data = hourly_data.iloc[keep]
+        
         fig = go.Figure(data=[go.Scatter(
             x=hourly_data['timestamp'],
             y=hourly_data['hours'],
@@ -92,60 +169,137 @@ class DataVisualizer:
         
         return fig
     
-    def generate_report(self, start_date: Optional[datetime] = None, 
-                       end_date: Optional[datetime] = None,
-                       report_name: Optional[str] = None) -> str:
-        """Generate a complete HTML report with multiple visualizations"""
-        activities = self.logger.get_activities(start_date, end_date)
-        if not activities:
-            return "No data available for the selected time period"
-        
-        df = self._prepare_data(activities)
-        
+    @staticmethod
+    def _write_report(report_path: str, categories: pd.DataFrame, hours: pd.DataFrame,
+                      start_date: Optional[datetime], end_date: Optional[datetime],
+                      offline: bool, max_points: int):
+        """Render the charts for one period and write them to report_path; also runs in batch workers"""
         # Create figures
-        productivity_fig = self._create_productivity_pie(df, "Productivity Distribution")
-        category_fig = self._create_category_bar(df, "Time by Category")
-        time_series_fig = self._create_time_series(df, "Activity Over Time")
+        productivity_fig = DataVisualizer._create_productivity_pie(categories, "Productivity Distribution")
+        category_fig = DataVisualizer._create_category_bar(categories, "Time by Category")
+        time_series_fig = DataVisualizer._create_time_series(hours, "Activity Over Time", max_points)
         
-        # Generate HTML report
-        if not report_name:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            report_name = f"report_{timestamp}.html"
-        
-        report_path = os.path.join(self.output_dir, report_name)
-        
-        with open(report_path, 'w') as f:
-            f.write('<html><head><title>Time Tracking Report</title></head><body>')
+        # Written under a temporary name, so a cached report is never seen half-written
+        tmp_path = f'{report_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('<html><head><meta charset="utf-8"><title>Time Tracking Report</title></head><body>')
             f.write('<h1>Time Tracking Report</h1>')
             
             if start_date and end_date:
                 f.write(f'<p>Period: {start_date.date()} to {end_date.date()}</p>')
             
-            # Add productivity pie chart
-            f.write('<h2>Productivity Distribution</h2>')
-            f.write(productivity_fig.to_html(full_html=False, include_plotlyjs='cdn'))
-            
-            # Add category bar chart
-            f.write('<h2>Time by Category</h2>')
-            f.write(category_fig.to_html(full_html=False, include_plotlyjs='cdn'))
-            
-            # Add time series
-            f.write('<h2>Activity Over Time</h2>')
-            f.write(time_series_fig.to_html(full_html=False, include_plotlyjs='cdn'))
+            # plotly.js goes in once, with the first chart: inlined for offline reports, else from the CDN
+            include_plotlyjs = True if offline else 'cdn'
+            for heading, fig in (("Productivity Distribution", productivity_fig),
+                                 ("Time by Category", category_fig),
+                                 ("Activity Over Time", time_series_fig)):
+                f.write(f'<h2>{heading}</h2>')
+                f.write(fig.to_html(full_html=False, include_plotlyjs=include_plotlyjs))
+                include_plotlyjs = False
             
             f.write('</body></html>')
+        os.replace(tmp_path, report_path)
+    
+    def _cache_key(self, start_date: Optional[datetime], end_date: Optional[datetime], watermark: str) -> str:
+        return self.cache.key(start=start_date, end=end_date, rules=self.logger.rules.version,
+                              watermark=watermark, offline=self.offline, max_points=self.max_points)
+    
+    def generate_report(self, start_date: Optional[datetime] = None, 
+                       end_date: Optional[datetime] = None,
+                       report_name: Optional[str] = None) -> str:
+        """
+        Generate a complete HTML report with multiple visualizations
+        Without a report_name the report is cached: while no activity of the range was stored,
+        re-categorized or deleted and the rules are unchanged, the same range returns the same file
+        """
+        if not report_name:
+            # Read before aggregating, so data stored meanwhile invalidates this report
+            cache_key = self._cache_key(start_date, end_date, self.logger.get_range_watermark(start_date, end_date))
+            cached_path = self.cache.get(cache_key)
+            if cached_path:
+                return cached_path
+        
+        # The charts only need totals per category and per hour, read from the rollups
+        totals = self.engine.aggregate(start_date, end_date)
+        if not totals:
+            return "No data available for the selected time period"
         
+        categories, hours = self._prepare_totals_data(totals)
+        
+        # Generate HTML report
+        report_path = os.path.join(self.output_dir, report_name) if report_name else self.cache.path(cache_key)
+        self._write_report(report_path, categories, hours, start_date, end_date, self.offline, self.max_points)
+        
+        self.cache.evict(keep=[report_path])
         return report_path
     
+    def generate_batch_reports(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                               per: str = 'day', workers: Optional[int] = None) -> Optional[str]:
+        """
+        Generate a report for every day or week from start_date to end_date and an index page linking them
+        The range is read once and split into periods in memory. Reports found in the cache are reused,
+        the others are rendered in parallel worker processes, all cores by default
+        Returns the path of the index page, None if there is no data
+        """
+        # Read before aggregating, like in generate_report
+        generations = self.logger.get_day_generations(start_date, end_date)
+        periods = self.engine.aggregate_periods(start_date, end_date, per)
+        if not any(totals for _, _, totals in periods):
+            return None
+        
+        entries = []
+        jobs = []
+        for period_start, period_end, totals in periods:
+            # Same inclusive end as _get_time_range, so a day shares its cache entry with generate_daily_report
+            last_moment = period_end - timedelta(microseconds=1)
+            report_path = None
+            if totals:
+                watermark = self.logger.get_range_watermark(period_start, last_moment, generations)
+                cache_key = self._cache_key(period_start, last_moment, watermark)
+                report_path = self.cache.get(cache_key)
+                if report_path is None:
+                    report_path = self.cache.path(cache_key)
+                    categories, hours = self._prepare_totals_data(totals)
+                    jobs.append((report_path, categories, hours, period_start, last_moment,
+                                 self.offline, self.max_points))
+            entries.append((period_start, last_moment, report_path))
+        
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        if workers <= 1 or len(jobs) < PARALLEL_MIN_REPORTS:
+            for job in jobs:
+                _write_report_job(job)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_write_report_job, jobs))
+        
+        first_day, last_day = entries[0][0].date(), entries[-1][1].date()
+        index_path = os.path.join(self.output_dir, f"index_{first_day:%Y%m%d}_{last_day:%Y%m%d}_{per}.html")
+        with open(index_path, 'w', encoding='utf-8') as f:
+            f.write('<html><head><meta charset="utf-8"><title>Time Tracking Reports</title></head><body>')
+            f.write('<h1>Time Tracking Reports</h1>')
+            f.write(f'<p>Period: {first_day} to {last_day}, one report per {per}</p><ul>')
+            for period_start, period_end, report_path in entries:
+                label = str(period_start.date())
+                if period_end.date() != period_start.date():
+                    label += f' to {period_end.date()}'
+                if report_path:
+                    f.write(f'<li><a href="{os.path.basename(report_path)}">{label}</a></li>')
+                else:
+                    f.write(f'<li>{label}: no activity</li>')
+            f.write('</ul></body></html>')
+        
+        self.cache.evict(keep=[index_path] + [report_path for _, _, report_path in entries if report_path])
+        return index_path
+    
     def generate_daily_report(self) -> str:
         """Generate a report for today"""
         start_date, end_date = self._get_time_range()
-        return self.generate_report(start_date, end_date, "daily_report.html")
+        return self.generate_report(start_date, end_date)
     
     def generate_weekly_report(self) -> str:
         """Generate a report for the past week"""
         start_date, end_date = self._get_time_range(days=7)
-        return self.generate_report(start_date, end_date, "weekly_report.html")
+        return self.generate_report(start_date, end_date)
     
     def _get_time_range(self, days: int = 0) -> Tuple[datetime, datetime]:
         """Get start and end dates for a time range"""
@@ -153,4 +307,8 @@ class DataVisualizer:
         start_date = end_date - timedelta(days=days)
         start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
         end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-        return start_date, end_date 
\ No newline at end of file
+        return start_date, end_date 
+
+def _write_report_job(job: Tuple) -> None:
+    """Process pool entry point for DataVisualizer._write_report"""
+    DataVisualizer._write_report(*job)
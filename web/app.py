@@ -3,17 +3,19 @@ from datetime import datetime, timedelta
 import os
 import sys
 import json
+import threading
 import pandas as pd
 import logging
-import sqlite3
 
 # Add the parent directory to the path so we can import our modules
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_dir)
 
 from utils import cleanup_old_backups
+from backup_store import BackupStore
 from visualizer import DataVisualizer
 from logger import ActivityLogger
+import appnames
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -25,102 +27,42 @@ logger.debug(f"Using database at: {DB_PATH}")
 
 app = Flask(__name__)
 
-def prepare_dataframe(activities):
-    """Convert activities to a pandas DataFrame with proper column names"""
+_activity_logger = None
+
+# Progress of the retention cleanup started from /api/cleanup-data
+_cleanup_status = {'running': False}
+_cleanup_lock = threading.Lock()
+
+def get_activity_logger():
+    """Shared ActivityLogger so requests reuse its pooled connections"""
+    global _activity_logger
+    if _activity_logger is None:
+        _activity_logger = ActivityLogger(db_path=DB_PATH)
+    return _activity_logger
+
+@app.teardown_appcontext
+def release_connection(exception=None):
+    # The dev server runs every request on a new thread; give its connection back to the pool
+    if _activity_logger is not None:
+        _activity_logger.release_connection()
+
+def prepare_dataframe(rollups):
+    """Convert rollup rows to a pandas DataFrame with a productivity label per row"""
     try:
-        logger.debug(f"Preparing dataframe from activities: {activities}")
-        if not activities:
-            logger.debug("No activities found, returning empty dataframe")
-            return pd.DataFrame(columns=['id', 'timestamp', 'window', 'process', 'time_spent_seconds'])
-        
-        # Convert activities to DataFrame
-        df = pd.DataFrame(activities, columns=['id', 'timestamp', 'window', 'process', 'time_spent_seconds'])
+        logger.debug(f"Preparing dataframe from {len(rollups)} rollup rows")
+        df = pd.DataFrame(rollups, columns=['timestamp', 'process', 'category', 'is_productive', 'time_spent_seconds'])
         
         # Convert timestamp to datetime
         df['timestamp'] = pd.to_datetime(df['timestamp'])
         
-        # Ensure time_spent_seconds is numeric
-        df['time_spent_seconds'] = pd.to_numeric(df['time_spent_seconds'], errors='coerce')
-        
-        # Fill any NaN values with 0
-        df['time_spent_seconds'] = df['time_spent_seconds'].fillna(0)
+        # Dashboard labels for the productivity flag of each category
+        df['productivity'] = df['is_productive'].map({True: 'Productive', False: 'Unproductive'}).fillna('Other')
         
         logger.debug(f"DataFrame created with {len(df)} rows")
-        logger.debug(f"DataFrame columns: {df.columns}")
-        logger.debug(f"Sample data: {df.head()}")
         return df
     except Exception as e:
         logger.error(f"Error preparing dataframe: {e}")
-        return pd.DataFrame(columns=['id', 'timestamp', 'window', 'process', 'time_spent_seconds'])
-
-def categorize_activity(window_name):
-    """Categorize activity based on window name"""
-    window_name = str(window_name).lower()
-    if any(keyword in window_name for keyword in ['code', 'dev', 'visual studio', 'intellij', 'pycharm', 'vscode']):
-        return 'Productive'
-    elif any(keyword in window_name for keyword in ['game', 'steam', 'epic', 'discord', 'youtube', 'netflix']):
-        return 'Unproductive'
-    else:
-        return 'Other'
-
-def simplify_process_name(process_name):
-    """Simplify process names for display"""
-    # Convert to lowercase for consistent processing
-    name = process_name.lower()
-    
-    # Remove common file extensions
-    name = name.replace('.exe', '')
-    name = name.replace('.app', '')
-    name = name.replace('.dmg', '')
-    
-    # Remove common browser suffixes
-    name = name.replace(' - google chrome', '')
-    name = name.replace(' - chrome', '')
-    name = name.replace(' - firefox', '')
-    name = name.replace(' - microsoft edge', '')
-    name = name.replace(' - brave', '')
-    name = name.replace(' - opera', '')
-    
-    # Remove common prefixes
-    name = name.replace('microsoft ', '')
-    name = name.replace('google ', '')
-    name = name.replace('mozilla ', '')
-    
-    # Remove other common suffixes
-    name = name.replace(' premium', '')
-    name = name.replace(' pro', '')
-    name = name.replace(' - cursor', '')
-    name = name.replace(' dashboard', '')
-    name = name.replace(' web', '')
-    name = name.replace(' app', '')
-    
-    # Special cases for common applications
-    if 'chrome' in name:
-        name = 'Chrome'
-    elif 'firefox' in name:
-        name = 'Firefox'
-    elif 'edge' in name:
-        name = 'Edge'
-    elif 'spotify' in name:
-        name = 'Spotify'
-    elif 'discord' in name:
-        name = 'Discord'
-    elif 'vscode' in name or 'visual studio code' in name:
-        name = 'VS Code'
-    elif 'explorer' in name:
-        name = 'File Explorer'
-    elif 'powershell' in name:
-        name = 'PowerShell'
-    elif 'cmd' in name or 'command' in name:
-        name = 'Command Prompt'
-    else:
-        # For other apps, just capitalize each word
-        name = ' '.join(word.capitalize() for word in name.split())
-        
-        # Remove any remaining parentheses and their contents
-        name = ' '.join(part.split('(')[0].strip() for part in name.split(')')).strip()
-    
-    return name
+        return pd.DataFrame(columns=['timestamp', 'process', 'category', 'is_productive', 'time_spent_seconds', 'productivity'])
 
 @app.route('/')
 def dashboard():
@@ -140,32 +82,20 @@ def get_today_activities():
                 'timeSeries': {'timestamps': ['No Data'], 'values': [1]}
             })
         
-        # Check database contents
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM activity')
-        total_records = cursor.fetchone()[0]
-        logger.debug(f"Total records in database: {total_records}")
-        
-        cursor.execute('SELECT * FROM activity ORDER BY timestamp DESC LIMIT 5')
-        recent_records = cursor.fetchall()
-        logger.debug(f"Recent records: {recent_records}")
-        conn.close()
+        activity_logger = get_activity_logger()
         
-        # Create ActivityLogger with the correct database path
-        activity_logger = ActivityLogger(db_path=DB_PATH)
+        # Check database contents
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Total records in database: {activity_logger.count_activities()}")
+            logger.debug(f"Recent records: {activity_logger.get_activities(limit=5)}")
         
         # Get today's data
         today = datetime.now().date()
         start_date = datetime.combine(today, datetime.min.time())
         end_date = datetime.combine(today, datetime.max.time())
         
-        logger.debug(f"Fetching activities between {start_date} and {end_date}")
-        activities = activity_logger.get_activities(start_date, end_date)
-        logger.debug(f"Retrieved {len(activities)} activities")
-        logger.debug(f"Activities data: {activities}")
-        
-        df = prepare_dataframe(activities)
+        logger.debug(f"Fetching hourly rollups between {start_date} and {end_date}")
+        df = prepare_dataframe(activity_logger.get_rollups(start_date, end_date, 'hour'))
         
         if df.empty:
             logger.debug("No data found for today")
@@ -175,17 +105,14 @@ def get_today_activities():
                 'timeSeries': {'timestamps': ['No Data'], 'values': [1]}
             })
         
-        # Add category column
-        df['category'] = df['window'].apply(categorize_activity)
-        
         # Generate productivity data
         logger.debug("Generating productivity data")
         productivity_data = {
             'labels': ['Productive', 'Unproductive', 'Other'],
             'values': [
-                df[df['category'] == 'Productive']['time_spent_seconds'].sum() / 3600,
-                df[df['category'] == 'Unproductive']['time_spent_seconds'].sum() / 3600,
-                df[df['category'] == 'Other']['time_spent_seconds'].sum() / 3600
+                df[df['productivity'] == 'Productive']['time_spent_seconds'].sum() / 3600,
+                df[df['productivity'] == 'Unproductive']['time_spent_seconds'].sum() / 3600,
+                df[df['productivity'] == 'Other']['time_spent_seconds'].sum() / 3600
             ]
         }
         logger.debug(f"Productivity data: {productivity_data}")
@@ -237,8 +164,7 @@ def get_week_activities():
                 'timeSeries': {'timestamps': ['No Data'], 'values': [1]}
             })
         
-        # Create ActivityLogger with the correct database path
-        activity_logger = ActivityLogger(db_path=DB_PATH)
+        activity_logger = get_activity_logger()
         
         # Get this week's data
         today = datetime.now()
@@ -246,11 +172,8 @@ def get_week_activities():
         start_date = datetime.combine(start_date.date(), datetime.min.time())
         end_date = datetime.combine(today.date(), datetime.max.time())
         
-        logger.debug(f"Fetching activities between {start_date} and {end_date}")
-        activities = activity_logger.get_activities(start_date, end_date)
-        logger.debug(f"Retrieved {len(activities)} activities")
-        
-        df = prepare_dataframe(activities)
+        logger.debug(f"Fetching daily rollups between {start_date} and {end_date}")
+        df = prepare_dataframe(activity_logger.get_rollups(start_date, end_date, 'day'))
         
         if df.empty:
             logger.debug("No data found for this week")
@@ -260,17 +183,14 @@ def get_week_activities():
                 'timeSeries': {'timestamps': ['No Data'], 'values': [1]}
             })
         
-        # Add category column
-        df['category'] = df['window'].apply(categorize_activity)
-        
         # Generate productivity data
         logger.debug("Generating productivity data")
         productivity_data = {
             'labels': ['Productive', 'Unproductive', 'Other'],
             'values': [
-                df[df['category'] == 'Productive']['time_spent_seconds'].sum() / 3600,
-                df[df['category'] == 'Unproductive']['time_spent_seconds'].sum() / 3600,
-                df[df['category'] == 'Other']['time_spent_seconds'].sum() / 3600
+                df[df['productivity'] == 'Productive']['time_spent_seconds'].sum() / 3600,
+                df[df['productivity'] == 'Unproductive']['time_spent_seconds'].sum() / 3600,
+                df[df['productivity'] == 'Other']['time_spent_seconds'].sum() / 3600
             ]
         }
         logger.debug(f"Productivity data: {productivity_data}")
@@ -321,8 +241,7 @@ def get_activities_range():
         
         logger.debug(f"Fetching activities between {start_date} and {end_date}")
         
-        # Create ActivityLogger with the correct database path
-        activity_logger = ActivityLogger(db_path=DB_PATH)
+        activity_logger = get_activity_logger()
         
         # Convert string dates to datetime objects
         start_date = datetime.strptime(start_date, '%Y-%m-%d')
@@ -332,10 +251,7 @@ def get_activities_range():
         start_date = datetime.combine(start_date, datetime.min.time())
         end_date = datetime.combine(end_date, datetime.max.time())
         
-        activities = activity_logger.get_activities(start_date, end_date)
-        logger.debug(f"Retrieved {len(activities)} activities")
-
-        df = prepare_dataframe(activities)
+        df = prepare_dataframe(activity_logger.get_rollups(start_date, end_date, 'day'))
         
         if df.empty:
             return jsonify({
@@ -346,18 +262,16 @@ def get_activities_range():
                 'categories': {'categories': ['No Data'], 'values': [1]},
                 'timeSeries': {'timestamps': ['No Data'], 'values': [1]}
             })
-
-        # Add category column
-        df['category'] = df['window'].apply(categorize_activity)
         
-        # Simplify process names for the category chart
-        df['simplified_process'] = df['process'].apply(simplify_process_name)
+        # Display names for the category chart, once per distinct process
+        names = {name: appnames.normalize_process(name) for name in df['process'].dropna().unique()}
+        df['simplified_process'] = df['process'].map(names)
         
         # Calculate total times
         total_time = df['time_spent_seconds'].sum() / 3600
-        productive_time = df[df['category'] == 'Productive']['time_spent_seconds'].sum() / 3600
-        unproductive_time = df[df['category'] == 'Unproductive']['time_spent_seconds'].sum() / 3600
-        other_time = df[df['category'] == 'Other']['time_spent_seconds'].sum() / 3600
+        productive_time = df[df['productivity'] == 'Productive']['time_spent_seconds'].sum() / 3600
+        unproductive_time = df[df['productivity'] == 'Unproductive']['time_spent_seconds'].sum() / 3600
+        other_time = df[df['productivity'] == 'Other']['time_spent_seconds'].sum() / 3600
         
         # Generate productivity data
         productivity_data = {
@@ -375,7 +289,7 @@ def get_activities_range():
         
         # Generate time series data (daily totals)
         time_series_data = df.groupby(df['timestamp'].dt.date)['time_spent_seconds'].sum().reset_index()
-
+        
         return jsonify({
             'totalTime': round(total_time, 2),
             'productiveTime': round(productive_time, 2),
@@ -408,15 +322,21 @@ def cleanup_backups():
         # Get the number of days to keep from the request
         data = request.get_json()
         keep_days = data.get('keep_days', 7)
+        keep_last = data.get('keep_last', 5)
         
-        # Get the backup directory path
-        backup_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backups')
+        # Snapshots in the backup store; the newest keep_last survive regardless of age
+        store = BackupStore.for_database(DB_PATH)
+        deleted = store.prune(keep_last=keep_last, keep_days=keep_days)
         
-        # Clean up old backups
-        cleanup_old_backups(backup_dir, keep_days)
+        # Full copies written before the backup store existed
+        backup_dir = os.path.join(os.path.dirname(DB_PATH), 'backups')
+        if os.path.isdir(backup_dir):
+            cleanup_old_backups(backup_dir, keep_days)
         
         return jsonify({
             'success': True,
+            'deleted_snapshots': deleted,
+            'store': store.stats(),
             'message': f'Successfully cleaned up backups older than {keep_days} days'
         })
     except Exception as e:
@@ -425,5 +345,43 @@ def cleanup_backups():
             'message': f'Error cleaning up backups: {str(e)}'
         }), 500
 
+def _run_cleanup(keep_days):
+    def update(status):
+        _cleanup_status.update(status)
+    try:
+        success = get_activity_logger().cleanup_old_data(keep_days, progress=update)
+        _cleanup_status.update({'success': success})
+    finally:
+        _cleanup_status['running'] = False
+
+@app.route('/api/cleanup-data', methods=['POST'])
+def cleanup_data():
+    """Start deleting activities older than keep_days in the background"""
+    data = request.get_json() or {}
+    keep_days = int(data.get('keep_days', 30))
+    with _cleanup_lock:
+        if _cleanup_status.get('running'):
+            return jsonify({'success': False, 'message': 'A cleanup is already running', 'status': _cleanup_status}), 409
+        _cleanup_status.clear()
+        _cleanup_status.update({'running': True, 'keep_days': keep_days, 'phase': 'starting'})
+        threading.Thread(target=_run_cleanup, args=(keep_days,), name='retention-cleanup', daemon=True).start()
+    return jsonify({'success': True, 'message': f'Cleaning up activities older than {keep_days} days'}), 202
+
+@app.route('/api/cleanup-data', methods=['GET'])
+def cleanup_data_status():
+    """Progress and throughput of the running or last cleanup"""
+    return jsonify(_cleanup_status)
+
+@app.route('/api/rules', methods=['GET'])
+def get_rules():
+    """The categorization rules in effect, the same ones the CLI reports and the GUI use"""
+    try:
+        description = get_activity_logger().rules.describe()
+        description['rollupsCurrent'] = get_activity_logger().rollups_match_rules()
+        return jsonify(description)
+    except Exception as e:
+        logger.error(f"Error reading rules: {e}")
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,357 @@
+import json
+import random
+import threading
+import time
+from collections import namedtuple
+from typing import Iterable, Iterator, Optional, Tuple
+from utils import setup_logging
+
+logger = setup_logging()
+
+# One focus change in a recorded or synthetic trace: the window keeps focus for `duration` seconds
+FocusEvent = namedtuple("FocusEvent", ["window", "title", "pid", "process", "duration"])
+
+class WindowSource:
+    """
+    Interface between TimeTracker and whatever reports the focused window.
+    Backends also own the clock so a replayed trace can run on virtual time.
+    """
+    exhausted = False
+    # True when wait_for_change is driven by real focus notifications
+    supports_events = False
+
+    def get_foreground_window(self):
+        """Return an opaque handle for the focused window, or None"""
+        raise NotImplementedError
+
+    def get_window_text(self, window) -> str:
+        raise NotImplementedError
+
+    def get_window_pid(self, window) -> int:
+        raise NotImplementedError
+
+    def get_process_name(self, pid: int) -> str:
+        raise NotImplementedError
+
+    def get_process_create_time(self, pid: int) -> float:
+        """Start time of the process; a pid that is reused gets a new one"""
+        return 0.0
+
+    def get_process_info(self, pid: int) -> Tuple[float, str]:
+        """Return (create_time, name) so callers can tell a reused pid apart"""
+        return self.get_process_create_time(pid), self.get_process_name(pid)
+
+    def clock(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def wait_for_change(self, timeout: float) -> bool:
+        """
+        Block until the focused window (or its title) may have changed, or timeout elapses.
+        Returns True if a change was signalled. Sources without notifications just sleep.
+        """
+        self.sleep(timeout)
+        return False
+
+    def close(self):
+        pass
+
+# WinEvent constants from winuser.h
+EVENT_SYSTEM_FOREGROUND = 0x0003
+EVENT_OBJECT_NAMECHANGE = 0x800C
+WINEVENT_OUTOFCONTEXT = 0x0000
+WINEVENT_SKIPOWNPROCESS = 0x0002
+OBJID_WINDOW = 0
+WM_QUIT = 0x0012
+
+class Win32WindowSource(WindowSource):
+    """
+    Live source backed by the Win32 API.
+    With use_events, a hook thread listens for foreground and title changes
+    so the tracker can sleep until something actually happens.
+    """
+    def __init__(self, use_events: bool = True):
+        # Imported here so the tracker can be driven by other sources off Windows
+        import win32gui
+        import win32process
+        import psutil
+        self._win32gui = win32gui
+        self._win32process = win32process
+        self._psutil = psutil
+        self._changed = threading.Event()
+        self._hook_thread = None
+        self._hook_thread_id = None
+        if use_events:
+            self._start_event_hook()
+
+    def _start_event_hook(self):
+        ready = threading.Event()
+        self._hook_thread = threading.Thread(target=self._run_event_hook, args=(ready,),
+                                             name="win-event-hook", daemon=True)
+        self._hook_thread.start()
+        ready.wait(5)
+
+    def _run_event_hook(self, ready: threading.Event):
+        """Install WinEvent hooks and pump messages so their callbacks fire"""
+        import ctypes
+        from ctypes import wintypes
+        user32 = ctypes.windll.user32
+        kernel32 = ctypes.windll.kernel32
+
+        WinEventProc = ctypes.WINFUNCTYPE(
+            None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+            wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+        user32.SetWinEventHook.restype = wintypes.HANDLE
+
+        def callback(hook, event, hwnd, id_object, id_child, thread, event_time):
+            if event == EVENT_SYSTEM_FOREGROUND:
+                self._changed.set()
+            elif id_object == OBJID_WINDOW and hwnd == user32.GetForegroundWindow():
+                # Title change of the focused window, e.g. switching browser tabs
+                self._changed.set()
+
+        # Keep a reference so the callback isn't garbage collected while hooked
+        self._callback = WinEventProc(callback)
+        flags = WINEVENT_OUTOFCONTEXT | WINEVENT_SKIPOWNPROCESS
+        hooks = [
+            user32.SetWinEventHook(event, event, 0, self._callback, 0, 0, flags)
+            for event in (EVENT_SYSTEM_FOREGROUND, EVENT_OBJECT_NAMECHANGE)
+        ]
+        if not all(hooks):
+            logger.warning("SetWinEventHook failed, falling back to polling")
+            for hook in hooks:
+                if hook:
+                    user32.UnhookWinEvent(hook)
+            ready.set()
+            return
+
+        self._hook_thread_id = kernel32.GetCurrentThreadId()
+        self.supports_events = True
+        ready.set()
+
+        msg = wintypes.MSG()
+        try:
+            while user32.GetMessageW(ctypes.byref(msg), 0, 0, 0) > 0:
+                user32.TranslateMessage(ctypes.byref(msg))
+                user32.DispatchMessageW(ctypes.byref(msg))
+        finally:
+            for hook in hooks:
+                user32.UnhookWinEvent(hook)
+            self.supports_events = False
+
+    def wait_for_change(self, timeout: float) -> bool:
+        if not self.supports_events:
+            return super().wait_for_change(timeout)
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+    def close(self):
+        if self._hook_thread_id is not None:
+            import ctypes
+            ctypes.windll.user32.PostThreadMessageW(self._hook_thread_id, WM_QUIT, 0, 0)
+            self._hook_thread.join(1)
+            self._hook_thread_id = None
+
+    def get_foreground_window(self):
+        return self._win32gui.GetForegroundWindow()
+
+    def get_window_text(self, window) -> str:
+        return self._win32gui.GetWindowText(window)
+
+    def get_window_pid(self, window) -> int:
+        _, pid = self._win32process.GetWindowThreadProcessId(window)
+        return pid
+
+    def get_process_name(self, pid: int) -> str:
+        return self._psutil.Process(pid).name()
+
+    def get_process_create_time(self, pid: int) -> float:
+        # Far cheaper than the name, which needs the executable path
+        return self._psutil.Process(pid).create_time()
+
+    def get_process_info(self, pid: int) -> Tuple[float, str]:
+        process = self._psutil.Process(pid)
+        with process.oneshot():
+            return process.create_time(), process.name()
+
+class ReplayWindowSource(WindowSource):
+    """
+    Replays a sequence of FocusEvents on a virtual clock.
+    sleep() advances the clock instantly, so a trace runs as fast as the tracker can consume it.
+    The trace knows exactly when focus changes, so it also acts as an event source.
+    """
+    supports_events = True
+
+    def __init__(self, events: Iterable[FocusEvent], start_time: Optional[float] = None):
+        self._events = iter(events)
+        self._now = time.time() if start_time is None else start_time
+        self._current = None
+        self._current_end = self._now
+        self._titles = {}
+        self._pids = {}
+        self._process_names = {}
+        self.exhausted = False
+        self._advance()
+
+    @classmethod
+    def from_file(cls, path: str, start_time: Optional[float] = None) -> "ReplayWindowSource":
+        """Replay a trace written by write_trace"""
+        return cls(read_trace(path), start_time)
+
+    def _advance(self):
+        """Move to the event that has focus at the current virtual time"""
+        while self._current_end <= self._now:
+            try:
+                event = FocusEvent(*next(self._events))
+            except StopIteration:
+                self._current = None
+                self.exhausted = True
+                return
+            self._current = event
+            self._current_end += event.duration
+            self._titles[event.window] = event.title
+            self._pids[event.window] = event.pid
+            self._process_names[event.pid] = event.process
+
+    def get_foreground_window(self):
+        return self._current.window if self._current else None
+
+    def get_window_text(self, window) -> str:
+        return self._titles.get(window, "")
+
+    def get_window_pid(self, window) -> int:
+        return self._pids[window]
+
+    def get_process_name(self, pid: int) -> str:
+        return self._process_names[pid]
+
+    def clock(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float):
+        self._now += seconds
+        self._advance()
+
+    def wait_for_change(self, timeout: float) -> bool:
+        if self._current is not None and self._current_end <= self._now + timeout:
+            # Jump straight to the next focus change
+            self._now = self._current_end
+            self._advance()
+            return True
+        self.sleep(timeout)
+        return False
+
+class RecordingWindowSource(WindowSource):
+    """Wraps another source and writes every observed focus change to a trace file"""
+    def __init__(self, source: WindowSource, path: str):
+        self.source = source
+        self._file = open(path, "a", encoding="utf-8")
+        self._last = None
+        self._last_change = source.clock()
+
+    @property
+    def exhausted(self):
+        return self.source.exhausted
+
+    @property
+    def supports_events(self):
+        return self.source.supports_events
+
+    def get_foreground_window(self):
+        return self.source.get_foreground_window()
+
+    def get_window_text(self, window) -> str:
+        title = self.source.get_window_text(window)
+        pid = self.source.get_window_pid(window)
+        self._observe(FocusEvent(window, title, pid, self.source.get_process_name(pid), 0.0))
+        return title
+
+    def get_window_pid(self, window) -> int:
+        return self.source.get_window_pid(window)
+
+    def get_process_name(self, pid: int) -> str:
+        return self.source.get_process_name(pid)
+
+    def get_process_create_time(self, pid: int) -> float:
+        return self.source.get_process_create_time(pid)
+
+    def get_process_info(self, pid: int) -> Tuple[float, str]:
+        return self.source.get_process_info(pid)
+
+    def clock(self) -> float:
+        return self.source.clock()
+
+    def sleep(self, seconds: float):
+        self.source.sleep(seconds)
+
+    def wait_for_change(self, timeout: float) -> bool:
+        return self.source.wait_for_change(timeout)
+
+    def _observe(self, event: FocusEvent):
+        if self._last is not None and event[:4] == self._last[:4]:
+            return
+        now = self.source.clock()
+        if self._last is not None:
+            self._write(self._last._replace(duration=now - self._last_change))
+        self._last = event
+        self._last_change = now
+
+    def _write(self, event: FocusEvent):
+        self._file.write(json.dumps(event._asdict()) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._last is not None:
+            self._write(self._last._replace(duration=self.source.clock() - self._last_change))
+            self._last = None
+        self._file.close()
+        self.source.close()
+
+def read_trace(path: str) -> Iterator[FocusEvent]:
+    """Stream FocusEvents from a JSON-lines trace file"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield FocusEvent(**json.loads(line))
+
+def write_trace(events: Iterable[FocusEvent], path: str) -> int:
+    """Write FocusEvents to a JSON-lines trace file, returns the number written"""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(FocusEvent(*event)._asdict()) + "\n")
+            count += 1
+    return count
+
+SYNTHETIC_APPS = [
+    ("chrome.exe", ["GitHub - Google Chrome", "YouTube - Google Chrome", "Inbox - Gmail - Google Chrome"]),
+    ("Code.exe", ["tracker.py - WhereDidMyTimeGo - Visual Studio Code", "logger.py - WhereDidMyTimeGo - Visual Studio Code"]),
+    ("slack.exe", ["Slack - general", "Slack - random"]),
+    ("explorer.exe", ["File Explorer", ""]),
+    ("Spotify.exe", ["Spotify Premium"]),
+    ("Discord.exe", ["Discord"]),
+]
+
+def synthetic_events(count: int, windows: int = 50, mean_dwell: float = 30.0,
+                     min_dwell: float = 1.0, seed: int = 0) -> Iterator[FocusEvent]:
+    """
+    Generate `count` random focus changes over a fixed pool of windows.
+    Deterministic for a given seed; consecutive events never repeat the same window.
+    """
+    rng = random.Random(seed)
+    pool = []
+    for i in range(windows):
+        process, titles = SYNTHETIC_APPS[i % len(SYNTHETIC_APPS)]
+        title = titles[(i // len(SYNTHETIC_APPS)) % len(titles)]
+        pool.append((1000 + i, title, 4000 + i % len(SYNTHETIC_APPS), process))
+
+    previous = None
+    for _ in range(count):
+        window = rng.choice(pool)
+        while window is previous and windows > 1:
+            window = rng.choice(pool)
+        previous = window
+        yield FocusEvent(*window, max(min_dwell, rng.expovariate(1.0 / mean_dwell)))